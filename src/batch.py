@@ -0,0 +1,241 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+
+from dotenv import load_dotenv
+
+from search import (
+    RetrievalEngine, RETRIEVAL_WORKERS, limpar_texto, embed_perguntas, preparar_prompt_hibrido
+)
+from db import POOL_MAX_CONN
+from telemetria import span
+from perfilamento import Perfilador, PROFILE_DIR, envolver
+
+load_dotenv()
+
+# Chamadas simultâneas ao LLM durante o lote
+BATCH_LLM_CONCURRENCY = int(os.getenv("BATCH_LLM_CONCURRENCY", "8"))
+
+"""
+MODO LOTE:
+
+Responde um arquivo de perguntas (JSONL ou texto, uma por linha) e grava as
+respostas com tempos em JSONL, na ordem de entrada.
+
+  - Todas as perguntas são convertidas em embeddings em uma única chamada
+  - A recuperação roda em paralelo sobre o pool de conexões compartilhado
+  - As chamadas ao LLM rodam em paralelo, limitadas por --concorrencia
+
+Com --profile as perguntas rodam uma de cada vez, cada uma com seu perfil
+(cProfile + tracemalloc, ver src/perfilamento.py): o paralelismo embaralharia
+a atribuição de CPU e memória entre perguntas.
+
+Entrada JSONL: {"id": "q1", "pergunta": "...", "modelo": "gemini", "colecoes": ["relatorios"]}
+(id, modelo e colecoes opcionais; sem colecoes vale --colecao)
+
+Execução: python src/batch.py perguntas.jsonl --saida respostas.jsonl
+"""
+
+
+def carregar_perguntas(caminho):
+    """Lê as perguntas de um arquivo JSONL ou texto simples"""
+    perguntas = []
+    with open(caminho, encoding="utf-8") as arquivo:
+        for numero, linha in enumerate(arquivo, 1):
+            linha = linha.strip()
+            if not linha:
+                continue
+            if caminho.endswith(".jsonl"):
+                dados = json.loads(linha)
+                texto = dados.get("pergunta") or dados.get("question")
+                if not texto:
+                    print(f"⚠️ Linha {numero} sem 'pergunta': ignorada")
+                    continue
+                perguntas.append({
+                    "id": dados.get("id", numero),
+                    "pergunta": texto,
+                    "modelo": dados.get("modelo"),
+                    "colecoes": dados.get("colecoes", dados.get("colecao")),
+                })
+            else:
+                perguntas.append({"id": numero, "pergunta": linha, "modelo": None, "colecoes": None})
+    return perguntas
+
+def percentil(valores, p):
+    """Percentil p (0-100) por posição mais próxima"""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+class EscritorOrdenado:
+    """Grava os resultados na ordem de entrada assim que o prefixo fica completo"""
+
+    def __init__(self, saida):
+        self.saida = saida
+        self.pendentes = {}
+        self.proximo = 0
+
+    def adicionar(self, indice, registro):
+        self.pendentes[indice] = registro
+        while self.proximo in self.pendentes:
+            registro = self.pendentes.pop(self.proximo)
+            self.saida.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            self.proximo += 1
+        self.saida.flush()
+
+
+async def responder(item, embedding, engine, llm_handler, limite_recuperacao, limite_llm):
+    """Recuperação (thread) e geração (ainvoke) de uma pergunta, com tempos"""
+    with span("pergunta", modo="lote"):
+        return await _responder(item, embedding, engine, llm_handler, limite_recuperacao, limite_llm)
+
+async def _responder(item, embedding, engine, llm_handler, limite_recuperacao, limite_llm):
+    inicio = time.perf_counter()
+    registro = {"id": item["id"], "pergunta": item["pergunta"]}
+    modelo = llm_handler.modelo_primario(item["modelo"])
+    registro["modelo"] = modelo
+    try:
+        async with limite_recuperacao:
+            resposta, prompt, cache = await asyncio.to_thread(
+                envolver(preparar_prompt_hibrido), item["pergunta"], llm_handler, engine, modelo, embedding,
+                item.get("colecoes")
+            )
+        recuperacao = time.perf_counter() - inicio
+        espera = llm = 0.0
+
+        if resposta is None:
+            inicio_espera = time.perf_counter()
+            async with limite_llm:
+                espera = time.perf_counter() - inicio_espera
+                inicio_llm = time.perf_counter()
+                resposta = await llm_handler.ainvoke(prompt, model=modelo)
+                llm = time.perf_counter() - inicio_llm
+            if resposta:
+                query_embedding, escopo = cache
+                engine.registrar_cache_semantico(item["pergunta"], query_embedding, resposta, escopo)
+
+        registro["resposta"] = resposta
+        if not resposta:
+            registro["erro"] = "Falha na geração de resposta"
+        registro["tempos"] = {
+            "recuperacao": round(recuperacao, 4),
+            "espera_llm": round(espera, 4),
+            "llm": round(llm, 4),
+            "total": round(time.perf_counter() - inicio, 4),
+        }
+    except Exception as e:
+        registro["resposta"] = None
+        registro["erro"] = str(e)
+    return registro
+
+async def executar_lote(perguntas, engine, llm_handler, saida, concorrencia=BATCH_LLM_CONCURRENCY,
+                        perfilador=None):
+    """Responde todas as perguntas e retorna os registros gravados
+
+    Com `perfilador`, responde em sequência, perfilando cada pergunta.
+    """
+    inicio = time.perf_counter()
+    textos = [limpar_texto(item["pergunta"]) for item in perguntas]
+    for item, texto in zip(perguntas, textos):
+        item["pergunta"] = texto
+
+    # Uma única chamada de embeddings para o lote inteiro
+    embeddings = await asyncio.to_thread(embed_perguntas, engine.embeddings, textos)
+    tempo_embeddings = time.perf_counter() - inicio
+    print(f"🔢 {len(textos)} embeddings em {tempo_embeddings:.2f}s")
+
+    # Backend memmap sem banco: a recuperação é limitada pelas threads do motor
+    limite_recuperacao = asyncio.Semaphore(
+        engine.pool.max_conn if engine.pool is not None else RETRIEVAL_WORKERS
+    )
+    limite_llm = asyncio.Semaphore(concorrencia)
+    escritor = EscritorOrdenado(saida)
+    registros = []
+
+    async def tarefa(indice, item, embedding):
+        registro = await responder(item, embedding, engine, llm_handler,
+                                   limite_recuperacao, limite_llm)
+        escritor.adicionar(indice, registro)
+        registros.append(registro)
+        if len(registros) % 50 == 0:
+            print(f"   {len(registros)}/{len(perguntas)} respondidas")
+
+    if perfilador is not None:
+        for indice, (item, embedding) in enumerate(zip(perguntas, embeddings)):
+            with perfilador.pergunta(item["pergunta"]):
+                await tarefa(indice, item, embedding)
+    else:
+        await asyncio.gather(*[
+            tarefa(indice, item, embedding)
+            for indice, (item, embedding) in enumerate(zip(perguntas, embeddings))
+        ])
+
+    total = time.perf_counter() - inicio
+    resumir(registros, total, tempo_embeddings)
+    return registros
+
+def resumir(registros, total, tempo_embeddings):
+    """Resumo do lote: vazão e percentis por fase"""
+    erros = sum(1 for registro in registros if registro.get("erro"))
+    print(f"\n✅ {len(registros)} perguntas em {total:.2f}s "
+          f"({len(registros) / total if total else 0:.1f}/s), {erros} erros")
+    print(f"   Embeddings (lote): {tempo_embeddings:.2f}s")
+    for fase in ("recuperacao", "espera_llm", "llm", "total"):
+        valores = [r["tempos"][fase] for r in registros if "tempos" in r]
+        print(f"   {fase:<12} p50 {percentil(valores, 50):.3f}s | "
+              f"p95 {percentil(valores, 95):.3f}s | p99 {percentil(valores, 99):.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Responde um arquivo de perguntas em lote")
+    parser.add_argument("entrada", help="Arquivo .jsonl ou texto (uma pergunta por linha)")
+    parser.add_argument("--saida", help="Arquivo JSONL de saída (padrão: <entrada>.respostas.jsonl)")
+    parser.add_argument("--modelo", help="Modelo para perguntas sem 'modelo' próprio")
+    parser.add_argument("--concorrencia", type=int, default=BATCH_LLM_CONCURRENCY,
+                        help="Chamadas simultâneas ao LLM")
+    parser.add_argument("--colecao", help="Coleções das perguntas sem 'colecoes' próprias, separadas por vírgula")
+    parser.add_argument("--conexoes", type=int, default=POOL_MAX_CONN,
+                        help="Tamanho do pool de conexões (recuperações simultâneas)")
+    parser.add_argument("--sem-cache", action="store_true",
+                        help="Ignora os caches de respostas e semântico (regressão)")
+    parser.add_argument("--profile", nargs="?", const=PROFILE_DIR, metavar="DIR",
+                        help=f"Perfila cada pergunta (cProfile + tracemalloc) em DIR (padrão: {PROFILE_DIR})")
+    args = parser.parse_args()
+
+    perguntas = carregar_perguntas(args.entrada)
+    if not perguntas:
+        print("❌ Nenhuma pergunta encontrada")
+        return
+    for item in perguntas:
+        item["modelo"] = item["modelo"] or args.modelo
+
+    engine = RetrievalEngine(max_conn=args.conexoes, colecoes=args.colecao)
+    if not engine.is_available():
+        print("❌ Embeddings não configurados")
+        return
+    llm_handler = engine.get_llm_handler()
+    if not llm_handler.is_available():
+        print("❌ Nenhum modelo LLM disponível")
+        return
+    if args.sem_cache:
+        llm_handler.response_cache = None
+        engine.cache_semantico = None
+
+    perfilador = Perfilador(args.profile) if args.profile else None
+    caminho_saida = args.saida or os.path.splitext(args.entrada)[0] + ".respostas.jsonl"
+    try:
+        with open(caminho_saida, "w", encoding="utf-8") as saida:
+            asyncio.run(executar_lote(perguntas, engine, llm_handler, saida, args.concorrencia, perfilador))
+        print(f"💾 Respostas gravadas em {caminho_saida}")
+        if perfilador is not None:
+            for linha in perfilador.resumo():
+                print(linha)
+    finally:
+        engine.close()
+
+if __name__ == "__main__":
+    main()
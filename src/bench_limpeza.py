@@ -0,0 +1,97 @@
+import time
+import random
+import argparse
+import unicodedata
+
+from search import limpar_texto
+from dados_sinteticos import gerar_linha
+
+"""
+MICRO-BENCHMARK DA NORMALIZAÇÃO DE TEXTO:
+
+Compara o custo de CPU por pergunta do caminho antigo (limpar_texto com dois
+passes por caractere, aplicado à pergunta, a cada chunk recuperado e de novo
+ao contexto concatenado) com o atual (texto limpo na ingestão; só a pergunta
+passa pela limpeza, com tabela de tradução e atalho ASCII).
+
+Execução: python src/bench_limpeza.py --chunks 40 --repeticoes 200
+"""
+
+PERGUNTA = "Quais são as 5 empresas com maior faturamento fundadas após 1990?"
+
+
+def limpar_texto_legado(texto):
+    """Implementação anterior, mantida apenas para comparação"""
+    if not texto:
+        return ""
+    if isinstance(texto, bytes):
+        texto = texto.decode('utf-8', errors='replace')
+    texto_limpo = ''.join(c for c in texto if unicodedata.category(c) != 'Cs')
+    texto_limpo = unicodedata.normalize('NFC', texto_limpo)
+    return ''.join(c for c in texto_limpo
+                   if unicodedata.category(c)[0] != 'C' or c in '\n\r\t ')
+
+def gerar_chunk(aleatorio, tamanho=1000):
+    """Chunk sintético no formato da tabela do PDF (nome, faturamento, ano)"""
+    linhas, total = [], 0
+    while total < tamanho:
+        linha = gerar_linha(aleatorio)[3]
+        linhas.append(linha)
+        total += len(linha) + 1
+    return "\n".join(linhas)
+
+def medir(funcao, repeticoes):
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        funcao()
+    return (time.perf_counter() - inicio) / repeticoes
+
+def verificar_equivalencia(aleatorio):
+    """A nova implementação deve produzir exatamente o mesmo texto"""
+    amostras = [
+        PERGUNTA,
+        "texto\x00com\x07controle\ttab\r\nlinha",
+        "acentos decompostos: Sau\u0301de Educac\u0327a\u0303o",
+        "surrogate \ud800, zero-width\u200b e soft\u00adhyphen",
+        gerar_chunk(aleatorio),
+    ]
+    for amostra in amostras:
+        if limpar_texto(amostra) != limpar_texto_legado(amostra):
+            raise AssertionError(f"Resultado diferente para {amostra!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark de limpar_texto")
+    parser.add_argument("--chunks", type=int, default=40, help="Chunks recuperados por pergunta")
+    parser.add_argument("--tamanho", type=int, default=1000, help="Caracteres por chunk")
+    parser.add_argument("--repeticoes", type=int, default=200)
+    args = parser.parse_args()
+
+    aleatorio = random.Random(42)
+    verificar_equivalencia(aleatorio)
+    chunks = [gerar_chunk(aleatorio, args.tamanho) for _ in range(args.chunks)]
+    contexto = "\n\n".join(chunks)
+
+    def requisicao_legada():
+        limpar_texto_legado(PERGUNTA)
+        limpos = [limpar_texto_legado(chunk) for chunk in chunks]
+        limpar_texto_legado("\n\n".join(limpos))
+
+    def requisicao_atual():
+        limpar_texto(PERGUNTA)
+
+    legado = medir(requisicao_legada, args.repeticoes)
+    atual = medir(requisicao_atual, args.repeticoes)
+    contexto_legado = medir(lambda: limpar_texto_legado(contexto), args.repeticoes)
+    contexto_atual = medir(lambda: limpar_texto(contexto), args.repeticoes)
+
+    print(f"📏 {args.chunks} chunks de ~{args.tamanho} caracteres ({len(contexto):,} no contexto)")
+    print(f"   Contexto inteiro, implementação antiga: {contexto_legado * 1e3:8.3f} ms")
+    print(f"   Contexto inteiro, implementação nova:   {contexto_atual * 1e3:8.3f} ms "
+          f"({contexto_legado / contexto_atual:.1f}x)")
+    print(f"   Por pergunta, caminho antigo:           {legado * 1e3:8.3f} ms")
+    print(f"   Por pergunta, caminho atual:            {atual * 1e3:8.3f} ms")
+    print(f"✅ CPU economizada por pergunta: {(legado - atual) * 1e3:.3f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,500 @@
+import io
+import os
+import json
+import time
+import random
+import argparse
+import contextlib
+from datetime import datetime
+
+import psycopg2
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+import search
+from search import (
+    RetrievalEngine, get_embeddings, extrair_termos_busca, construir_contexto,
+    search_prompt, search_prompt_hibrido, KEY_VALUE, LEXICAL_TOP_K, RRF_K
+)
+from ingest import (
+    CHUNK_SIZE, CHUNK_OVERLAP, EMBEDDING_BATCH_SIZE, EMBEDDING_CONCURRENCY, MetricasIngestao,
+    LeitorFluxo, dividir_em_chunks, filtrar_novos, carregar_existentes, em_lotes,
+    gerar_embeddings, gerar_copy
+)
+from db import (
+    PERFIS_BUSCA, SEARCH_RECALL_PROFILE, VECTOR_INDEX_TYPE, HNSW_M, HNSW_EF_CONSTRUCTION,
+    IVFFLAT_LISTS, LEXICAL_TRIGRAM, garantir_tabelas, garantir_indices_lexicais, obter_colecao,
+    garantir_indice_vetorial, detectar_dimensao, nome_indice_vetorial, parametros_busca,
+    remover_indices_vetoriais, ARMAZENAMENTOS, VECTOR_STORAGE,
+    garantir_particao, particoes, nome_indice_particao
+)
+from contexto import (
+    CONTEXT_TOKEN_BUDGET, CONTEXT_MMR_ENABLED, CONTEXT_COMPRESSION_ENABLED, contar_tokens
+)
+from batch import carregar_perguntas, percentil
+from dados_sinteticos import gerar_linha
+from perfilamento import Perfilador, PROFILE_DIR
+
+load_dotenv()
+
+BENCHMARK_TABLE = os.getenv("BENCHMARK_TABLE", "benchmark_embedding")
+BENCHMARK_COLECAO = "benchmark"
+FONTE_SINTETICA = "corpus-sintetico"
+CABECALHO = "Nome da empresa Faturamento Ano de fundação"
+
+"""
+BENCHMARK PONTA A PONTA:
+
+Ingere um corpus sintético (tabela de empresas no formato do PDF) com o
+tamanho desejado e repete um conjunto de perguntas por search_prompt e
+search_prompt_hibrido, medindo:
+
+  - p50/p95/p99 por fase: embedding, SQL vetorial, SQL lexical (fts e LIKE),
+    SQL híbrido, montagem do contexto, geração e total
+  - recall@k do índice ANN contra a busca exata, por perfil de busca
+  - tokens do prompt enviado ao LLM
+
+O resultado vai para um JSON, para comparar KEY_VALUE, parâmetros do índice
+(HNSW_M, HNSW_EF_CONSTRUCTION, IVFFLAT_LISTS) e a estratégia lexical entre execuções.
+Os caches de embeddings, respostas e semântico ficam desligados.
+
+Use um banco dedicado (BENCHMARK_DATABASE_URL): o corpus vai para a tabela
+BENCHMARK_TABLE, mas a coleção 'benchmark' é registrada no banco.
+
+Com --profile [DIR], cada pergunta de cada repetição também é perfilada
+(cProfile + tracemalloc, ver src/perfilamento.py); o perfil infla os tempos,
+então compare só execuções com o mesmo modo.
+
+Execução: python src/benchmark.py --chunks 5000 --perguntas 30 --saida resultado.json
+"""
+
+
+class MedidorLLM:
+    """Repassa tudo ao LLMHandler, cronometrando invoke (fase de geração)"""
+
+    def __init__(self, llm_handler):
+        self.llm_handler = llm_handler
+        self.tempo = None
+        self.prompt = None
+
+    def __getattr__(self, nome):
+        return getattr(self.llm_handler, nome)
+
+    def invoke(self, prompt, model=None):
+        self.prompt = prompt
+        inicio = time.perf_counter()
+        try:
+            return self.llm_handler.invoke(prompt, model=model)
+        finally:
+            self.tempo = time.perf_counter() - inicio
+
+
+def cronometrar(funcao, *args, **kwargs):
+    inicio = time.perf_counter()
+    resultado = funcao(*args, **kwargs)
+    return resultado, time.perf_counter() - inicio
+
+def estatisticas(valores, escala=1000.0):
+    """Média e percentis (em ms por padrão) de uma lista de medições"""
+    if not valores:
+        return {"n": 0}
+    return {
+        "n": len(valores),
+        "media": round(sum(valores) / len(valores) * escala, 3),
+        "p50": round(percentil(valores, 50) * escala, 3),
+        "p95": round(percentil(valores, 95) * escala, 3),
+        "p99": round(percentil(valores, 99) * escala, 3),
+        "max": round(max(valores) * escala, 3),
+    }
+
+
+def gerar_paginas(aleatorio, total, linhas, metricas):
+    """Páginas sintéticas de ~CHUNK_SIZE caracteres (uma página ≈ um chunk)"""
+    for numero in range(total):
+        textos, tamanho = [CABECALHO], len(CABECALHO)
+        while tamanho < CHUNK_SIZE - 60:
+            linha = gerar_linha(aleatorio)
+            linhas.append(linha)
+            textos.append(linha[3])
+            tamanho += len(linha[3]) + 1
+        metricas.paginas += 1
+        yield Document(page_content="\n".join(textos), metadata={"page": numero})
+
+def gerar_perguntas(aleatorio, linhas, quantidade):
+    """Perguntas sobre empresas do corpus, com algumas comparativas"""
+    modelos = [
+        "Qual o faturamento da {nome}?",
+        "Em que ano foi fundada a {nome}?",
+        "Qual o faturamento e o ano de fundação da {nome}?",
+        "Quais empresas do setor de {setor} aparecem no documento?",
+    ]
+    comparativas = [
+        "Qual a empresa de maior faturamento?",
+        "Quais são as 5 empresas com menor faturamento?",
+        "Qual a empresa mais antiga do ranking?",
+    ]
+    perguntas = []
+    for indice in range(quantidade):
+        if indice % 5 == 4:
+            texto = comparativas[(indice // 5) % len(comparativas)]
+        else:
+            nome = aleatorio.choice(linhas)[0]
+            texto = modelos[indice % len(modelos)].format(nome=nome, setor=nome.split()[1])
+        perguntas.append({"id": indice + 1, "pergunta": texto, "modelo": None})
+    return perguntas
+
+
+def preparar_corpus(database_url, tabela, chunks, semente, embeddings, indice, trigramas, recriar,
+                    armazenamento=None):
+    """Ingere (ou reaproveita) o corpus sintético e recria o índice vetorial
+
+    Os ids dos chunks são determinísticos pela semente, então uma nova
+    execução com o mesmo tamanho não gera embeddings de novo.
+    Retorna (metricas, linhas geradas, segundos para criar o índice, MiB do índice).
+    """
+    aleatorio = random.Random(semente)
+    metricas = MetricasIngestao()
+    linhas = []
+    dim = len(embeddings.embed_query("dimensão"))
+
+    conn = psycopg2.connect(database_url)
+    try:
+        garantir_tabelas(conn, tabela)
+        garantir_indices_lexicais(conn, tabela, trigram=trigramas)
+        collection_id = obter_colecao(conn, BENCHMARK_COLECAO)
+        garantir_particao(conn, tabela, collection_id)
+
+        # Outro modelo de embeddings (ou --recriar): começa do zero
+        dim_armazenada = detectar_dimensao(conn, tabela)
+        if recriar or (dim_armazenada and dim_armazenada != dim):
+            remover_indices_vetoriais(conn, tabela)
+            with conn.cursor() as cursor:
+                cursor.execute(f"TRUNCATE {tabela}")
+
+        existentes = carregar_existentes(conn, tabela, collection_id, [FONTE_SINTETICA])
+        vistos = set()
+        splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+        paginas = gerar_paginas(aleatorio, chunks, linhas, metricas)
+        novos = filtrar_novos(
+            dividir_em_chunks(paginas, splitter, metricas, collection_id, FONTE_SINTETICA),
+            existentes, vistos, [], metricas
+        )
+        itens = gerar_embeddings(em_lotes(novos, EMBEDDING_BATCH_SIZE), embeddings,
+                                 EMBEDDING_CONCURRENCY, metricas)
+        with conn.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {tabela} (id, collection_id, embedding, document, cmetadata) "
+                f"FROM STDIN WITH (FORMAT binary)",
+                LeitorFluxo(gerar_copy(itens, collection_id))
+            )
+            removidos = [chunk_id for chunk_id in existentes if chunk_id not in vistos]
+            if removidos:
+                cursor.execute(f"DELETE FROM {tabela} WHERE collection_id = %s AND id = ANY(%s)",
+                               (collection_id, removidos))
+            metricas.removidos = len(removidos)
+        conn.commit()
+
+        inicio = time.perf_counter()
+        nome = garantir_indice_vetorial(conn, tabela, tipo=indice, dim=dim, recriar=True,
+                                        armazenamento=armazenamento)
+        with conn.cursor() as cursor:
+            cursor.execute(f"ANALYZE {tabela}")
+            tamanho_indice = 0.0
+            if nome:
+                # Em tabela particionada o tamanho é a soma dos índices das partições;
+                # pg_partition_tree não devolve linhas para o índice de uma tabela comum
+                cursor.execute("""
+                    SELECT coalesce(sum(pg_relation_size(relid)), pg_relation_size(%(nome)s::regclass))
+                    FROM pg_partition_tree(%(nome)s::regclass)
+                """, {'nome': nome})
+                tamanho_indice = float(cursor.fetchone()[0]) / 1024 / 1024
+        conn.commit()
+        tempo_indice = time.perf_counter() - inicio
+    finally:
+        conn.close()
+    return metricas, linhas, tempo_indice, tamanho_indice
+
+
+def busca_exata(engine, query_embedding, k):
+    """Ids dos k vizinhos exatos (índices desligados: varredura sequencial sobre vector)"""
+    return [linha[0] for linha in engine.vectorstore.busca_exata(query_embedding, k, engine.colecoes)]
+
+def busca_ann(engine, query_embedding, k, perfil):
+    linhas = engine.vectorstore.buscar(query_embedding, k, parametros_busca(perfil, k=k), engine.colecoes)
+    return [linha[0] for linha in linhas]
+
+def indice_utilizado(engine, query_embedding, k, indice):
+    """Confere no plano se a consulta vetorial usa o índice ANN (corpora pequenos podem não usar)"""
+    plano = engine.vectorstore.plano_busca(query_embedding, k, parametros_busca(k=k), engine.colecoes)
+    with engine.pool.connection() as conn:
+        armazenamento = engine.vectorstore.tipo_armazenamento(conn)
+        # Tabela particionada: o plano cita os índices das partições
+        nomes = [nome_indice_vetorial(engine.table_name, indice, armazenamento)] + [
+            nome_indice_particao(particao, indice, armazenamento)
+            for particao, _ in particoes(conn, engine.table_name)
+        ]
+    return any(nome in plano for nome in nomes)
+
+def medir_recall(engine, embeddings_perguntas, ks, indice):
+    """recall@k do ANN contra a busca exata, para cada perfil de busca"""
+    k_max = max(ks)
+    exatas, tempos_exata = [], []
+    for query_embedding in embeddings_perguntas:
+        ids, tempo = cronometrar(busca_exata, engine, query_embedding, k_max)
+        exatas.append(ids)
+        tempos_exata.append(tempo)
+
+    perfis = {}
+    for perfil in PERFIS_BUSCA:
+        resultado = {"parametros": PERFIS_BUSCA[perfil]}
+        for k in ks:
+            acertos, tempos = [], []
+            for query_embedding, exata in zip(embeddings_perguntas, exatas):
+                ids, tempo = cronometrar(busca_ann, engine, query_embedding, k, perfil)
+                referencia = set(exata[:k])
+                acertos.append(len(referencia & set(ids)) / len(referencia) if referencia else 1.0)
+                tempos.append(tempo)
+            resultado[f"k{k}"] = {
+                "recall": round(sum(acertos) / len(acertos), 4),
+                "recall_min": round(min(acertos), 4),
+                "latencia_ms": estatisticas(tempos),
+            }
+        perfis[perfil] = resultado
+    return {
+        "ks": ks,
+        "usa_indice": indice_utilizado(engine, embeddings_perguntas[0], KEY_VALUE, indice),
+        "exata_latencia_ms": estatisticas(tempos_exata),
+        "perfis": perfis,
+    }
+
+
+def medir_fases(engine, base, llm, perguntas, modelo, repeticoes, com_llm, perfilador=None):
+    """Tempos por fase e por modo (simples/híbrido) para cada pergunta"""
+    fases = {nome: [] for nome in (
+        "embed", "vetorial_sql", "lexical_fts", "lexical_like", "hibrida_sql",
+        "contexto_simples", "contexto_hibrido"
+    )}
+    candidatos_lexicais = {"fts": [], "like": []}
+    ponta_a_ponta = {modo: {"geracao": [], "total": [], "tokens_prompt": [], "erros": 0}
+                     for modo in ("simples", "hibrido")}
+    medidor = MedidorLLM(llm)
+    parametros = parametros_busca(k=KEY_VALUE)
+    modelo = llm.modelo_primario(modelo)
+
+    for repeticao in range(repeticoes):
+        for item in perguntas:
+            pergunta = search.limpar_texto(item["pergunta"])
+            perfil = (perfilador.pergunta(f"{repeticao + 1}-{pergunta}") if perfilador
+                      else contextlib.nullcontext())
+            with perfil:
+                termos = extrair_termos_busca(pergunta)
+
+                query_embedding, tempo = cronometrar(base.embed_query, pergunta)
+                fases["embed"].append(tempo)
+
+                linhas, tempo = cronometrar(engine.vectorstore.buscar, query_embedding, KEY_VALUE,
+                                            parametros, engine.colecoes)
+                fases["vetorial_sql"].append(tempo)
+
+                for modo in ("fts", "like"):
+                    resultado, tempo = cronometrar(engine.candidatos_lexicais, termos, LEXICAL_TOP_K,
+                                                   modo=modo)
+                    fases[f"lexical_{modo}"].append(tempo)
+                    candidatos_lexicais[modo].append(len(resultado))
+
+                docs, tempo = cronometrar(engine.busca_hibrida, pergunta, query_embedding=query_embedding)
+                fases["hibrida_sql"].append(tempo)
+                _, tempo = cronometrar(construir_contexto, pergunta, docs, engine, modelo)
+                fases["contexto_hibrido"].append(tempo)
+
+                docs = [
+                    Document(page_content=documento,
+                             metadata={"id": chunk_id, "distance": distancia, "score": 1 - distancia})
+                    for chunk_id, documento, distancia in linhas
+                ]
+                _, tempo = cronometrar(construir_contexto, pergunta, docs, engine, modelo)
+                fases["contexto_simples"].append(tempo)
+
+                if com_llm:
+                    for modo, funcao in (("simples", search_prompt), ("hibrido", search_prompt_hibrido)):
+                        medidor.tempo = medidor.prompt = None
+                        resposta, tempo = cronometrar(funcao, pergunta, medidor, engine, modelo)
+                        registro = ponta_a_ponta[modo]
+                        registro["total"].append(tempo)
+                        if medidor.tempo is not None:
+                            registro["geracao"].append(medidor.tempo)
+                            registro["tokens_prompt"].append(contar_tokens(medidor.prompt))
+                        if not resposta or str(resposta).startswith("❌"):
+                            registro["erros"] += 1
+
+    resultado = {
+        "fases_ms": {nome: estatisticas(valores) for nome, valores in fases.items()},
+        "candidatos_lexicais": {
+            modo: round(sum(valores) / len(valores), 2) if valores else 0
+            for modo, valores in candidatos_lexicais.items()
+        },
+    }
+    if com_llm:
+        resultado["ponta_a_ponta"] = {
+            modo: {
+                "geracao_ms": estatisticas(registro["geracao"]),
+                "total_ms": estatisticas(registro["total"]),
+                "tokens_prompt": estatisticas(registro["tokens_prompt"], escala=1),
+                "erros": registro["erros"],
+            }
+            for modo, registro in ponta_a_ponta.items()
+        }
+    return resultado
+
+
+def imprimir_resumo(relatorio):
+    print(f"\n📊 Corpus: {relatorio['corpus']['chunks']} chunks | "
+          f"índice {relatorio['configuracao']['indice']} em {relatorio['corpus']['indice_s']:.2f}s")
+    print(f"   {'fase':<18}{'p50':>10}{'p95':>10}{'p99':>10}  (ms)")
+    fases = dict(relatorio["fases_ms"])
+    for modo, dados in relatorio.get("ponta_a_ponta", {}).items():
+        fases[f"geracao_{modo}"] = dados["geracao_ms"]
+        fases[f"total_{modo}"] = dados["total_ms"]
+    for nome, valores in fases.items():
+        if valores.get("n"):
+            print(f"   {nome:<18}{valores['p50']:>10.2f}{valores['p95']:>10.2f}{valores['p99']:>10.2f}")
+    for modo, dados in relatorio.get("ponta_a_ponta", {}).items():
+        tokens = dados["tokens_prompt"]
+        if tokens.get("n"):
+            print(f"   tokens do prompt ({modo}): p50 {tokens['p50']:.0f} | p95 {tokens['p95']:.0f}")
+    recall = relatorio["recall"]
+    print(f"   recall ANN x exata (índice usado: {'sim' if recall['usa_indice'] else 'não'}):")
+    for perfil, dados in recall["perfis"].items():
+        valores = " | ".join(f"@{k} {dados[f'k{k}']['recall']:.3f}" for k in recall["ks"])
+        print(f"     {perfil:<12}{valores}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ponta a ponta do RAG com corpus sintético")
+    parser.add_argument("--chunks", type=int, default=2000, help="Tamanho do corpus sintético")
+    parser.add_argument("--perguntas", type=int, default=20, help="Perguntas geradas a partir do corpus")
+    parser.add_argument("--arquivo-perguntas", help="Usa as perguntas de um arquivo (.jsonl ou texto)")
+    parser.add_argument("--repeticoes", type=int, default=3, help="Repetições de cada pergunta")
+    parser.add_argument("--k", default=f"10,{KEY_VALUE},50", help="Valores de k para o recall@k")
+    parser.add_argument("--indice", choices=['hnsw', 'ivfflat', 'none'], default=VECTOR_INDEX_TYPE)
+    parser.add_argument("--armazenamento", choices=list(ARMAZENAMENTOS), default=VECTOR_STORAGE,
+                        help="Tipo indexado: vector, halfvec ou bit (pré-filtro Hamming + re-rank)")
+    parser.add_argument("--trigramas", action="store_true", default=LEXICAL_TRIGRAM,
+                        help="Índice pg_trgm e filtro por substring na busca lexical")
+    parser.add_argument("--modelo", help="Modelo LLM da geração")
+    parser.add_argument("--sem-llm", action="store_true", help="Mede só a recuperação (sem geração)")
+    parser.add_argument("--semente", type=int, default=42)
+    parser.add_argument("--recriar", action="store_true", help="Descarta o corpus já ingerido")
+    parser.add_argument("--tabela", default=BENCHMARK_TABLE)
+    parser.add_argument("--database-url", default=os.getenv("BENCHMARK_DATABASE_URL"))
+    parser.add_argument("--saida", help="Arquivo JSON (padrão: benchmark-<data>.json)")
+    parser.add_argument("--verboso", action="store_true", help="Mostra os logs do pipeline")
+    parser.add_argument("--profile", nargs="?", const=PROFILE_DIR, metavar="DIR",
+                        help=f"Perfila cada pergunta (cProfile + tracemalloc) em DIR (padrão: {PROFILE_DIR})")
+    args = parser.parse_args()
+
+    database_url = args.database_url
+    if not database_url:
+        database_url = os.getenv("DATABASE_URL")
+        print("⚠️ BENCHMARK_DATABASE_URL não definido: usando DATABASE_URL "
+              "(recomenda-se um banco dedicado)")
+    ks = sorted({int(k) for k in args.k.split(",") if k.strip()})
+
+    embeddings = get_embeddings()
+    if not embeddings:
+        print("❌ Embeddings não configurados")
+        return
+    # Sem cache: cada fase de embedding vai de fato ao provedor
+    base = getattr(embeddings, 'embeddings', embeddings)
+
+    print(f"📄 Preparando corpus sintético de {args.chunks} chunks em '{args.tabela}'...")
+    metricas, linhas, tempo_indice, tamanho_indice = preparar_corpus(
+        database_url, args.tabela, args.chunks, args.semente, base, args.indice, args.trigramas,
+        args.recriar, args.armazenamento
+    )
+    print(f"   {metricas.embeddings} embeddings novos, {metricas.inalterados} reaproveitados | "
+          f"índice em {tempo_indice:.2f}s ({tamanho_indice:.1f} MiB)")
+
+    if args.arquivo_perguntas:
+        perguntas = carregar_perguntas(args.arquivo_perguntas)
+    else:
+        perguntas = gerar_perguntas(random.Random(args.semente), linhas, args.perguntas)
+
+    # Mede a recuperação: a tabela de fatos (do PDF real) não responde pelo corpus sintético
+    engine = RetrievalEngine(database_url, embeddings=base, table_name=args.tabela, colecoes=BENCHMARK_COLECAO,
+                             fatos=False)
+    engine.trigram = args.trigramas
+    engine.vectorstore.armazenamento = args.armazenamento
+    engine.cache_semantico = None
+    llm = engine.get_llm_handler()
+    com_llm = not args.sem_llm and llm.is_available()
+    if not args.sem_llm and not com_llm:
+        print("⚠️ Nenhum modelo LLM disponível: medindo só a recuperação")
+    llm.response_cache = None
+
+    perfilador = Perfilador(args.profile) if args.profile else None
+    saida_pipeline = contextlib.nullcontext() if args.verboso else contextlib.redirect_stdout(io.StringIO())
+    try:
+        print(f"⏱️ {len(perguntas)} perguntas x {args.repeticoes} repetições...")
+        with saida_pipeline:
+            # Aquecimento: PREPARE nas conexões e páginas do índice em memória
+            medir_fases(engine, base, llm, perguntas[:3], args.modelo, 1, False)
+            fases = medir_fases(engine, base, llm, perguntas, args.modelo, args.repeticoes, com_llm,
+                                perfilador)
+            embeddings_perguntas = [
+                base.embed_query(search.limpar_texto(item["pergunta"])) for item in perguntas
+            ]
+            recall = medir_recall(engine, embeddings_perguntas, ks, args.indice)
+        # Tipo efetivo: halfvec/bit caem para vector em pgvector < 0.7
+        with engine.pool.connection() as conn:
+            armazenamento = engine.vectorstore.tipo_armazenamento(conn)
+    finally:
+        engine.close()
+
+    relatorio = {
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "configuracao": {
+            "key_value": KEY_VALUE,
+            "lexical_top_k": LEXICAL_TOP_K,
+            "rrf_k": RRF_K,
+            "indice": args.indice,
+            "armazenamento": armazenamento,
+            "hnsw_m": HNSW_M,
+            "hnsw_ef_construction": HNSW_EF_CONSTRUCTION,
+            "ivfflat_lists": IVFFLAT_LISTS,
+            "perfil_busca": SEARCH_RECALL_PROFILE,
+            "trigramas": args.trigramas,
+            "orcamento_contexto": CONTEXT_TOKEN_BUDGET,
+            "mmr": CONTEXT_MMR_ENABLED,
+            "compressao": CONTEXT_COMPRESSION_ENABLED,
+            "embedding": os.getenv("DEFAULT_EMBEDDING_MODEL", "text-embedding-3-small"),
+            "modelo_llm": llm.modelo_primario(args.modelo) if com_llm else None,
+            "chunk_size": CHUNK_SIZE,
+            "perfilado": bool(args.profile),
+        },
+        "corpus": {
+            "chunks": args.chunks,
+            "embeddings_novos": metricas.embeddings,
+            "ingestao_s": round(metricas.decorrido(), 3),
+            "indice_s": round(tempo_indice, 3),
+            "indice_mb": round(tamanho_indice, 2),
+            "semente": args.semente,
+        },
+        "perguntas": len(perguntas),
+        "repeticoes": args.repeticoes,
+        **fases,
+        "recall": recall,
+    }
+
+    caminho = args.saida or f"benchmark-{datetime.now():%Y%m%d-%H%M%S}.json"
+    with open(caminho, "w", encoding="utf-8") as arquivo:
+        json.dump(relatorio, arquivo, ensure_ascii=False, indent=2)
+    imprimir_resumo(relatorio)
+    if perfilador is not None:
+        for linha in perfilador.resumo():
+            print(linha)
+    print(f"💾 Resultado gravado em {caminho}")
+
+if __name__ == "__main__":
+    main()
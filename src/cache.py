@@ -0,0 +1,559 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import asyncio
+import threading
+import unicodedata
+from abc import ABC, abstractmethod
+from array import array
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+
+load_dotenv()
+
+# Configuração do cache de embeddings
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() in ("1", "true", "sim")
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite")
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "4096"))
+EMBEDDING_CACHE_MAX_MB = float(os.getenv("EMBEDDING_CACHE_MAX_MB", "512"))
+
+
+def normalizar_para_chave(texto):
+    """Normaliza o texto para fins de cache (NFC + espaços colapsados)"""
+    texto = unicodedata.normalize('NFC', texto or "")
+    return re.sub(r'\s+', ' ', texto).strip()
+
+def hash_texto(texto):
+    return hashlib.sha256(normalizar_para_chave(texto).encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """Cache LRU em memória, seguro para uso entre threads"""
+
+    def __init__(self, max_itens):
+        self.max_itens = max_itens
+        self._dados = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chave):
+        with self._lock:
+            if chave not in self._dados:
+                return None
+            self._dados.move_to_end(chave)
+            return self._dados[chave]
+
+    def put(self, chave, valor):
+        if self.max_itens <= 0:
+            return
+        with self._lock:
+            self._dados[chave] = valor
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.max_itens:
+                self._dados.popitem(last=False)
+
+    def pop(self, chave):
+        with self._lock:
+            return self._dados.pop(chave, None)
+
+    def clear(self):
+        with self._lock:
+            self._dados.clear()
+
+    def __len__(self):
+        return len(self._dados)
+
+
+class SQLiteEmbeddingStore:
+    """Camada em disco do cache de embeddings com despejo por tamanho
+
+    Quando o total armazenado passa de max_bytes, remove as entradas acessadas
+    há mais tempo até voltar a 90% do limite.
+    """
+
+    def __init__(self, path=EMBEDDING_CACHE_PATH, max_mb=EMBEDDING_CACHE_MAX_MB):
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        diretorio = os.path.dirname(path)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    chave TEXT PRIMARY KEY,
+                    vetor BLOB NOT NULL,
+                    acesso REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_acesso_idx ON embeddings (acesso)")
+            self._conn.commit()
+            self._total_bytes = self._conn.execute(
+                "SELECT COALESCE(SUM(LENGTH(vetor)), 0) FROM embeddings"
+            ).fetchone()[0]
+
+    def get_many(self, chaves):
+        """Busca várias chaves de uma vez; retorna chave → vetor"""
+        if not chaves:
+            return {}
+        encontrados = {}
+        agora = time.time()
+        with self._lock:
+            for inicio in range(0, len(chaves), 500):
+                parte = chaves[inicio:inicio + 500]
+                marcadores = ",".join("?" * len(parte))
+                for chave, blob in self._conn.execute(
+                    f"SELECT chave, vetor FROM embeddings WHERE chave IN ({marcadores})", parte
+                ):
+                    encontrados[chave] = array('f', blob).tolist()
+            if encontrados:
+                self._conn.executemany(
+                    "UPDATE embeddings SET acesso = ? WHERE chave = ?",
+                    [(agora, chave) for chave in encontrados]
+                )
+                self._conn.commit()
+        return encontrados
+
+    def put_many(self, itens):
+        """Grava vários (chave, vetor) e aplica o despejo por tamanho"""
+        if not itens:
+            return
+        agora = time.time()
+        # Uma linha por chave: a última gravação de uma chave repetida vence
+        linhas = list({chave: (chave, array('f', vetor).tobytes(), agora) for chave, vetor in itens}.values())
+        with self._lock:
+            # INSERT OR REPLACE sobrescreve: o tamanho das linhas substituídas sai do total
+            substituidos = 0
+            for inicio in range(0, len(linhas), 500):
+                parte = [chave for chave, _, _ in linhas[inicio:inicio + 500]]
+                marcadores = ",".join("?" * len(parte))
+                substituidos += self._conn.execute(
+                    f"SELECT COALESCE(SUM(LENGTH(vetor)), 0) FROM embeddings WHERE chave IN ({marcadores})",
+                    parte
+                ).fetchone()[0]
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (chave, vetor, acesso) VALUES (?, ?, ?)", linhas
+            )
+            self._total_bytes += sum(len(blob) for _, blob, _ in linhas) - substituidos
+            if self._total_bytes > self.max_bytes:
+                self._despejar()
+            self._conn.commit()
+
+    def _despejar(self):
+        alvo = int(self.max_bytes * 0.9)
+        while self._total_bytes > alvo:
+            removidos = self._conn.execute("""
+                DELETE FROM embeddings WHERE chave IN (
+                    SELECT chave FROM embeddings ORDER BY acesso LIMIT 256
+                ) RETURNING LENGTH(vetor)
+            """).fetchall()
+            if not removidos:
+                break
+            self._total_bytes -= sum(tamanho for (tamanho,) in removidos)
+
+    def tamanho_bytes(self):
+        return self._total_bytes
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings com cache em duas camadas (LRU em memória + SQLite em disco)
+
+    A chave é (modelo, tipo de chamada, hash do texto normalizado); o tipo
+    separa embed_query de embed_documents, que em alguns provedores usam
+    tarefas diferentes e geram vetores diferentes.
+    """
+
+    def __init__(self, embeddings, model_name, memoria=None, disco=None):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.memoria = memoria if memoria is not None else LRUCache(EMBEDDING_CACHE_MEMORY_ITEMS)
+        self.disco = disco
+        self.hits_memoria = 0
+        self.hits_disco = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _chave(self, tipo, texto):
+        return f"{self.model_name}:{tipo}:{hash_texto(texto)}"
+
+    def _buscar(self, tipo, textos, calcular):
+        chaves = [self._chave(tipo, texto) for texto in textos]
+        resultado = {}
+        faltando = []
+        for chave in chaves:
+            vetor = self.memoria.get(chave)
+            if vetor is not None:
+                resultado[chave] = vetor
+            else:
+                faltando.append(chave)
+        hits_memoria = len(chaves) - len(faltando)
+
+        hits_disco = 0
+        if faltando and self.disco is not None:
+            do_disco = self.disco.get_many(list(dict.fromkeys(faltando)))
+            for chave, vetor in do_disco.items():
+                self.memoria.put(chave, vetor)
+            resultado.update(do_disco)
+            hits_disco = sum(1 for chave in faltando if chave in do_disco)
+
+        # Apenas os textos realmente ausentes vão ao provedor, em uma única chamada
+        pendentes = {}
+        for chave, texto in zip(chaves, textos):
+            if chave not in resultado and chave not in pendentes:
+                pendentes[chave] = texto
+        if pendentes:
+            vetores = calcular(list(pendentes.values()))
+            novos = list(zip(pendentes.keys(), vetores))
+            for chave, vetor in novos:
+                resultado[chave] = vetor
+                self.memoria.put(chave, vetor)
+            if self.disco is not None:
+                self.disco.put_many(novos)
+
+        with self._lock:
+            self.hits_memoria += hits_memoria
+            self.hits_disco += hits_disco
+            self.misses += len(chaves) - hits_memoria - hits_disco
+        return [resultado[chave] for chave in chaves]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._buscar("doc", texts, self.embeddings.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._buscar("query", [text], lambda textos: [self.embeddings.embed_query(textos[0])])[0]
+
+    def embed_queries(self, texts: List[str], calcular) -> List[List[float]]:
+        """Várias consultas em lote: `calcular` recebe só os textos fora do cache"""
+        return self._buscar("query", texts, calcular)
+
+    def em_cache(self, text: str, tipo: str = "query") -> Optional[List[float]]:
+        """Vetor já armazenado (memória ou disco), sem chamar o provedor"""
+        chave = self._chave(tipo, text)
+        vetor = self.memoria.get(chave)
+        if vetor is None and self.disco is not None:
+            vetor = self.disco.get_many([chave]).get(chave)
+            if vetor is not None:
+                self.memoria.put(chave, vetor)
+        return vetor
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await asyncio.to_thread(self.embed_query, text)
+
+    def stats(self):
+        """Contadores de hit/miss por camada"""
+        total = self.hits_memoria + self.hits_disco + self.misses
+        return {
+            "hits_memoria": self.hits_memoria,
+            "hits_disco": self.hits_disco,
+            "misses": self.misses,
+            "hit_rate": (self.hits_memoria + self.hits_disco) / total if total else 0.0,
+            "itens_memoria": len(self.memoria),
+            "bytes_disco": self.disco.tamanho_bytes() if self.disco is not None else 0,
+        }
+
+
+_disco_compartilhado = None
+_disco_lock = threading.Lock()
+
+def envolver_com_cache(embeddings, model_name):
+    """Envolve o cliente de embeddings com o cache configurado no .env"""
+    global _disco_compartilhado
+    if not EMBEDDING_CACHE_ENABLED or embeddings is None:
+        return embeddings
+    with _disco_lock:
+        if _disco_compartilhado is None and EMBEDDING_CACHE_PATH:
+            try:
+                _disco_compartilhado = SQLiteEmbeddingStore(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_MB)
+            except Exception as e:
+                print(f"⚠️ Cache de embeddings em disco indisponível: {e}")
+    return CachedEmbeddings(embeddings, model_name, disco=_disco_compartilhado)
+
+
+# Configuração do cache de respostas do LLM
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "memoria")  # memoria | sqlite | none
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+LLM_CACHE_MAX_ITEMS = int(os.getenv("LLM_CACHE_MAX_ITEMS", "1000"))
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".cache/respostas.sqlite")
+LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "64"))
+
+
+class ResponseCacheBackend(ABC):
+    """Interface dos backends de cache de respostas"""
+
+    @abstractmethod
+    def get(self, chave):
+        """Resposta guardada na chave, ou None se ausente ou expirada"""
+
+    @abstractmethod
+    def put(self, chave, valor, ttl=None):
+        """Guarda a resposta; ttl em segundos (None = o padrão do backend)"""
+
+    @abstractmethod
+    def clear(self):
+        """Descarta todas as respostas"""
+
+    def stats(self):
+        return {}
+
+
+class MemoryResponseCache(ResponseCacheBackend):
+    """Cache de respostas em memória com TTL e despejo LRU"""
+
+    def __init__(self, max_itens=LLM_CACHE_MAX_ITEMS, ttl=LLM_CACHE_TTL):
+        self.ttl = ttl
+        self._lru = LRUCache(max_itens)
+
+    def get(self, chave):
+        item = self._lru.get(chave)
+        if item is None:
+            return None
+        valor, expira = item
+        if expira and expira < time.time():
+            self._lru.pop(chave)
+            return None
+        return valor
+
+    def put(self, chave, valor, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        self._lru.put(chave, (valor, time.time() + ttl if ttl else None))
+
+    def clear(self):
+        self._lru.clear()
+
+    def stats(self):
+        return {"itens": len(self._lru)}
+
+
+class SQLiteResponseCache(ResponseCacheBackend):
+    """Cache de respostas em SQLite local com TTL e despejo LRU por tamanho"""
+
+    def __init__(self, path=LLM_CACHE_PATH, max_mb=LLM_CACHE_MAX_MB, ttl=LLM_CACHE_TTL):
+        self.ttl = ttl
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        diretorio = os.path.dirname(path)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS respostas (
+                    chave TEXT PRIMARY KEY,
+                    valor TEXT NOT NULL,
+                    expira REAL,
+                    acesso REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS respostas_acesso_idx ON respostas (acesso)")
+            self._conn.commit()
+
+    def get(self, chave):
+        agora = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT valor, expira FROM respostas WHERE chave = ?", (chave,)
+            ).fetchone()
+            if row is None:
+                return None
+            valor, expira = row
+            if expira and expira < agora:
+                self._conn.execute("DELETE FROM respostas WHERE chave = ?", (chave,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE respostas SET acesso = ? WHERE chave = ?", (agora, chave))
+            self._conn.commit()
+            return valor
+
+    def put(self, chave, valor, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        agora = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO respostas (chave, valor, expira, acesso) VALUES (?, ?, ?, ?)",
+                (chave, valor, agora + ttl if ttl else None, agora)
+            )
+            self._despejar(agora)
+            self._conn.commit()
+
+    def _despejar(self, agora):
+        self._conn.execute("DELETE FROM respostas WHERE expira IS NOT NULL AND expira < ?", (agora,))
+        total = self._conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(chave) + LENGTH(valor)), 0) FROM respostas"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        alvo = int(self.max_bytes * 0.9)
+        while total > alvo:
+            removidos = self._conn.execute("""
+                DELETE FROM respostas WHERE chave IN (
+                    SELECT chave FROM respostas ORDER BY acesso LIMIT 64
+                ) RETURNING LENGTH(chave) + LENGTH(valor)
+            """).fetchall()
+            if not removidos:
+                break
+            total -= sum(tamanho for (tamanho,) in removidos)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM respostas")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            return {"itens": self._conn.execute("SELECT COUNT(*) FROM respostas").fetchone()[0]}
+
+
+def criar_cache_respostas(backend=None):
+    """Cria o backend de cache de respostas configurado (None = desabilitado)"""
+    backend = (backend or LLM_CACHE_BACKEND).lower()
+    if backend in ("none", "", "false"):
+        return None
+    if backend == "sqlite":
+        try:
+            return SQLiteResponseCache()
+        except Exception as e:
+            print(f"⚠️ Cache de respostas em SQLite indisponível, usando memória: {e}")
+    return MemoryResponseCache()
+
+
+# Configuração do cache semântico de perguntas
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() in ("1", "true", "sim")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+SEMANTIC_CACHE_MAX_ITEMS = int(os.getenv("SEMANTIC_CACHE_MAX_ITEMS", "2000"))
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+
+# Palavras que invertem o sentido de perguntas com embeddings quase idênticos
+TERMOS_ASSINATURA = {
+    'maior', 'maiores', 'menor', 'menores', 'máximo', 'mínimo', 'mais', 'menos',
+    'primeira', 'primeiro', 'última', 'último', 'antiga', 'antigas', 'recente', 'recentes',
+    'quantas', 'quantos', 'não', 'sem'
+}
+
+def assinatura_pergunta(pergunta, termos=()):
+    """Termos comparativos e números da pergunta, mais os `termos` dados
+
+    "Qual a empresa de maior faturamento?" e "...de menor faturamento?" têm
+    embeddings muito próximos; exigir a mesma assinatura evita servir a
+    resposta de uma para a outra. Em `termos` vão os nomes citados na
+    pergunta (ver search.termos_entidades), pelo mesmo motivo.
+    """
+    palavras = re.findall(r'\w+', (pergunta or "").lower())
+    assinatura = {p for p in palavras if p in TERMOS_ASSINATURA or p.isdigit()}
+    assinatura.update(normalizar_para_chave(termo).lower() for termo in termos)
+    return "|".join(sorted(assinatura))
+
+
+class SemanticCache:
+    """Cache semântico de perguntas em uma matriz NumPy em memória
+
+    Guarda os embeddings (normalizados) das perguntas já respondidas; uma
+    pergunta nova cuja similaridade de cosseno passe do limiar, no mesmo
+    escopo (modelo, versão do corpus) e com a mesma assinatura, recebe a
+    resposta armazenada sem busca nem chamada ao LLM.
+    """
+
+    def __init__(self, limiar=SEMANTIC_CACHE_THRESHOLD, max_itens=SEMANTIC_CACHE_MAX_ITEMS,
+                 ttl=SEMANTIC_CACHE_TTL):
+        self.limiar = limiar
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self._matriz = None
+        self._escopos = np.full(max_itens, -1, dtype=np.int64)
+        self._ultimo_uso = np.zeros(max_itens, dtype=np.float64)
+        self._criado = np.zeros(max_itens, dtype=np.float64)
+        self._entradas = [None] * max_itens
+        self._ids_escopo = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _id_escopo(self, escopo):
+        return self._ids_escopo.setdefault(escopo, len(self._ids_escopo))
+
+    @staticmethod
+    def _normalizar(embedding):
+        vetor = np.asarray(embedding, dtype=np.float32)
+        norma = np.linalg.norm(vetor)
+        return vetor / norma if norma else vetor
+
+    def buscar(self, embedding, escopo, assinatura=""):
+        """Retorna (resposta, similaridade) da pergunta equivalente ou None"""
+        with self._lock:
+            if self._matriz is None or self._matriz.shape[1] != len(embedding):
+                self.misses += 1
+                return None
+            # Só leitura: um escopo nunca gravado é falta, sem entrar no mapeamento
+            id_escopo = self._ids_escopo.get(escopo)
+            if id_escopo is None:
+                self.misses += 1
+                return None
+            agora = time.time()
+            validos = (self._escopos == id_escopo)
+            if self.ttl:
+                validos &= (self._criado >= agora - self.ttl)
+            if not validos.any():
+                self.misses += 1
+                return None
+
+            similaridades = self._matriz @ self._normalizar(embedding)
+            similaridades[~validos] = -1.0
+            for indice in np.argsort(similaridades)[::-1][:5]:
+                if similaridades[indice] < self.limiar:
+                    break
+                _pergunta, resposta, assinatura_salva = self._entradas[indice]
+                if assinatura_salva == assinatura:
+                    self._ultimo_uso[indice] = agora
+                    self.hits += 1
+                    return resposta, float(similaridades[indice])
+            self.misses += 1
+            return None
+
+    def adicionar(self, embedding, pergunta, resposta, escopo, assinatura=""):
+        """Armazena a resposta; quando cheio, substitui a entrada usada há mais tempo"""
+        with self._lock:
+            if self._matriz is None or self._matriz.shape[1] != len(embedding):
+                self._matriz = np.zeros((self.max_itens, len(embedding)), dtype=np.float32)
+                self._escopos[:] = -1
+            livres = np.flatnonzero(self._escopos < 0)
+            indice = livres[0] if len(livres) else int(np.argmin(self._ultimo_uso))
+            agora = time.time()
+            self._matriz[indice] = self._normalizar(embedding)
+            self._escopos[indice] = self._id_escopo(escopo)
+            self._ultimo_uso[indice] = agora
+            self._criado[indice] = agora
+            self._entradas[indice] = (pergunta, resposta, assinatura)
+
+    def clear(self):
+        with self._lock:
+            self._escopos[:] = -1
+            self._entradas = [None] * self.max_itens
+            self._ids_escopo.clear()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "itens": int((self._escopos >= 0).sum()),
+        }
+
+
+def criar_cache_semantico():
+    """Cria o cache semântico configurado (None = desabilitado)"""
+    if not SEMANTIC_CACHE_ENABLED or SEMANTIC_CACHE_MAX_ITEMS <= 0:
+        return None
+    return SemanticCache()
@@ -1,6 +1,11 @@
+import time
+import argparse
+from contextlib import nullcontext
 
-from search import search_prompt, search_prompt_hibrido
+from search import search_prompt, search_prompt_hibrido, search_prompt_hibrido_stream
 from llm_handler import LLMHandler
+from telemetria import span, resumo_percentis
+from perfilamento import Perfilador, PROFILE_DIR
 
 """
 DIFERENÇAS ENTRE AS FUNÇÕES DE BUSCA:
@@ -14,12 +19,18 @@ DIFERENÇAS ENTRE AS FUNÇÕES DE BUSCA:
 2. search_prompt_hibrido() - BUSCA HÍBRIDA:
    - FASE 1: Busca vetorial (como a função simples)
    - FASE 2: Busca lexical por termos-chave extraídos da pergunta
-   - FASE 3: Combina ambos os resultados, removendo duplicatas
+   - FASE 3: Funde ambos por Reciprocal Rank Fusion no mesmo SQL, deduplicando por chunk
+   - Se o embedding da pergunta não está em cache, a fase lexical roda em paralelo
+     com a chamada ao provedor e a fusão RRF é feita em Python (fundir_rrf)
    - Extrai termos importantes da pergunta (empresas, valores, palavras-chave)
-   - Faz consultas SQL LIKE no banco para encontrar documentos com esses termos
+   - Faz uma única consulta full-text (tsvector + GIN, ranqueada por ts_rank) com esses termos
    - Mais completa, captura dados que a busca vetorial pode perder
    - Melhor para consultas comparativas complexas como "maior faturamento"
 
+3. search_prompt_hibrido_stream() - BUSCA HÍBRIDA EM STREAMING:
+   - Mesmo fluxo da híbrida, mas gera a resposta em trechos (LLMHandler.stream)
+   - Usada pelo chat: o texto aparece à medida que o LLM o produz
+
 QUANDO USAR CADA UMA:
 - search_prompt(): Para perguntas simples e específicas
 - search_prompt_hibrido(): Para perguntas comparativas, listas, rankings
@@ -28,9 +39,23 @@ VANTAGEM DA HÍBRIDA:
 Combina a precisão semântica (vetorial) com a precisão lexical (termos exatos),
 garantindo que empresas com valores altos sejam encontradas mesmo se não 
 estiverem nos top-k chunks da busca vetorial.
+
+COLEÇÕES:
+  python src/chat.py --colecao relatorios,contratos consulta só essas coleções
+  (padrão: PG_VECTOR_COLLECTION_NAME; '*' = todas)
+
+PERFILAMENTO:
+  python src/chat.py --profile [DIR] grava um perfil (cProfile + tracemalloc) por
+  pergunta e imprime, ao sair, onde foram CPU e memória (ver src/perfilamento.py)
 """
 
 def main():
+    parser = argparse.ArgumentParser(description="Chat sobre o PDF ingerido")
+    parser.add_argument("--colecao", help="Coleções consultadas, separadas por vírgula ('*' = todas)")
+    parser.add_argument("--profile", nargs="?", const=PROFILE_DIR, metavar="DIR",
+                        help=f"Perfila cada pergunta (cProfile + tracemalloc) em DIR (padrão: {PROFILE_DIR})")
+    args = parser.parse_args()
+
     print("🤖 Sistema de Chat - Desafio MBA IA - RAG com Documentos PDF")
     print("Digite suas perguntas ou 'sair' para encerrar")
     print("=" * 50)
@@ -48,7 +73,7 @@ def main():
    
     chain = search_prompt_hibrido(llm_handler=llm_handler)
   
-    if not chain:
+    if not isinstance(chain, dict):
         print("❌ Não foi possível iniciar o sistema de busca.")
         print("Certifique-se de que:")
         print("- O banco PostgreSQL está rodando")
@@ -56,13 +81,18 @@ def main():
         print("- As variáveis de ambiente estão configuradas")
         return
     
+    # Motor de recuperação persistente: embeddings + pool de conexões
+    engine = chain['engine']
+    perfilador = Perfilador(args.profile) if args.profile else None
+    
     print("✅ Sistema pronto! Faça suas perguntas sobre o PDF.")
     print(f"🤖 Modelo ativo: {llm_handler.get_model_display_name()}")
+    print(f"📚 Coleções: {', '.join(engine.escopo_colecoes(args.colecao))}")
     print("\n💡 COMANDOS ESPECIAIS:")
     print("  'modelo' - Ver modelo atual")
     print("  'modelos' - Listar todos os modelos")
     print("  'trocar' - Trocar modelo interativamente")
-    print("  'status' - Ver status completo")
+    print("  'status' - Ver status completo (inclui latência por fase)")
     print("=" * 50)
     
     while True:
@@ -93,6 +123,22 @@ def main():
                 print(f"🤖 Modelo atual: {info['current_display']}")
                 print(f"📊 Modelos disponíveis: {', '.join(info['available_display'])}")
                 print(f"📈 Total de modelos: {info['total']}")
+                if info['cache']['enabled']:
+                    print(f"🗄️ Cache de respostas: {info['cache']['hits']} hits, "
+                          f"{info['cache']['misses']} misses, {info['cache'].get('itens', 0)} itens")
+                circuitos = ", ".join(f"{k}: {v}" for k, v in info['circuitos'].items())
+                print(f"🔌 Circuitos: {circuitos} | hedges: {info['hedges']}")
+                if engine.cache_semantico is not None:
+                    semantico = engine.cache_semantico.stats()
+                    print(f"⚡ Cache semântico: {semantico['hits']} hits, "
+                          f"{semantico['misses']} misses, {semantico['itens']} perguntas")
+                if hasattr(engine.embeddings, 'stats'):
+                    cache = engine.embeddings.stats()
+                    print(f"🗄️ Cache de embeddings: {cache['hits_memoria']} hits memória, "
+                          f"{cache['hits_disco']} hits disco, {cache['misses']} misses "
+                          f"({cache['hit_rate']:.0%} de acerto)")
+                for linha in resumo_percentis():
+                    print(linha)
                 continue
                 
             # Ignorar entradas vazias
@@ -103,14 +149,26 @@ def main():
             print(f"\nPERGUNTA: {pergunta}")
             print(f"🤖 Usando: {llm_handler.get_model_display_name()}")
             
-            # Processar pergunta e obter resposta
-            resposta = search_prompt_hibrido(pergunta, llm_handler=llm_handler)
-
-            if resposta:
-                # Exibir resposta  
-                print(f"RESPOSTA: {resposta}")
-            else:
+            # Processar pergunta exibindo a resposta à medida que é gerada
+            # (reutilizando o motor de recuperação)
+            inicio = time.perf_counter()
+            primeiro_token = None
+            perfil = perfilador.pergunta(pergunta) if perfilador else nullcontext()
+            with perfil, span("chat", modelo=llm_handler.get_current_model()) as atual:
+                for trecho in search_prompt_hibrido_stream(pergunta, llm_handler=llm_handler, engine=engine,
+                                                           colecoes=args.colecao):
+                    if primeiro_token is None:
+                        # Prefixo só agora: os avisos da recuperação ficam fora da linha da resposta
+                        primeiro_token = time.perf_counter() - inicio
+                        atual.definir(primeiro_token_ms=round(primeiro_token * 1000, 1))
+                        print("RESPOSTA: ", end="", flush=True)
+                    print(trecho, end="", flush=True)
+            total = time.perf_counter() - inicio
+            
+            if primeiro_token is None:
                 print("RESPOSTA: Erro ao processar sua pergunta.")
+            else:
+                print(f"\n⏱️ Primeiro token: {primeiro_token:.2f}s | Total: {total:.2f}s")
             
             # Separador  
             print("\n---")
@@ -121,6 +179,11 @@ def main():
         except Exception as e:
             print(f"❌ Erro: {e}")
             print("Tente novamente ou digite 'sair' para encerrar.")
+    
+    engine.close()
+    if perfilador is not None:
+        for linha in perfilador.resumo():
+            print(linha)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,170 @@
+import os
+import re
+import math
+
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+
+from fatos import remover_acentos
+
+load_dotenv()
+
+# Orçamento de tokens do contexto por modelo (o restante do prompt fica de fora)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "8000"))
+ORCAMENTOS_CONTEXTO = {
+    'openai': int(os.getenv("OPENAI_CONTEXT_TOKENS", CONTEXT_TOKEN_BUDGET)),
+    'gemini': int(os.getenv("GEMINI_CONTEXT_TOKENS", CONTEXT_TOKEN_BUDGET)),
+}
+# MMR: peso da relevância (1.0 = só relevância, 0.0 = só diversidade)
+CONTEXT_MMR_ENABLED = os.getenv("CONTEXT_MMR_ENABLED", "true").lower() == "true"
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+# Chunks com similaridade acima disso a um já escolhido são descartados como redundantes
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.97"))
+CHARS_POR_TOKEN = 4
+
+# Compressão: só as linhas/frases com termos da pergunta, mais a janela ao redor
+CONTEXT_COMPRESSION_ENABLED = os.getenv("CONTEXT_COMPRESSION_ENABLED", "true").lower() == "true"
+CONTEXT_COMPRESSION_WINDOW = int(os.getenv("CONTEXT_COMPRESSION_WINDOW", "1"))
+# Palavras do cabeçalho da tabela: presentes em quase todo chunk, não identificam linhas
+TERMOS_ESQUEMA = {'faturamento', 'fundacao', 'fundada', 'fundadas', 'receita', 'valor', 'valores'}
+REGEX_FIM_FRASE = re.compile(r'(?<=[.!?;])\s+')
+
+_codificador = None
+
+def contar_tokens(texto):
+    """Tokens do texto (tiktoken quando disponível; senão ~4 caracteres por token)
+
+    O Gemini usa outro tokenizador; a contagem serve como estimativa para ele.
+    """
+    global _codificador
+    if _codificador is None:
+        try:
+            import tiktoken
+            _codificador = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _codificador = False
+    if _codificador:
+        return len(_codificador.encode(texto, disallowed_special=()))
+    return math.ceil(len(texto) / CHARS_POR_TOKEN)
+
+def orcamento_para(modelo):
+    """Orçamento de tokens de contexto do modelo"""
+    return ORCAMENTOS_CONTEXTO.get(modelo, CONTEXT_TOKEN_BUDGET)
+
+
+def ordenar_mmr(relevancias, vetores, lambda_mmr=CONTEXT_MMR_LAMBDA,
+                limiar_redundancia=CONTEXT_DEDUP_THRESHOLD):
+    """Ordem de Maximal Marginal Relevance sobre os candidatos
+
+    relevancias: score de cada candidato (normalizado internamente para 0..1)
+    vetores: matriz (n, dim) com os embeddings armazenados, ou None
+
+    Retorna (ordem, redundantes): índices na ordem MMR e índices descartados
+    por serem quase idênticos a um chunk já escolhido.
+    """
+    n = len(relevancias)
+    relevancia = np.asarray(relevancias, dtype=np.float64)
+    if n and relevancia.max() > 0:
+        relevancia = relevancia / relevancia.max()
+    if vetores is None or n < 2:
+        return list(np.argsort(-relevancia, kind="stable")), []
+
+    matriz = np.asarray(vetores, dtype=np.float32)
+    normas = np.linalg.norm(matriz, axis=1, keepdims=True)
+    matriz = matriz / np.where(normas == 0, 1, normas)
+    similaridades = matriz @ matriz.T
+
+    ordem, redundantes = [], []
+    restantes = list(range(n))
+    max_sim = np.zeros(n)
+    while restantes:
+        indices = np.array(restantes)
+        scores = lambda_mmr * relevancia[indices] - (1 - lambda_mmr) * max_sim[indices]
+        escolhido = int(indices[int(np.argmax(scores))])
+        restantes.remove(escolhido)
+        if ordem and max_sim[escolhido] >= limiar_redundancia:
+            redundantes.append(escolhido)
+            continue
+        ordem.append(escolhido)
+        max_sim = np.maximum(max_sim, similaridades[escolhido])
+    return ordem, redundantes
+
+
+def montar_contexto(docs, modelo=None, vetores=None, orcamento=None, separador="\n\n"):
+    """Seleciona e empacota os chunks recuperados no orçamento de tokens do modelo
+
+    docs: Documents em ordem de relevância (metadata 'score' quando houver)
+    vetores: dict id -> embedding armazenado, para a diversificação MMR
+
+    Retorna (contexto, relatorio) com tokens/chunks mantidos e descartados.
+    """
+    orcamento = orcamento or orcamento_para(modelo)
+    relevancias = [
+        doc.metadata.get("score", 1.0 / (posicao + 1)) for posicao, doc in enumerate(docs)
+    ]
+    matriz = None
+    if CONTEXT_MMR_ENABLED and vetores:
+        ids = [doc.metadata.get("id") for doc in docs]
+        if all(chunk_id in vetores for chunk_id in ids):
+            matriz = np.stack([vetores[chunk_id] for chunk_id in ids])
+    ordem, redundantes = ordenar_mmr(relevancias, matriz)
+
+    tokens = [contar_tokens(doc.page_content) for doc in docs]
+    custo_separador = contar_tokens(separador)
+    escolhidos, usados = [], 0
+    descartados = list(redundantes)
+    for indice in ordem:
+        custo = tokens[indice] + (custo_separador if escolhidos else 0)
+        if usados + custo > orcamento:
+            descartados.append(indice)
+            continue
+        escolhidos.append(indice)
+        usados += custo
+
+    contexto = separador.join(docs[indice].page_content for indice in escolhidos)
+    relatorio = {
+        "orcamento": orcamento,
+        "tokens_mantidos": usados,
+        "tokens_descartados": sum(tokens[indice] for indice in descartados),
+        "chunks_mantidos": len(escolhidos),
+        "chunks_descartados": len(descartados),
+        "chunks_redundantes": len(redundantes),
+    }
+    return contexto, relatorio
+
+def dividir_unidades(texto):
+    """Linhas do chunk; chunks de uma linha só (prosa) são divididos em frases"""
+    linhas = texto.split("\n")
+    if len(linhas) > 1:
+        return linhas
+    return REGEX_FIM_FRASE.split(texto)
+
+def comprimir_chunk(texto, termos, janela=CONTEXT_COMPRESSION_WINDOW):
+    """Mantém só as linhas/frases com algum termo da pergunta e `janela` vizinhas
+
+    Sem nenhuma correspondência, o chunk volta inteiro.
+    """
+    if not termos:
+        return texto
+    unidades = dividir_unidades(texto)
+    manter = set()
+    for posicao, unidade in enumerate(unidades):
+        normalizada = remover_acentos(unidade)
+        if any(termo in normalizada for termo in termos):
+            manter.update(range(max(0, posicao - janela), min(len(unidades), posicao + janela + 1)))
+    if not manter:
+        return texto
+    separador = "\n" if "\n" in texto else " "
+    return separador.join(unidades[posicao] for posicao in sorted(manter))
+
+def comprimir_documentos(docs, termos, janela=CONTEXT_COMPRESSION_WINDOW):
+    """Comprime cada chunk recuperado aos trechos relevantes para os termos"""
+    termos = [remover_acentos(termo) for termo in termos]
+    termos = [termo for termo in termos if termo not in TERMOS_ESQUEMA]
+    if not termos:
+        return docs
+    return [
+        Document(page_content=comprimir_chunk(doc.page_content, termos, janela), metadata=doc.metadata)
+        for doc in docs
+    ]
@@ -0,0 +1,20 @@
+NOMES = ["Alfa", "Beta", "Conexão", "Horizonte", "Vanguarda", "Rápida", "Lunar", "Brava"]
+SETORES = ["Energia", "Saúde", "Logística", "Educação", "Agronegócio", "Imobiliária", "Varejo"]
+SUFIXOS = ["S.A.", "LTDA", "Holding", "Participações", "Indústria", "Comércio", "ME"]
+
+"""
+DADOS SINTÉTICOS DOS BENCHMARKS:
+
+Empresas no formato da tabela do PDF (nome, faturamento, ano de fundação),
+usadas pelo benchmark ponta a ponta (src/benchmark.py) e pelo micro-benchmark
+da normalização de texto (src/bench_limpeza.py).
+"""
+
+
+def gerar_linha(aleatorio):
+    """Linha sintética da tabela: (nome, faturamento, ano, texto)"""
+    nome = f"{aleatorio.choice(NOMES)} {aleatorio.choice(SETORES)} {aleatorio.choice(SUFIXOS)}"
+    valor = f"{aleatorio.randint(100_000, 5_000_000_000):,}".replace(",", ".")
+    faturamento = f"R$ {valor},{aleatorio.randint(0, 99):02d}"
+    ano = aleatorio.randint(1930, 2025)
+    return nome, faturamento, ano, f"{nome} {faturamento} {ano}"
@@ -0,0 +1,625 @@
+import os
+import math
+import queue
+import threading
+import uuid
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Configuração do pool de conexões
+POOL_MAX_CONN = int(os.getenv("DB_POOL_MAX_CONN", "8"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# Coleção padrão da ingestão e das buscas; várias separadas por vírgula, '*' = todas
+PG_VECTOR_COLLECTION_NAME = os.getenv("PG_VECTOR_COLLECTION_NAME") or "documents"
+TODAS_COLECOES = "*"
+
+# Configuração do índice vetorial (ANN)
+VECTOR_INDEX_TYPE = os.getenv("VECTOR_INDEX_TYPE", "hnsw")
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "0"))  # 0 = automático pelo número de linhas
+
+# Tipo indexado: vector | halfvec (metade da memória) | bit (1/32, pré-filtro Hamming + re-rank)
+VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "vector")
+# Candidatos por resultado no pré-filtro Hamming antes do re-rank exato (VECTOR_STORAGE=bit)
+VECTOR_BIT_RERANK = int(os.getenv("VECTOR_BIT_RERANK", "4"))
+
+# Tipo: (classe de operadores do índice, operador de distância)
+ARMAZENAMENTOS = {
+    'vector': ('vector_cosine_ops', '<=>'),
+    'halfvec': ('halfvec_cosine_ops', '<=>'),
+    'bit': ('bit_hamming_ops', '<~>'),
+}
+
+# Perfis de busca: trocam recall por latência
+PERFIS_BUSCA = {
+    'rapido': {'ef_search': 20, 'probes': 1},
+    'balanceado': {'ef_search': 64, 'probes': 10},
+    'preciso': {'ef_search': 200, 'probes': 40},
+}
+SEARCH_RECALL_PROFILE = os.getenv("SEARCH_RECALL_PROFILE", "balanceado")
+
+# Configuração da busca lexical (full-text em português)
+LEXICAL_TS_CONFIG = "pt_unaccent"
+LEXICAL_TRIGRAM = os.getenv("LEXICAL_TRIGRAM", "false").lower() in ("1", "true", "sim")
+
+
+class ConnectionPool:
+    """Pool limitado de conexões PostgreSQL com suporte a statements preparados
+
+    As conexões são abertas sob demanda (até max_conn) e reaproveitadas entre
+    perguntas, evitando o custo de TCP + autenticação a cada consulta.
+    """
+
+    def __init__(self, database_url=None, max_conn=POOL_MAX_CONN, timeout=POOL_TIMEOUT):
+        self.database_url = database_url or os.getenv("DATABASE_URL")
+        self.max_conn = max_conn
+        self.timeout = timeout
+        self._ociosas = queue.LifoQueue()
+        self._vagas = threading.BoundedSemaphore(max_conn)
+        self._preparados = {}
+        self._lock = threading.Lock()
+        self._fechado = False
+
+    def _nova_conexao(self):
+        conn = psycopg2.connect(self.database_url)
+        with self._lock:
+            self._preparados[id(conn)] = set()
+        return conn
+
+    def _descartar(self, conn):
+        with self._lock:
+            self._preparados.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _obter(self):
+        if not self._vagas.acquire(timeout=self.timeout):
+            raise TimeoutError("Tempo esgotado aguardando conexão livre no pool")
+        try:
+            while True:
+                try:
+                    conn = self._ociosas.get_nowait()
+                except queue.Empty:
+                    return self._nova_conexao()
+                if conn.closed:
+                    self._descartar(conn)
+                    continue
+                return conn
+        except Exception:
+            self._vagas.release()
+            raise
+
+    def _devolver(self, conn):
+        try:
+            if self._fechado or conn.closed:
+                self._descartar(conn)
+                return
+            status = conn.info.transaction_status
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                self._descartar(conn)
+                return
+            if status != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            self._ociosas.put(conn)
+        finally:
+            self._vagas.release()
+
+    @contextmanager
+    def connection(self):
+        """Empresta uma conexão do pool e a devolve ao final (commit/rollback automático)"""
+        conn = self._obter()
+        try:
+            yield conn
+            if not conn.closed:
+                conn.commit()
+        except Exception:
+            if not conn.closed:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    pass
+            raise
+        finally:
+            self._devolver(conn)
+
+    def preparar(self, conn, nome, sql, tipos=None):
+        """Executa PREPARE uma única vez por conexão física
+
+        tipos declara os tipos dos parâmetros ($1, $2, ...) quando o PostgreSQL
+        não consegue inferi-los (ex.: parâmetro não usado em uma variante do SQL).
+        """
+        with self._lock:
+            preparados = self._preparados.setdefault(id(conn), set())
+            if nome in preparados:
+                return
+        declaracao = f"({', '.join(tipos)}) " if tipos else ""
+        with conn.cursor() as cursor:
+            cursor.execute(f"PREPARE {nome} {declaracao}AS {sql}")
+        with self._lock:
+            preparados.add(nome)
+
+    def executar_preparado(self, conn, nome, sql, params, tipos=None):
+        """Executa um statement preparado, preparando-o na primeira utilização
+
+        O SQL usa parâmetros posicionais do PostgreSQL ($1, $2, ...).
+        """
+        self.preparar(conn, nome, sql, tipos)
+        placeholders = ", ".join(["%s"] * len(params))
+        cursor = conn.cursor()
+        cursor.execute(f"EXECUTE {nome} ({placeholders})", params)
+        return cursor
+
+    def close(self):
+        """Fecha todas as conexões ociosas do pool"""
+        self._fechado = True
+        while True:
+            try:
+                conn = self._ociosas.get_nowait()
+            except queue.Empty:
+                break
+            self._descartar(conn)
+
+
+def _sql_tabela_embeddings(table_name):
+    # Particionada por coleção: cada uma tem seus próprios índices ANN e lexicais
+    # e as buscas filtradas por collection_id só leem as partições pedidas
+    return f"""
+        CREATE TABLE IF NOT EXISTS {table_name} (
+            id VARCHAR NOT NULL,
+            collection_id UUID NOT NULL REFERENCES langchain_pg_collection (uuid) ON DELETE CASCADE,
+            embedding VECTOR,
+            document VARCHAR,
+            cmetadata JSONB,
+            PRIMARY KEY (collection_id, id)
+        ) PARTITION BY LIST (collection_id)
+    """
+
+def garantir_tabelas(conn, table_name="langchain_pg_embedding"):
+    """Cria as tabelas no mesmo formato do LangChain PGVector, se ainda não existirem
+
+    A tabela de embeddings é particionada por coleção (LIST em collection_id);
+    tabelas criadas antes continuam funcionando e podem ser convertidas com
+    migrar_para_particoes (python src/db.py --particionar).
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS vector")
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS langchain_pg_collection (
+                uuid UUID PRIMARY KEY,
+                name VARCHAR NOT NULL UNIQUE,
+                cmetadata JSON
+            )
+        """)
+        cursor.execute(_sql_tabela_embeddings(table_name))
+
+def obter_colecao(conn, nome):
+    """Retorna o uuid da coleção, criando-a se necessário"""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT uuid FROM langchain_pg_collection WHERE name = %s", (nome,))
+        row = cursor.fetchone()
+        if row:
+            return str(row[0])
+        cursor.execute(
+            "INSERT INTO langchain_pg_collection (uuid, name, cmetadata) VALUES (%s, %s, '{}') "
+            "ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name RETURNING uuid",
+            (str(uuid.uuid4()), nome)
+        )
+        return str(cursor.fetchone()[0])
+
+def normalizar_colecoes(colecoes):
+    """Nomes de coleções como tupla ordenada e sem repetição
+
+    Aceita um nome, nomes separados por vírgula ou uma lista; '*' (TODAS_COLECOES)
+    consulta todas. Uma lista vazia é um erro: nunca vira "todas" por acidente.
+    """
+    if isinstance(colecoes, str):
+        colecoes = colecoes.split(",")
+    nomes = tuple(sorted({str(nome).strip() for nome in colecoes or () if str(nome).strip()}))
+    if not nomes:
+        raise ValueError("Informe ao menos uma coleção (ou '*' para todas)")
+    return (TODAS_COLECOES,) if TODAS_COLECOES in nomes else nomes
+
+def ids_colecoes(conn, colecoes):
+    """uuids das coleções (nomes já normalizados); coleções inexistentes são ignoradas"""
+    with conn.cursor() as cursor:
+        if TODAS_COLECOES in colecoes:
+            cursor.execute("SELECT uuid::text FROM langchain_pg_collection ORDER BY name")
+        else:
+            cursor.execute(
+                "SELECT uuid::text FROM langchain_pg_collection WHERE name = ANY(%s) ORDER BY name",
+                (list(colecoes),)
+            )
+        return [row[0] for row in cursor.fetchall()]
+
+def tabela_particionada(conn, table_name):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table_name,))
+        row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+def nome_particao(table_name, collection_id):
+    return f"{table_name}_p{uuid.UUID(str(collection_id)).hex[:12]}"
+
+def particoes(conn, table_name):
+    """Partições da tabela de embeddings: [(nome, collection_id)]"""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s)
+            ORDER BY c.relname
+        """, (table_name,))
+        return [(nome, limite.split("'")[1]) for nome, limite in cursor.fetchall()]
+
+def garantir_particao(conn, table_name, collection_id):
+    """Cria a partição da coleção; em tabelas sem particionamento não faz nada
+
+    A partição nova recebe automaticamente os índices já definidos na
+    tabela-mãe (vetorial e lexicais). Retorna o nome da partição ou None.
+    """
+    if not tabela_particionada(conn, table_name):
+        return None
+    nome = nome_particao(table_name, collection_id)
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {nome} PARTITION OF {table_name} FOR VALUES IN (%s)",
+            (str(collection_id),)
+        )
+    return nome
+
+def migrar_para_particoes(conn, table_name="langchain_pg_embedding"):
+    """Converte a tabela de embeddings em particionada por coleção (na transação corrente)
+
+    A tabela antiga é renomeada, as linhas são copiadas para uma partição por
+    coleção e a antiga é removida. Os índices vetoriais e lexicais precisam
+    ser recriados em seguida. Retorna o número de partições ou None quando a
+    tabela já é particionada (ou não existe).
+    """
+    if tabela_particionada(conn, table_name) or not coluna_existe(conn, table_name, 'embedding'):
+        return None
+    legado = f"{table_name}_legado"
+    remover_indices_vetoriais(conn, table_name)
+    with conn.cursor() as cursor:
+        for sufixo in ("document_tsv_idx", "document_trgm_idx"):
+            cursor.execute(f"DROP INDEX IF EXISTS {table_name}_{sufixo}")
+        # Linhas sem coleção (versões antigas do LangChain) vão para a coleção padrão
+        cursor.execute(f"SELECT count(*) FROM {table_name} WHERE collection_id IS NULL")
+        if cursor.fetchone()[0]:
+            padrao = obter_colecao(conn, normalizar_colecoes(PG_VECTOR_COLLECTION_NAME)[0])
+            cursor.execute(f"UPDATE {table_name} SET collection_id = %s WHERE collection_id IS NULL",
+                           (padrao,))
+
+        cursor.execute(f"ALTER TABLE {table_name} RENAME TO {legado}")
+        # Nomes de constraints com índice são únicos no schema: liberar o da chave primária
+        cursor.execute("""
+            SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'p'
+        """, (legado,))
+        for (constraint,) in cursor.fetchall():
+            cursor.execute(f"ALTER TABLE {legado} RENAME CONSTRAINT {constraint} TO {legado}_pkey")
+
+        cursor.execute(_sql_tabela_embeddings(table_name))
+        cursor.execute(f"SELECT DISTINCT collection_id FROM {legado}")
+        colecoes = [row[0] for row in cursor.fetchall()]
+        for collection_id in colecoes:
+            garantir_particao(conn, table_name, collection_id)
+        cursor.execute(f"""
+            INSERT INTO {table_name} (id, collection_id, embedding, document, cmetadata)
+            SELECT id, collection_id, embedding, document, cmetadata FROM {legado}
+        """)
+        cursor.execute(f"DROP TABLE {legado}")
+    return len(colecoes)
+
+def registrar_versao_corpus(conn, collection_id):
+    """Grava uma nova versão do corpus na coleção (invalida caches de respostas)"""
+    versao = uuid.uuid4().hex
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            UPDATE langchain_pg_collection
+            SET cmetadata = (COALESCE(cmetadata::jsonb, '{}'::jsonb)
+                             || jsonb_build_object('corpus_version', %s::text))::json
+            WHERE uuid = %s
+        """, (versao, collection_id))
+    return versao
+
+def obter_versao_corpus(conn):
+    """Versão agregada do corpus: muda sempre que qualquer coleção é alterada"""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT md5(COALESCE(string_agg(
+                name || ':' || COALESCE(cmetadata::jsonb->>'corpus_version', ''), ',' ORDER BY name
+            ), ''))
+            FROM langchain_pg_collection
+        """)
+        return cursor.fetchone()[0]
+
+def detectar_dimensao(conn, table_name="langchain_pg_embedding"):
+    """Descobre a dimensão dos embeddings armazenados (None se a tabela estiver vazia)"""
+    with conn.cursor() as cursor:
+        cursor.execute(f"SELECT vector_dims(embedding) FROM {table_name} LIMIT 1")
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+def versao_pgvector(conn):
+    """Versão instalada do pgvector como tupla (ex.: (0, 7, 4))"""
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT extversion FROM pg_extension WHERE extname = 'vector'")
+        row = cursor.fetchone()
+    if not row:
+        return (0,)
+    return tuple(int(parte) for parte in row[0].split(".") if parte.isdigit())
+
+def resolver_armazenamento(conn, armazenamento=None):
+    """Tipo indexado suportado pelo pgvector instalado (halfvec e bit exigem 0.7+)"""
+    armazenamento = (armazenamento or VECTOR_STORAGE).lower()
+    if armazenamento not in ARMAZENAMENTOS:
+        raise ValueError(f"Armazenamento vetorial inválido: {armazenamento}")
+    if armazenamento != 'vector':
+        versao = versao_pgvector(conn)
+        if versao < (0, 7):
+            print(f"⚠️ pgvector {'.'.join(map(str, versao))} não suporta {armazenamento} "
+                  f"(requer 0.7+): usando vector")
+            return 'vector'
+    return armazenamento
+
+def expressao_vetor(dim=None, coluna="embedding", armazenamento='vector'):
+    """Expressão SQL da coluna vetorial
+
+    A coluna criada pelo LangChain não tem dimensão declarada e o pgvector só
+    indexa vetores com dimensão fixa, por isso índice e consulta usam o mesmo
+    cast explícito para vector(dim). Com halfvec/bit o índice guarda a versão
+    reduzida do vetor; a coluna continua com a precisão completa.
+    """
+    if not dim:
+        return coluna
+    dim = int(dim)
+    if armazenamento == 'halfvec':
+        return f"({coluna}::halfvec({dim}))"
+    if armazenamento == 'bit':
+        return f"(binary_quantize({coluna}::vector({dim}))::bit({dim}))"
+    return f"({coluna}::vector({dim}))"
+
+def expressao_parametro(placeholder, dim=None, armazenamento='vector'):
+    """Cast do parâmetro de consulta compatível com expressao_vetor"""
+    tipo = f"({int(dim)})" if dim else ""
+    if armazenamento == 'halfvec':
+        return f"{placeholder}::halfvec{tipo}"
+    if armazenamento == 'bit':
+        return f"binary_quantize({placeholder}::vector{tipo})::bit{tipo}"
+    return f"{placeholder}::vector{tipo}"
+
+def operador_distancia(armazenamento='vector'):
+    return ARMAZENAMENTOS[armazenamento][1]
+
+def nome_indice_vetorial(table_name, tipo, armazenamento='vector'):
+    if armazenamento == 'vector':
+        return f"{table_name}_embedding_{tipo}_idx"
+    return f"{table_name}_embedding_{armazenamento}_{tipo}_idx"
+
+def nome_indice_particao(particao, tipo, armazenamento='vector'):
+    # Mais curto que nome_indice_vetorial: o nome da partição já inclui o uuid
+    sufixo = tipo if armazenamento == 'vector' else f"{armazenamento}_{tipo}"
+    return f"{particao}_{sufixo}_idx"
+
+def remover_indices_vetoriais(conn, table_name="langchain_pg_embedding", manter=None, concorrente=False):
+    """Remove os índices ANN da tabela, exceto o de nome `manter`
+
+    Antes de gravar vetores de outra dimensão é preciso remover os índices:
+    o cast para vector(dim) falharia em cada linha inserida. Em tabelas
+    particionadas o DROP remove junto os índices das partições (e não
+    aceita CONCURRENTLY).
+    """
+    concurrently = "CONCURRENTLY " if concorrente and not tabela_particionada(conn, table_name) else ""
+    with conn.cursor() as cursor:
+        for tipo in ('hnsw', 'ivfflat'):
+            for armazenamento in ARMAZENAMENTOS:
+                nome = nome_indice_vetorial(table_name, tipo, armazenamento)
+                if nome != manter:
+                    cursor.execute(f"DROP INDEX {concurrently}IF EXISTS {nome}")
+
+def calcular_listas_ivfflat(total_linhas):
+    """Número de listas recomendado pelo pgvector: linhas/1000 (até 1M) ou sqrt(linhas)"""
+    if IVFFLAT_LISTS > 0:
+        return IVFFLAT_LISTS
+    if total_linhas <= 1_000_000:
+        return max(1, total_linhas // 1000)
+    return max(1, int(math.sqrt(total_linhas)))
+
+def garantir_indice_vetorial(conn, table_name="langchain_pg_embedding", tipo=None,
+                             dim=None, recriar=False, concorrente=False, armazenamento=None):
+    """Cria (ou recria) o índice ANN na tabela de embeddings
+
+    O índice é de distância cosseno sobre vector/halfvec ou de Hamming sobre
+    bit (VECTOR_STORAGE). Com concorrente=True usa CREATE INDEX CONCURRENTLY
+    para não bloquear as consultas do chat; nesse caso a conexão precisa estar
+    em autocommit. Em tabelas particionadas cada coleção tem seu índice.
+    Retorna o nome do índice criado ou None quando não há dados para indexar.
+    """
+    tipo = (tipo or VECTOR_INDEX_TYPE).lower()
+    if tipo not in ('hnsw', 'ivfflat', 'none'):
+        raise ValueError(f"Tipo de índice vetorial inválido: {tipo}")
+
+    dim = dim or detectar_dimensao(conn, table_name)
+    if not dim:
+        print("⚠️ Tabela de embeddings vazia: índice vetorial não criado")
+        return None
+
+    armazenamento = resolver_armazenamento(conn, armazenamento)
+    nome = nome_indice_vetorial(table_name, tipo, armazenamento) if tipo != 'none' else None
+    # Remover índices de outro tipo ou armazenamento (ou todos, ao recriar)
+    remover_indices_vetoriais(conn, table_name, manter=None if recriar else nome, concorrente=concorrente)
+
+    if tipo == 'none':
+        return None
+    if tabela_particionada(conn, table_name):
+        _indexar_particoes(conn, table_name, nome, tipo, dim, armazenamento, concorrente)
+    else:
+        _criar_indice_vetorial(conn, table_name, nome, tipo, dim, armazenamento, concorrente)
+    return nome
+
+def _criar_indice_vetorial(conn, tabela, nome, tipo, dim, armazenamento, concorrente=False, somente=False):
+    concurrently = "CONCURRENTLY " if concorrente else ""
+    only = "ONLY " if somente else ""
+    with conn.cursor() as cursor:
+        expressao = expressao_vetor(dim, armazenamento=armazenamento)
+        classe_operadores = ARMAZENAMENTOS[armazenamento][0]
+        if tipo == 'hnsw':
+            opcoes = f"m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION}"
+        else:
+            cursor.execute(f"SELECT count(*) FROM {tabela}")
+            opcoes = f"lists = {calcular_listas_ivfflat(cursor.fetchone()[0])}"
+
+        cursor.execute(f"""
+            CREATE INDEX {concurrently}IF NOT EXISTS {nome}
+            ON {only}{tabela} USING {tipo} ({expressao} {classe_operadores})
+            WITH ({opcoes})
+        """)
+
+def _indexar_particoes(conn, table_name, nome, tipo, dim, armazenamento, concorrente):
+    """Índice ANN de uma tabela particionada, construído partição por partição
+
+    O índice da tabela-mãe é criado sem dados (ON ONLY) e cada partição ganha
+    o seu, com CONCURRENTLY quando pedido e IVFFlat dimensionado pelas linhas
+    da própria partição, antes de ser anexado. Partições criadas depois
+    herdam a definição da tabela-mãe.
+    """
+    _criar_indice_vetorial(conn, table_name, nome, tipo, dim, armazenamento, somente=True)
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT x.indrelid::regclass::text
+            FROM pg_inherits i
+            JOIN pg_index x ON x.indexrelid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s)
+        """, (nome,))
+        indexadas = {row[0] for row in cursor.fetchall()}
+    for particao, _collection_id in particoes(conn, table_name):
+        if particao in indexadas:
+            continue
+        nome_particao = nome_indice_particao(particao, tipo, armazenamento)
+        _criar_indice_vetorial(conn, particao, nome_particao, tipo, dim, armazenamento, concorrente)
+        with conn.cursor() as cursor:
+            cursor.execute(f"ALTER INDEX {nome} ATTACH PARTITION {nome_particao}")
+
+def parametros_busca(perfil=None, k=None, ef_search=None, probes=None):
+    """Resolve ef_search/probes a partir do perfil e das variáveis de ambiente"""
+    perfil = perfil or SEARCH_RECALL_PROFILE
+    base = PERFIS_BUSCA.get(perfil, PERFIS_BUSCA['balanceado'])
+    ef_search = ef_search or int(os.getenv("HNSW_EF_SEARCH", "0")) or base['ef_search']
+    probes = probes or int(os.getenv("IVFFLAT_PROBES", "0")) or base['probes']
+    # O HNSW nunca retorna mais que ef_search candidatos
+    if k:
+        ef_search = max(ef_search, k)
+    return {'ef_search': ef_search, 'probes': probes}
+
+def sql_parametros_busca(parametros):
+    """Comandos SET LOCAL que ajustam o ANN apenas para a transação corrente"""
+    return (
+        f"SET LOCAL hnsw.ef_search = {int(parametros['ef_search'])}; "
+        f"SET LOCAL ivfflat.probes = {int(parametros['probes'])}; "
+    )
+
+def extensao_disponivel(conn, nome):
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = %s", (nome,))
+        return cursor.fetchone() is not None
+
+def coluna_existe(conn, table_name, coluna):
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = %s AND column_name = %s
+        """, (table_name, coluna))
+        return cursor.fetchone() is not None
+
+def garantir_configuracao_textual(conn):
+    """Cria a configuração full-text 'pt_unaccent' (português + remoção de acentos)
+
+    Usar uma configuração própria mantém to_tsvector(config, texto) IMMUTABLE,
+    o que permite uma coluna gerada; unaccent() direto na expressão não é.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_ts_config WHERE cfgname = %s", (LEXICAL_TS_CONFIG,))
+        if cursor.fetchone():
+            return
+
+        cursor.execute(f"CREATE TEXT SEARCH CONFIGURATION {LEXICAL_TS_CONFIG} (COPY = portuguese)")
+        if extensao_disponivel(conn, 'unaccent'):
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+            cursor.execute(f"""
+                ALTER TEXT SEARCH CONFIGURATION {LEXICAL_TS_CONFIG}
+                ALTER MAPPING FOR hword, hword_part, word
+                WITH unaccent, portuguese_stem
+            """)
+        else:
+            print("⚠️ Extensão unaccent indisponível: busca lexical sensível a acentos")
+
+def garantir_indices_lexicais(conn, table_name="langchain_pg_embedding", trigram=None):
+    """Cria a coluna tsvector gerada, o índice GIN e (opcional) o índice de trigramas"""
+    trigram = LEXICAL_TRIGRAM if trigram is None else trigram
+    garantir_configuracao_textual(conn)
+
+    with conn.cursor() as cursor:
+        if not coluna_existe(conn, table_name, 'document_tsv'):
+            cursor.execute(f"""
+                ALTER TABLE {table_name}
+                ADD COLUMN document_tsv tsvector
+                GENERATED ALWAYS AS (to_tsvector('{LEXICAL_TS_CONFIG}'::regconfig, coalesce(document, ''))) STORED
+            """)
+        cursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS {table_name}_document_tsv_idx
+            ON {table_name} USING gin (document_tsv)
+        """)
+
+        if trigram:
+            if extensao_disponivel(conn, 'pg_trgm'):
+                cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                cursor.execute(f"""
+                    CREATE INDEX IF NOT EXISTS {table_name}_document_trgm_idx
+                    ON {table_name} USING gin (document gin_trgm_ops)
+                """)
+            else:
+                print("⚠️ Extensão pg_trgm indisponível: índice de trigramas não criado")
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Gerencia os índices vetoriais e lexicais de langchain_pg_embedding")
+    parser.add_argument("--tipo", choices=['hnsw', 'ivfflat', 'none'], default=VECTOR_INDEX_TYPE)
+    parser.add_argument("--armazenamento", choices=list(ARMAZENAMENTOS), default=VECTOR_STORAGE,
+                        help="Tipo indexado: vector, halfvec (metade da memória) ou bit (1/32)")
+    parser.add_argument("--tabela", default="langchain_pg_embedding")
+    parser.add_argument("--recriar", action="store_true", help="Remove e recria o índice (ex.: após grandes ingestões no IVFFlat)")
+    parser.add_argument("--trigramas", action="store_true", default=LEXICAL_TRIGRAM,
+                        help="Cria também o índice pg_trgm para buscas por substring")
+    parser.add_argument("--particionar", action="store_true",
+                        help="Converte a tabela em particionada por coleção antes de indexar")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.getenv("DATABASE_URL"))
+    try:
+        if args.particionar:
+            # Uma única transação: a tabela antiga só some se a cópia terminar
+            total = migrar_para_particoes(conn, args.tabela)
+            conn.commit()
+            if total is None:
+                print(f"ℹ️ {args.tabela} já é particionada (ou não existe)")
+            else:
+                print(f"✅ {args.tabela} particionada por coleção: {total} partições")
+        conn.autocommit = True
+        nome = garantir_indice_vetorial(conn, args.tabela, tipo=args.tipo, recriar=args.recriar,
+                                        concorrente=True, armazenamento=args.armazenamento)
+        if nome:
+            print(f"✅ Índice vetorial pronto: {nome}")
+        garantir_indices_lexicais(conn, args.tabela, trigram=args.trigramas)
+        print("✅ Índices lexicais prontos")
+    finally:
+        conn.close()
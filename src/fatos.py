@@ -0,0 +1,287 @@
+import os
+import re
+import unicodedata
+from decimal import Decimal, InvalidOperation
+
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Caminho rápido por fatos estruturados: llm | direto | off
+FACTS_FAST_PATH = os.getenv("FACTS_FAST_PATH", "llm").lower()
+FACTS_TABLE = "rag_empresas"
+
+# Linha do PDF: "Nome da Empresa R$ 1.234.567,89 1999"
+REGEX_LINHA_EMPRESA = re.compile(
+    r'^(?P<nome>\S.*?)\s*R\$\s*(?P<valor>\d[\d.]*,\d{2})\s+(?P<ano>\d{4})\s*$'
+)
+
+NUMEROS_POR_EXTENSO = {
+    'um': 1, 'uma': 1, 'dois': 2, 'duas': 2, 'tres': 3, 'quatro': 4, 'cinco': 5,
+    'seis': 6, 'sete': 7, 'oito': 8, 'nove': 9, 'dez': 10, 'vinte': 20,
+}
+PADRAO_NUMERO = r'(\d+|' + '|'.join(NUMEROS_POR_EXTENSO) + r')'
+ORDINAIS = {
+    'segund': 2, 'terceir': 3, 'quart': 4, 'quint': 5, 'sext': 6,
+    'setim': 7, 'oitav': 8, 'non': 9, 'decim': 10,
+}
+# "segunda maior", "3a mais antiga" (2ª/3º já sem acentos viram 2a/3o)
+PADRAO_ORDINAL = r'\b(?:(' + '|'.join(ORDINAIS) + r')[ao]|(\d{1,2})[ao])\b'
+
+
+def remover_acentos(texto):
+    """Minúsculas sem acentos, para comparações de nomes e termos"""
+    decomposto = unicodedata.normalize('NFKD', texto or "")
+    return ''.join(c for c in decomposto if not unicodedata.combining(c)).lower()
+
+def converter_valor_brasileiro(valor_str):
+    """Converte '1.234.567,89' em Decimal('1234567.89')"""
+    try:
+        return Decimal(valor_str.replace('.', '').replace(',', '.'))
+    except InvalidOperation:
+        return None
+
+def formatar_reais(valor):
+    """Formata um valor no padrão brasileiro: R$ 1.234.567,89"""
+    texto = f"{valor:,.2f}".replace(',', '_').replace('.', ',').replace('_', '.')
+    return f"R$ {texto}"
+
+def extrair_fatos(texto):
+    """Extrai (nome, faturamento, ano de fundação) das linhas de um texto"""
+    for linha in (texto or "").split('\n'):
+        match = REGEX_LINHA_EMPRESA.match(linha.strip())
+        if not match:
+            continue
+        valor = converter_valor_brasileiro(match.group('valor'))
+        if valor is None:
+            continue
+        yield match.group('nome').strip(), valor, int(match.group('ano'))
+
+def coletar_fatos(paginas, fatos):
+    """Repassa as páginas adiante, acumulando os fatos extraídos de cada uma
+
+    A extração é feita por página (e não por chunk) para não duplicar as
+    linhas que caem na sobreposição entre chunks.
+    """
+    for pagina in paginas:
+        fatos.extend(extrair_fatos(pagina.page_content))
+        yield pagina
+
+
+def garantir_tabela_fatos(conn):
+    """Cria a tabela de fatos estruturados e seus índices"""
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {FACTS_TABLE} (
+                id BIGSERIAL PRIMARY KEY,
+                collection_id UUID NOT NULL,
+                source VARCHAR NOT NULL,
+                nome VARCHAR NOT NULL,
+                nome_normalizado VARCHAR NOT NULL,
+                faturamento NUMERIC(18, 2) NOT NULL,
+                ano_fundacao INTEGER NOT NULL
+            )
+        """)
+        # Consultas sempre filtradas por coleção: ranking direto pelo índice composto
+        cursor.execute(f"DROP INDEX IF EXISTS {FACTS_TABLE}_faturamento_idx")
+        cursor.execute(f"DROP INDEX IF EXISTS {FACTS_TABLE}_ano_idx")
+        cursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS {FACTS_TABLE}_colecao_faturamento_idx
+            ON {FACTS_TABLE} (collection_id, faturamento)
+        """)
+        cursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS {FACTS_TABLE}_colecao_ano_idx
+            ON {FACTS_TABLE} (collection_id, ano_fundacao)
+        """)
+        cursor.execute(f"""
+            CREATE INDEX IF NOT EXISTS {FACTS_TABLE}_source_idx
+            ON {FACTS_TABLE} (collection_id, source)
+        """)
+
+def gravar_fatos(conn, collection_id, source, fatos):
+    """Substitui os fatos da fonte pelos recém-extraídos (na transação corrente)"""
+    unicos = {}
+    for nome, faturamento, ano in fatos:
+        unicos[nome] = (nome, faturamento, ano)
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {FACTS_TABLE} WHERE collection_id = %s AND source = %s",
+            (collection_id, source)
+        )
+        if unicos:
+            execute_values(cursor, f"""
+                INSERT INTO {FACTS_TABLE}
+                    (collection_id, source, nome, nome_normalizado, faturamento, ano_fundacao)
+                VALUES %s
+            """, [
+                (collection_id, source, nome, remover_acentos(nome), faturamento, ano)
+                for nome, faturamento, ano in unicos.values()
+            ])
+    return len(unicos)
+
+
+def _numero(token):
+    if token.isdigit():
+        return int(token)
+    return NUMEROS_POR_EXTENSO.get(token)
+
+def classificar_pergunta(pergunta):
+    """Identifica perguntas de ranking ou contagem respondíveis pela tabela de fatos
+
+    Retorna um dict descrevendo a consulta ou None quando a pergunta não se
+    encaixa (e segue pelo fluxo normal de busca + LLM).
+    """
+    texto = remover_acentos(pergunta)
+
+    # Contagem: "Quantas empresas têm 'X' no nome?", "Quantas empresas foram fundadas em 1990?"
+    if re.search(r'\bquant[ao]s\b', texto) and 'empresa' in texto:
+        aspas = re.findall(r"['\"“”‘’]([^'\"“”‘’]+)['\"“”‘’]", texto)
+        if aspas and 'nome' in texto:
+            return {'tipo': 'contagem', 'termo': aspas[0].strip()}
+        match = re.search(r'\b(?:tem|possuem|contem|com)\s+(?:a palavra\s+|o termo\s+)?(\w+)\s+no nome', texto)
+        if match:
+            return {'tipo': 'contagem', 'termo': match.group(1)}
+        match = re.search(r'fundadas?\s+(em|antes de|depois de|apos)\s+(\d{4})', texto)
+        if match:
+            operador = {'em': '=', 'antes de': '<', 'depois de': '>', 'apos': '>'}[match.group(1)]
+            return {'tipo': 'contagem', 'ano': int(match.group(2)), 'operador': operador}
+        return None
+
+    # Filtros adicionais não são suportados pelo caminho rápido
+    if re.search(r'\b(acima|abaixo|entre|superior|inferior|exceto|alem|setor)\b|\b\d{4}\b', texto):
+        return None
+
+    # Ranking por faturamento ou por ano de fundação
+    sinais_fundacao = re.search(r'\b(antiga|antigas|recente|recentes|nova|novas|fundad)', texto)
+    if re.search(r'\bfatur|\breceita', texto):
+        if sinais_fundacao:
+            return None
+        campo = 'faturamento'
+        if re.search(r'\b(maior|maiores|maximo|mais)\b', texto):
+            ordem = 'desc'
+        elif re.search(r'\b(menor|menores|minimo|menos)\b', texto):
+            ordem = 'asc'
+        else:
+            return None
+    elif sinais_fundacao:
+        campo = 'ano_fundacao'
+        if re.search(r'\b(antiga|antigas|primeira|primeiras)\b', texto):
+            ordem = 'asc'
+        elif re.search(r'\b(recente|recentes|nova|novas|ultima|ultimas)\b', texto):
+            ordem = 'desc'
+        else:
+            return None
+    else:
+        return None
+
+    match = (re.search(r'\btop\s+' + PADRAO_NUMERO + r'\b', texto)
+             or re.search(r'\b' + PADRAO_NUMERO + r'\s+(?:empresas|maiores|menores|primeiras)\b', texto))
+    ordinal = re.search(PADRAO_ORDINAL, texto)
+    posicao = None
+    if match:
+        n = _numero(match.group(1))
+    elif ordinal:
+        # "segunda maior": o ranking até a posição pedida, respondido pela última linha
+        posicao = ORDINAIS[ordinal.group(1)] if ordinal.group(1) else int(ordinal.group(2))
+        if not 1 <= posicao <= 100:
+            return None
+        n = posicao
+    elif re.search(r'\b(quais|liste|listar|ranking)\b', texto):
+        n = 10
+    else:
+        n = 1
+    consulta = {'tipo': 'ranking', 'campo': campo, 'ordem': ordem, 'n': max(1, min(n or 1, 100))}
+    if posicao:
+        consulta['posicao'] = posicao
+    return consulta
+
+
+def consultar_fatos(conn, consulta, collection_ids):
+    """Executa a consulta classificada na tabela de fatos, só nas coleções indicadas
+
+    Retorna as linhas encontradas (uma contagem pode dar zero) ou None quando
+    as coleções não têm fatos extraídos, caso em que a pergunta segue pela busca.
+    """
+    colecoes = list(collection_ids)
+    with conn.cursor() as cursor:
+        if consulta['tipo'] == 'ranking':
+            direcao = 'DESC' if consulta['ordem'] == 'desc' else 'ASC'
+            cursor.execute(f"""
+                SELECT nome, faturamento, ano_fundacao
+                FROM {FACTS_TABLE}
+                WHERE collection_id = ANY(%s::uuid[])
+                ORDER BY {consulta['campo']} {direcao}, nome
+                LIMIT %s
+            """, (colecoes, consulta['n']))
+            return cursor.fetchall() or None
+
+        if 'termo' in consulta:
+            cursor.execute(f"""
+                SELECT nome, faturamento, ano_fundacao
+                FROM {FACTS_TABLE}
+                WHERE collection_id = ANY(%s::uuid[]) AND nome_normalizado LIKE %s ESCAPE '\\'
+                ORDER BY nome
+            """, (colecoes, padrao_like(remover_acentos(consulta['termo']))))
+        else:
+            cursor.execute(f"""
+                SELECT nome, faturamento, ano_fundacao
+                FROM {FACTS_TABLE}
+                WHERE collection_id = ANY(%s::uuid[]) AND ano_fundacao {consulta['operador']} %s
+                ORDER BY nome
+            """, (colecoes, consulta['ano']))
+        linhas = cursor.fetchall()
+        if not linhas:
+            # Zero é resposta só se houver fatos nas coleções
+            cursor.execute(
+                f"SELECT EXISTS (SELECT 1 FROM {FACTS_TABLE} WHERE collection_id = ANY(%s::uuid[]))",
+                (colecoes,)
+            )
+            if not cursor.fetchone()[0]:
+                return None
+        return linhas
+
+def padrao_like(termo):
+    """Padrão LIKE que encontra o termo literalmente (%, _ e \\ escapados)"""
+    escapado = termo.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f"%{escapado}%"
+
+def _linha_fato(nome, faturamento, ano):
+    return f"{nome} {formatar_reais(faturamento)} (fundada em {ano})"
+
+def formatar_contexto_fatos(consulta, linhas):
+    """Resultado compacto e pré-calculado para o prompt do LLM"""
+    if consulta['tipo'] == 'ranking':
+        criterio = 'FATURAMENTO' if consulta['campo'] == 'faturamento' else 'ANO DE FUNDAÇÃO'
+        sentido = 'DECRESCENTE' if consulta['ordem'] == 'desc' else 'CRESCENTE'
+        # A consulta tem LIMIT n: só é a tabela inteira quando vieram menos linhas que n
+        alcance = (f"TABELA COMPLETA ({len(linhas)} empresas)" if len(linhas) < consulta['n']
+                   else f"TOP {consulta['n']}")
+        cabecalho = f"=== EMPRESAS ORDENADAS POR {criterio} ({sentido}) — {alcance} ==="
+        corpo = "\n".join(f"#{i} - {_linha_fato(*linha)}" for i, linha in enumerate(linhas, 1))
+        if consulta.get('posicao'):
+            corpo += f"\n\nPosição pedida na pergunta: #{consulta['posicao']}"
+        return f"{cabecalho}\n\n{corpo}"
+
+    cabecalho = f"=== CONTAGEM PRÉ-CALCULADA: {len(linhas)} empresas ==="
+    corpo = "\n".join(_linha_fato(*linha) for linha in linhas)
+    return f"{cabecalho}\n\n{corpo}"
+
+def formatar_resposta_fatos(consulta, linhas):
+    """Resposta final montada direto do SQL, sem LLM"""
+    if consulta['tipo'] == 'contagem':
+        return f"{len(linhas)} empresas"
+    if consulta.get('posicao'):
+        if len(linhas) < consulta['posicao']:
+            return f"Há apenas {len(linhas)} empresas no ranking"
+        nome, faturamento, ano = linhas[consulta['posicao'] - 1]
+        detalhe = formatar_reais(faturamento) if consulta['campo'] == 'faturamento' else f"fundada em {ano}"
+        return f"{consulta['posicao']}ª: {nome} ({detalhe})"
+    if consulta['n'] == 1 and linhas:
+        nome, faturamento, ano = linhas[0]
+        detalhe = formatar_reais(faturamento) if consulta['campo'] == 'faturamento' else f"fundada em {ano}"
+        return f"{nome} ({detalhe})"
+    return "\n".join(
+        f"{i}. {nome} - {formatar_reais(faturamento) if consulta['campo'] == 'faturamento' else ano}"
+        for i, (nome, faturamento, ano) in enumerate(linhas, 1)
+    )
@@ -0,0 +1,387 @@
+import os
+import re
+import json
+import shutil
+import argparse
+import unicodedata
+from datetime import datetime
+
+import numpy as np
+import psycopg2
+from dotenv import load_dotenv
+
+from db import (
+    garantir_tabelas, obter_colecao, detectar_dimensao, obter_versao_corpus,
+    registrar_versao_corpus, garantir_indice_vetorial, garantir_indices_lexicais,
+    garantir_particao, remover_indices_vetoriais, TODAS_COLECOES
+)
+
+load_dotenv()
+
+# Backend da busca vetorial: postgres | memmap
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "postgres")
+# Diretório do índice local (memmap) exportado do PostgreSQL
+VECTOR_LOCAL_PATH = os.getenv("VECTOR_LOCAL_PATH", ".indice")
+# Precisão dos vetores no disco: float32 | float16 (metade do espaço, recall quase igual)
+VECTOR_LOCAL_DTYPE = os.getenv("VECTOR_LOCAL_DTYPE", "float32")
+# Linhas convertidas para float32 por vez na busca sobre float16
+VECTOR_LOCAL_BLOCK = int(os.getenv("VECTOR_LOCAL_BLOCK", "8192"))
+
+"""
+ÍNDICE VETORIAL LOCAL (NumPy memory-mapped):
+
+Alternativa ao PostgreSQL para corpora pequenos e médios: os embeddings ficam
+em uma matriz .npy aberta com mmap (abrir não copia nada para a memória) e a
+busca é um produto matricial + argpartition no próprio processo, sem ida à rede.
+
+Arquivos no diretório do índice:
+
+  - manifesto.json: dimensão, dtype, versão do corpus, coleções e contagem
+  - vetores.npy: matriz (n, dim) em float32 ou float16, como estava no banco
+  - inv_normas.npy: 1/‖v‖ de cada linha (cosseno sem normalizar a matriz)
+  - colecoes.npy: índice da coleção de cada linha (em manifesto['colecoes']);
+    as linhas de cada coleção são contíguas, e a busca restrita a algumas
+    coleções só lê as faixas delas
+  - textos.bin + offsets.npy: documentos em UTF-8 concatenados e seus limites
+  - chunks.jsonl: id e metadata de cada chunk (usado na importação)
+
+A distância retornada é a mesma do operador <=> do pgvector (1 - cosseno).
+A busca lexical local procura os termos em um texto normalizado (minúsculas,
+sem acentos) e ordena pelos termos encontrados: equivale ao fallback LIKE.
+
+Exportar do PostgreSQL / importar de volta:
+  python src/indice_local.py exportar --saida .indice --dtype float16
+  python src/indice_local.py importar --entrada .indice
+  python src/indice_local.py info
+"""
+
+ARQUIVOS = ("manifesto.json", "vetores.npy", "inv_normas.npy", "colecoes.npy",
+            "textos.bin", "offsets.npy", "chunks.jsonl")
+SEPARADOR = "\x00"
+# float16 → float32 por tabela (np.take): bem mais rápido que astype sem F16C
+_FLOAT16_PARA_FLOAT32 = np.arange(65536, dtype=np.uint16).view(np.float16).astype(np.float32)
+
+
+def normalizar_lexical(texto):
+    """Minúsculas sem acentos, preservando o resto do texto"""
+    texto = unicodedata.normalize('NFKD', texto.lower())
+    return "".join(c for c in texto if not unicodedata.combining(c))
+
+
+class IndiceMemmap:
+    """Índice vetorial somente leitura sobre arquivos .npy mapeados em memória"""
+
+    def __init__(self, caminho=VECTOR_LOCAL_PATH):
+        self.caminho = caminho
+        with open(os.path.join(caminho, "manifesto.json"), encoding="utf-8") as arquivo:
+            self.manifesto = json.load(arquivo)
+        self.dim = self.manifesto["dim"]
+        self.total = self.manifesto["total"]
+        self.versao = self.manifesto.get("versao")
+        self.colecoes = self.manifesto.get("colecoes", [])
+
+        self.vetores = np.load(os.path.join(caminho, "vetores.npy"), mmap_mode="r")
+        self.inv_normas = np.load(os.path.join(caminho, "inv_normas.npy"), mmap_mode="r")
+        self.colecao_linha = np.load(os.path.join(caminho, "colecoes.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(caminho, "offsets.npy"), mmap_mode="r")
+        caminho_textos = os.path.join(caminho, "textos.bin")
+        self.textos = (np.memmap(caminho_textos, dtype=np.uint8, mode="r")
+                       if os.path.getsize(caminho_textos) else np.zeros(0, dtype=np.uint8))
+        with open(os.path.join(caminho, "chunks.jsonl"), encoding="utf-8") as arquivo:
+            self.ids = [json.loads(linha)["id"] for linha in arquivo]
+        self._posicoes = None
+        self._lexical = None
+        self._faixas = None
+
+    def documento(self, linha):
+        inicio, fim = self.offsets[linha], self.offsets[linha + 1]
+        return self.textos[inicio:fim].tobytes().decode("utf-8")
+
+    def faixas(self, colecoes=None):
+        """Intervalos [início, fim) das linhas das coleções (None ou '*' = todas)"""
+        if colecoes is None or TODAS_COLECOES in colecoes:
+            return [(0, self.total)]
+        if self._faixas is None:
+            # Sequências de linhas da mesma coleção (uma por coleção nas exportações atuais)
+            mudancas = (np.flatnonzero(np.diff(self.colecao_linha)) + 1).tolist()
+            faixas = {}
+            for inicio, fim in zip([0] + mudancas, mudancas + [self.total]):
+                if fim > inicio:
+                    nome = self.colecoes[self.colecao_linha[inicio]]
+                    faixas.setdefault(nome, []).append((inicio, fim))
+            self._faixas = faixas
+        return sorted(faixa for nome in colecoes for faixa in self._faixas.get(nome, []))
+
+    def similaridades(self, vetor, inicio=0, fim=None):
+        """Cosseno da consulta contra as linhas [inicio, fim)"""
+        fim = self.total if fim is None else fim
+        consulta = np.asarray(vetor, dtype=np.float32)
+        norma = float(np.linalg.norm(consulta))
+        if norma == 0 or fim <= inicio:
+            return np.zeros(max(fim - inicio, 0), dtype=np.float32)
+        if self.vetores.dtype == np.float32:
+            produtos = self.vetores[inicio:fim] @ consulta
+        else:
+            # float16 não tem BLAS: converte em blocos para limitar a memória
+            produtos = np.empty(fim - inicio, dtype=np.float32)
+            for bloco_inicio in range(inicio, fim, VECTOR_LOCAL_BLOCK):
+                bloco = self.vetores[bloco_inicio:min(bloco_inicio + VECTOR_LOCAL_BLOCK, fim)].view(np.uint16)
+                posicao = bloco_inicio - inicio
+                produtos[posicao:posicao + len(bloco)] = np.take(_FLOAT16_PARA_FLOAT32, bloco) @ consulta
+        return produtos * self.inv_normas[inicio:fim] / norma
+
+    def buscar(self, vetor, k, colecoes=None, vetores=False):
+        """[(id, documento, distância)] dos k vizinhos mais próximos (busca exata)
+
+        Com `colecoes`, só as linhas dessas coleções são comparadas; com
+        `vetores`, cada linha traz também o embedding armazenado.
+        """
+        faixas = self.faixas(colecoes)
+        if len(faixas) == 1:
+            inicio, fim = faixas[0]
+            similaridades = self.similaridades(vetor, inicio, fim)
+            linhas = None
+        else:
+            similaridades = np.concatenate(
+                [self.similaridades(vetor, inicio, fim) for inicio, fim in faixas] or [np.zeros(0, np.float32)]
+            )
+            linhas = np.concatenate(
+                [np.arange(inicio, fim) for inicio, fim in faixas] or [np.zeros(0, np.int64)]
+            )
+        k = min(k, len(similaridades))
+        if k <= 0:
+            return []
+        melhores = np.argpartition(-similaridades, k - 1)[:k]
+        melhores = melhores[np.argsort(-similaridades[melhores], kind="stable")]
+        posicoes = melhores + inicio if linhas is None else linhas[melhores]
+        if vetores:
+            return [
+                (self.ids[linha], self.documento(linha), float(1.0 - similaridades[posicao]),
+                 np.asarray(self.vetores[linha], dtype=np.float32))
+                for linha, posicao in zip(posicoes.tolist(), melhores.tolist())
+            ]
+        return [
+            (self.ids[linha], self.documento(linha), float(1.0 - similaridades[posicao]))
+            for linha, posicao in zip(posicoes.tolist(), melhores.tolist())
+        ]
+
+    def _texto_lexical(self):
+        # Construído na primeira busca lexical: um texto único e os limites de cada chunk
+        if self._lexical is None:
+            partes = [normalizar_lexical(self.documento(linha)) for linha in range(self.total)]
+            limites = np.zeros(self.total + 1, dtype=np.int64)
+            np.cumsum([len(parte) + 1 for parte in partes], out=limites[1:])
+            self._lexical = (SEPARADOR.join(partes), limites)
+        return self._lexical
+
+    def candidatos_lexicais(self, termos, k, colecoes=None):
+        """[(id, documento, rank)] dos chunks com mais termos encontrados (nas coleções pedidas)"""
+        termos = list(dict.fromkeys(normalizar_lexical(t).strip() for t in termos if t.strip()))
+        if not termos or not self.total:
+            return []
+        texto, limites = self._texto_lexical()
+        encontrados = np.zeros(self.total, dtype=np.int32)
+        ocorrencias = np.zeros(self.total, dtype=np.int32)
+        for termo in termos:
+            posicoes = np.fromiter((m.start() for m in re.finditer(re.escape(termo), texto)), dtype=np.int64)
+            if not len(posicoes):
+                continue
+            linhas = np.searchsorted(limites, posicoes, side="right") - 1
+            np.add.at(ocorrencias, linhas, 1)
+            encontrados[np.unique(linhas)] += 1
+        if colecoes is not None and TODAS_COLECOES not in colecoes:
+            permitidas = np.zeros(self.total, dtype=bool)
+            for inicio, fim in self.faixas(colecoes):
+                permitidas[inicio:fim] = True
+            encontrados[~permitidas] = 0
+        candidatos = np.flatnonzero(encontrados)
+        # Mais termos distintos primeiro; empate pelo total de ocorrências
+        ordem = candidatos[np.lexsort((-ocorrencias[candidatos], -encontrados[candidatos]))][:k]
+        return [(self.ids[linha], self.documento(linha), float(encontrados[linha])) for linha in ordem]
+
+    def vetores_por_id(self, ids):
+        """Embeddings armazenados (id -> np.ndarray float32)"""
+        if self._posicoes is None:
+            self._posicoes = {chunk_id: linha for linha, chunk_id in enumerate(self.ids)}
+        return {
+            chunk_id: np.asarray(self.vetores[self._posicoes[chunk_id]], dtype=np.float32)
+            for chunk_id in ids if chunk_id in self._posicoes
+        }
+
+    def chunks(self):
+        """(id, coleção, vetor, documento, metadata) de cada linha, em ordem"""
+        with open(os.path.join(self.caminho, "chunks.jsonl"), encoding="utf-8") as arquivo:
+            for linha, registro in enumerate(map(json.loads, arquivo)):
+                yield (registro["id"], self.colecoes[self.colecao_linha[linha]],
+                       np.asarray(self.vetores[linha], dtype=np.float32).tolist(),
+                       self.documento(linha), registro.get("metadata") or {})
+
+
+def _trocar_diretorio(temporario, destino):
+    """Substitui o índice de uma vez: leitores nunca veem um índice pela metade"""
+    antigo = f"{destino}.antigo"
+    if os.path.exists(antigo):
+        shutil.rmtree(antigo)
+    if os.path.exists(destino):
+        os.replace(destino, antigo)
+    os.replace(temporario, destino)
+    if os.path.exists(antigo):
+        shutil.rmtree(antigo)
+
+def exportar(conn, destino=VECTOR_LOCAL_PATH, table_name="langchain_pg_embedding", colecoes=None,
+             dtype=VECTOR_LOCAL_DTYPE, lote=2000):
+    """Grava as linhas da tabela (opcionalmente só de algumas coleções) como índice local"""
+    dtype = np.dtype(dtype)
+    filtro, parametros = "", ()
+    if colecoes:
+        filtro, parametros = "WHERE c.name = ANY(%s)", (list(colecoes),)
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT count(*) FROM {table_name} e
+            JOIN langchain_pg_collection c ON c.uuid = e.collection_id {filtro}
+        """, parametros)
+        total = cursor.fetchone()[0]
+    dim = detectar_dimensao(conn, table_name) or 0
+    versao = obter_versao_corpus(conn)
+
+    temporario = f"{destino}.tmp"
+    if os.path.exists(temporario):
+        shutil.rmtree(temporario)
+    os.makedirs(temporario)
+    vetores = np.lib.format.open_memmap(os.path.join(temporario, "vetores.npy"), mode="w+",
+                                        dtype=dtype, shape=(total, dim))
+    inv_normas = np.zeros(total, dtype=np.float32)
+    colecao_linha = np.zeros(total, dtype=np.int32)
+    offsets = np.zeros(total + 1, dtype=np.int64)
+    nomes_colecoes = []
+
+    # Cursor nomeado: as linhas chegam em lotes, sem carregar a tabela inteira
+    cursor = conn.cursor(name="exportar_indice_local")
+    cursor.itersize = lote
+    cursor.execute(f"""
+        SELECT e.id, c.name, e.embedding::real[], e.document, e.cmetadata
+        FROM {table_name} e
+        JOIN langchain_pg_collection c ON c.uuid = e.collection_id {filtro}
+        ORDER BY c.name, e.id
+    """, parametros)
+    linha = 0
+    with open(os.path.join(temporario, "textos.bin"), "wb") as textos, \
+            open(os.path.join(temporario, "chunks.jsonl"), "w", encoding="utf-8") as chunks:
+        for chunk_id, colecao, vetor, documento, metadata in cursor:
+            if linha >= total:
+                break
+            vetores[linha] = vetor
+            # Norma do vetor como ficou armazenado (em float16 difere um pouco do original)
+            norma = float(np.linalg.norm(vetores[linha].astype(np.float32)))
+            inv_normas[linha] = 1.0 / norma if norma else 0.0
+            if colecao not in nomes_colecoes:
+                nomes_colecoes.append(colecao)
+            colecao_linha[linha] = nomes_colecoes.index(colecao)
+            dados = (documento or "").encode("utf-8")
+            textos.write(dados)
+            offsets[linha + 1] = offsets[linha] + len(dados)
+            chunks.write(json.dumps({"id": chunk_id, "metadata": metadata}, ensure_ascii=False) + "\n")
+            linha += 1
+    cursor.close()
+    vetores.flush()
+    del vetores
+
+    np.save(os.path.join(temporario, "inv_normas.npy"), inv_normas[:linha])
+    np.save(os.path.join(temporario, "colecoes.npy"), colecao_linha[:linha])
+    np.save(os.path.join(temporario, "offsets.npy"), offsets[:linha + 1])
+    with open(os.path.join(temporario, "manifesto.json"), "w", encoding="utf-8") as arquivo:
+        json.dump({
+            "dim": dim, "dtype": dtype.name, "total": linha, "versao": versao,
+            "colecoes": nomes_colecoes, "tabela": table_name,
+            "exportado_em": datetime.now().isoformat(timespec="seconds"),
+        }, arquivo, ensure_ascii=False, indent=2)
+    _trocar_diretorio(temporario, destino)
+    return linha
+
+def importar(conn, origem=VECTOR_LOCAL_PATH, table_name="langchain_pg_embedding"):
+    """Carrega o índice local no PostgreSQL (substitui chunks com o mesmo id) via COPY binário
+
+    Recusa um índice cuja dimensão difere da já armazenada na tabela (outro
+    modelo ou EMBEDDING_TRUNCATE_DIM), como a ingestão.
+    """
+    from ingest import LeitorFluxo, COPY_HEADER, COPY_TRAILER, linha_copy
+
+    indice = IndiceMemmap(origem)
+    garantir_tabelas(conn, table_name)
+    dim_armazenada = detectar_dimensao(conn, table_name)
+    # Todas as linhas do .npy têm a dimensão do manifesto: basta comparar antes de escrever
+    if dim_armazenada and indice.dim != dim_armazenada:
+        raise ValueError(
+            f"índice local com {indice.dim} dimensões, mas a tabela guarda {dim_armazenada}: "
+            f"exporte de novo com o modelo atual ou importe em uma tabela vazia"
+        )
+    if dim_armazenada is None:
+        # Tabela vazia: o índice da dimensão antiga barraria o COPY; é recriado ao final
+        remover_indices_vetoriais(conn, table_name)
+    garantir_indices_lexicais(conn, table_name)
+    ids_colecoes = {nome: obter_colecao(conn, nome) for nome in indice.colecoes}
+    for collection_id in ids_colecoes.values():
+        garantir_particao(conn, table_name, collection_id)
+
+    def gerar():
+        yield COPY_HEADER
+        for chunk_id, colecao, vetor, documento, metadata in indice.chunks():
+            yield linha_copy(chunk_id, ids_colecoes[colecao], vetor, documento, metadata)
+        yield COPY_TRAILER
+
+    with conn.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table_name} WHERE collection_id = ANY(%s::uuid[]) AND id = ANY(%s)",
+                       (list(ids_colecoes.values()), indice.ids))
+        cursor.copy_expert(
+            f"COPY {table_name} (id, collection_id, embedding, document, cmetadata) "
+            f"FROM STDIN WITH (FORMAT binary)",
+            LeitorFluxo(gerar())
+        )
+    for collection_id in ids_colecoes.values():
+        registrar_versao_corpus(conn, collection_id)
+    garantir_indice_vetorial(conn, table_name)
+    return indice.total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta/importa o índice vetorial local (memmap)")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    exportacao = subparsers.add_parser("exportar", help="PostgreSQL → índice local")
+    exportacao.add_argument("--saida", default=VECTOR_LOCAL_PATH)
+    exportacao.add_argument("--dtype", choices=["float32", "float16"], default=VECTOR_LOCAL_DTYPE)
+    exportacao.add_argument("--colecao", action="append", help="Exporta só esta coleção (pode repetir)")
+    exportacao.add_argument("--tabela", default="langchain_pg_embedding")
+
+    importacao = subparsers.add_parser("importar", help="Índice local → PostgreSQL")
+    importacao.add_argument("--entrada", default=VECTOR_LOCAL_PATH)
+    importacao.add_argument("--tabela", default="langchain_pg_embedding")
+
+    informacao = subparsers.add_parser("info", help="Mostra o manifesto do índice local")
+    informacao.add_argument("--entrada", default=VECTOR_LOCAL_PATH)
+    args = parser.parse_args()
+
+    if args.comando == "info":
+        indice = IndiceMemmap(args.entrada)
+        tamanho = sum(os.path.getsize(os.path.join(args.entrada, nome)) for nome in ARQUIVOS)
+        print(json.dumps(indice.manifesto, ensure_ascii=False, indent=2))
+        print(f"💾 {tamanho / 1024 / 1024:.1f} MiB em {args.entrada}")
+        return
+
+    conn = psycopg2.connect(os.getenv("DATABASE_URL"))
+    try:
+        if args.comando == "exportar":
+            total = exportar(conn, args.saida, args.tabela, args.colecao, args.dtype)
+            print(f"✅ {total} chunks exportados para {args.saida} ({args.dtype})")
+        else:
+            total = importar(conn, args.entrada, args.tabela)
+            conn.commit()
+            print(f"✅ {total} chunks importados em {args.tabela}")
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Erro: {e}")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
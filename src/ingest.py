@@ -1,95 +1,360 @@
-from search import search_prompt_hibrido
-from llm_handler import LLMHandler
+import os
+import io
+import json
+import time
+import uuid
+import struct
+import hashlib
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-def main():
-    print("🤖 Sistema de Chat - Desafio MBA IA - RAG com Documentos PDF")
-    print("Digite suas perguntas ou 'sair' para encerrar")
-    print("=" * 50)
-    
-    # Inicializar LLMHandler
-    print("🔧 Inicializando sistema...")
-    llm_handler = LLMHandler()
-    
-    if not llm_handler.is_available():
-        print("❌ Não foi possível iniciar o chat. Nenhum modelo LLM disponível.")
-        print("Certifique-se de que:")
-        print("- Pelo menos uma API key está configurada (OpenAI ou Google)")
-        print("- As variáveis de ambiente estão corretas no .env")
-        return
-   
-    # Testar inicialização do sistema de busca
-    chain = search_prompt_hibrido(llm_handler=llm_handler)
-  
-    if not chain:
-        print("❌ Não foi possível iniciar o sistema de busca.")
-        print("Certifique-se de que:")
-        print("- O banco PostgreSQL está rodando")
-        print("- A ingestão foi executada com sucesso")
-        print("- As variáveis de ambiente estão configuradas")
-        return
-    
-    print("✅ Sistema pronto! Faça suas perguntas sobre o PDF.")
-    print(f"🤖 Modelo ativo: {llm_handler.get_model_display_name()}")
-    print("\n💡 COMANDOS ESPECIAIS:")
-    print("  'modelo' - Ver modelo atual")
-    print("  'modelos' - Listar todos os modelos")
-    print("  'trocar' - Trocar modelo interativamente")
-    print("  'status' - Ver status completo")
-    print("=" * 50)
-    
-    while True:
-        try:
-            # Solicitar pergunta  
-            pergunta = input("\nFaça sua pergunta: ").strip()
-            
-            # Comandos para sair
-            if pergunta.lower() in ['sair', 'exit', 'quit', 'bye']:
-                print("\n👋 Chat encerrado!")
-                break
-                
-            # Comandos especiais
-            if pergunta.lower() == 'modelo':
-                print(f"🤖 Modelo atual: {llm_handler.get_model_display_name()}")
-                continue
-                
-            if pergunta.lower() in ['modelos', 'lista']:
-                llm_handler.list_models()
-                continue
-                
-            if pergunta.lower() in ['trocar', 'switch', 'mudar']:
-                llm_handler.select_model_interactive()
-                continue
-                
-            if pergunta.lower() == 'status':
-                info = llm_handler.get_model_info()
-                print(f"🤖 Modelo atual: {info['current_display']}")
-                print(f"📊 Modelos disponíveis: {', '.join(info['available_display'])}")
-                print(f"📈 Total de modelos: {info['total']}")
-                continue
-                
-            # Ignorar entradas vazias
-            if not pergunta:
+import psycopg2
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from search import get_embeddings, limpar_texto
+from db import (
+    garantir_tabelas, obter_colecao, garantir_indice_vetorial, garantir_indices_lexicais,
+    registrar_versao_corpus, detectar_dimensao, remover_indices_vetoriais, garantir_particao,
+    PG_VECTOR_COLLECTION_NAME
+)
+from fatos import coletar_fatos, garantir_tabela_fatos, gravar_fatos
+
+load_dotenv()
+
+# Configuração da ingestão
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "150"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+
+# Formato binário do COPY do PostgreSQL
+COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+COPY_TRAILER = struct.pack("!h", -1)
+
+
+class MetricasIngestao:
+    """Contadores de throughput da ingestão"""
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.paginas = 0
+        self.chunks = 0
+        self.embeddings = 0
+        self.inalterados = 0
+        self.atualizados = 0
+        self.removidos = 0
+        self.fatos = 0
+        self._ultimo_progresso = self.inicio
+
+    def decorrido(self):
+        return time.perf_counter() - self.inicio
+
+    def chunks_por_segundo(self):
+        return self.chunks / max(self.decorrido(), 1e-9)
+
+    def embeddings_por_segundo(self):
+        return self.embeddings / max(self.decorrido(), 1e-9)
+
+    def progresso(self, intervalo=5.0):
+        """Exibe o progresso no máximo uma vez a cada 'intervalo' segundos"""
+        agora = time.perf_counter()
+        if agora - self._ultimo_progresso >= intervalo:
+            self._ultimo_progresso = agora
+            print(f"   ⏳ {self.resumo()}")
+
+    def resumo(self):
+        return (f"{self.paginas} páginas, {self.chunks} chunks, {self.embeddings} embeddings "
+                f"em {self.decorrido():.1f}s | {self.chunks_por_segundo():.1f} chunks/s | "
+                f"{self.embeddings_por_segundo():.1f} embeddings/s")
+
+    def resumo_incremental(self):
+        return (f"{self.embeddings} novos, {self.inalterados} inalterados, "
+                f"{self.atualizados} com metadados atualizados, {self.removidos} removidos")
+
+
+def carregar_paginas(pdf_path, metricas):
+    """Extrai as páginas do PDF sob demanda (uma por vez)"""
+    for pagina in PyPDFLoader(pdf_path).lazy_load():
+        metricas.paginas += 1
+        yield pagina
+
+def hash_conteudo(texto):
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+def dividir_em_chunks(paginas, splitter, metricas, collection_id, source):
+    """Divide cada página em chunks à medida que as páginas chegam
+
+    Cada chunk recebe o hash do conteúdo e um id determinístico derivado de
+    (coleção, fonte, hash, ocorrência), estável entre re-ingestões.
+    """
+    ocorrencias = {}
+    for pagina in paginas:
+        for indice, chunk in enumerate(splitter.split_documents([pagina])):
+            texto = limpar_texto(chunk.page_content)
+            if not texto.strip():
                 continue
-                
-            # Processar pergunta
-            print(f"\nPERGUNTA: {pergunta}")
-            print(f"🤖 Usando: {llm_handler.get_model_display_name()}")
-            
-            resposta = search_prompt_hibrido(pergunta, llm_handler=llm_handler)
-
-            if resposta:
-                print(f"RESPOSTA: {resposta}")
-            else:
-                print("RESPOSTA: Erro ao processar sua pergunta.")
-            
-            print("\n---")
-            
-        except KeyboardInterrupt:
-            print("\n\n👋 Chat encerrado!")
-            break
-        except Exception as e:
-            print(f"❌ Erro: {e}")
-            print("Tente novamente ou digite 'sair' para encerrar.")
+            content_hash = hash_conteudo(texto)
+            ocorrencia = ocorrencias.get(content_hash, 0)
+            ocorrencias[content_hash] = ocorrencia + 1
+
+            chunk.page_content = texto
+            chunk.id = hash_conteudo(f"{collection_id}:{source}:{content_hash}:{ocorrencia}")[:32]
+            chunk.metadata = {
+                "source": source,
+                "page": chunk.metadata.get("page"),
+                "chunk": indice,
+                "content_hash": content_hash,
+            }
+            metricas.chunks += 1
+            yield chunk
+
+def filtrar_novos(chunks, existentes, vistos, atualizacoes, metricas):
+    """Deixa passar apenas chunks ainda não armazenados
+
+    Chunks já existentes não são re-embeddados; se apenas a posição mudou
+    (página/ordem), o novo metadata é registrado em 'atualizacoes'.
+    """
+    for chunk in chunks:
+        vistos.add(chunk.id)
+        metadata_atual = existentes.get(chunk.id)
+        if metadata_atual is None:
+            yield chunk
+            continue
+        metricas.inalterados += 1
+        if metadata_atual != chunk.metadata:
+            atualizacoes.append((chunk.id, json.dumps(chunk.metadata, ensure_ascii=False)))
+
+def carregar_existentes(conn, table_name, collection_id, fontes):
+    """Chunks já armazenados para a fonte: id → metadata"""
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT id, cmetadata FROM {table_name}
+            WHERE collection_id = %s AND cmetadata->>'source' = ANY(%s)
+        """, (collection_id, fontes))
+        return dict(cursor.fetchall())
+
+def em_lotes(itens, tamanho):
+    """Agrupa um iterável em listas de até 'tamanho' elementos"""
+    lote = []
+    for item in itens:
+        lote.append(item)
+        if len(lote) >= tamanho:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+def gerar_embeddings(lotes, embeddings, concorrencia, metricas):
+    """Gera embeddings por lote com no máximo 'concorrencia' chamadas em voo
+
+    A ordem dos lotes é preservada e só 'concorrencia' lotes ficam em memória,
+    mantendo o consumo constante mesmo para PDFs com milhares de páginas.
+    """
+    def embeddar(lote):
+        return lote, embeddings.embed_documents([chunk.page_content for chunk in lote])
+
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        em_voo = deque()
+        for lote in lotes:
+            em_voo.append(executor.submit(embeddar, lote))
+            if len(em_voo) >= concorrencia:
+                yield from _concluir_lote(em_voo.popleft(), metricas)
+        while em_voo:
+            yield from _concluir_lote(em_voo.popleft(), metricas)
+
+def _concluir_lote(futuro, metricas):
+    lote, vetores = futuro.result()
+    metricas.embeddings += len(vetores)
+    metricas.progresso()
+    yield from zip(lote, vetores)
+
+def verificar_dimensao(itens, dim_armazenada):
+    """Interrompe a ingestão se os vetores novos não tiverem a dimensão já armazenada
+
+    Índice e consultas usam um cast para vector(dim): misturar dimensões (ao
+    trocar o modelo ou EMBEDDING_TRUNCATE_DIM) quebraria a busca.
+    """
+    for chunk, vetor in itens:
+        if dim_armazenada and len(vetor) != dim_armazenada:
+            raise ValueError(
+                f"embeddings com {len(vetor)} dimensões, mas a tabela guarda {dim_armazenada}: "
+                f"re-ingira com --completo após trocar o modelo ou EMBEDDING_TRUNCATE_DIM"
+            )
+        yield chunk, vetor
+
+def _campo(valor):
+    if valor is None:
+        return struct.pack("!i", -1)
+    return struct.pack("!i", len(valor)) + valor
+
+def codificar_vetor(vetor):
+    """Formato binário do tipo vector do pgvector: dim (int16), unused (int16), float4[]"""
+    return struct.pack(f"!hh{len(vetor)}f", len(vetor), 0, *vetor)
+
+def linha_copy(chunk_id, collection_id, vetor, documento, metadata):
+    """Codifica uma linha (id, collection_id, embedding, document, cmetadata) para COPY binário"""
+    return b"".join((
+        struct.pack("!h", 5),
+        _campo(chunk_id.encode("utf-8")),
+        _campo(uuid.UUID(collection_id).bytes),
+        _campo(codificar_vetor(vetor)),
+        _campo(documento.encode("utf-8")),
+        # jsonb binário: byte de versão (1) + texto JSON
+        _campo(b"\x01" + json.dumps(metadata, ensure_ascii=False).encode("utf-8")),
+    ))
+
+def gerar_copy(itens, collection_id):
+    """Gera o fluxo binário completo do COPY a partir de (chunk, vetor)"""
+    yield COPY_HEADER
+    for chunk, vetor in itens:
+        yield linha_copy(chunk.id, collection_id, vetor, chunk.page_content, chunk.metadata)
+    yield COPY_TRAILER
+
+
+class LeitorFluxo(io.RawIOBase):
+    """Adapta um gerador de bytes para o objeto arquivo lido por copy_expert"""
+
+    def __init__(self, blocos):
+        self._blocos = iter(blocos)
+        self._buffer = b""
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            try:
+                self._buffer += next(self._blocos)
+            except StopIteration:
+                break
+        if size < 0:
+            size = len(self._buffer)
+        dados, self._buffer = self._buffer[:size], self._buffer[size:]
+        return dados
+
+
+def ingest_pdf(pdf_path=None, colecao=None, batch_size=EMBEDDING_BATCH_SIZE,
+               concorrencia=EMBEDDING_CONCURRENCY, database_url=None, table_name="langchain_pg_embedding",
+               completo=False, source=None):
+    """Ingere o PDF em streaming: páginas → chunks → embeddings em lote → COPY binário
+
+    Por padrão a ingestão é incremental: compara os hashes dos chunks com o que
+    já está armazenado para a fonte, gera embeddings apenas dos chunks novos ou
+    alterados e remove os que sumiram, tudo em uma única transação.
+    Com completo=True todos os chunks da fonte são regravados.
+    """
+    pdf_path = pdf_path or os.getenv("PDF_PATH", "./document.pdf")
+    colecao = colecao or PG_VECTOR_COLLECTION_NAME
+    database_url = database_url or os.getenv("DATABASE_URL")
+    source = source or os.path.basename(pdf_path)
+
+    print("📄 Iniciando ingestão do PDF...")
+    embeddings = get_embeddings()
+    if not embeddings:
+        print("❌ Embeddings não configurados")
+        return None
+
+    metricas = MetricasIngestao()
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+    conn = psycopg2.connect(database_url)
+    try:
+        garantir_tabelas(conn, table_name)
+        garantir_indices_lexicais(conn, table_name)
+        garantir_tabela_fatos(conn)
+        collection_id = obter_colecao(conn, colecao)
+        garantir_particao(conn, table_name, collection_id)
+
+        # Chunks de ingestões antigas podem ter o caminho completo como fonte
+        fontes = list(dict.fromkeys([source, pdf_path]))
+        existentes = {} if completo else carregar_existentes(conn, table_name, collection_id, fontes)
+        print(f"🔗 {len(existentes)} chunks já armazenados para '{source}'")
+        vistos = set()
+        atualizacoes = []
+        fatos = []
+
+        with conn.cursor() as cursor:
+            if completo:
+                cursor.execute(f"""
+                    DELETE FROM {table_name}
+                    WHERE collection_id = %s AND cmetadata->>'source' = ANY(%s)
+                """, (collection_id, fontes))
+            dim_armazenada = detectar_dimensao(conn, table_name)
+            if dim_armazenada is None:
+                # Tabela vazia: o índice da dimensão antiga barraria o COPY; é recriado ao final
+                remover_indices_vetoriais(conn, table_name)
+
+            paginas = coletar_fatos(carregar_paginas(pdf_path, metricas), fatos)
+            chunks = dividir_em_chunks(paginas, splitter, metricas, collection_id, source)
+            novos = filtrar_novos(chunks, existentes, vistos, atualizacoes, metricas)
+            itens = verificar_dimensao(
+                gerar_embeddings(em_lotes(novos, batch_size), embeddings, concorrencia, metricas),
+                dim_armazenada
+            )
+
+            print(f"💾 Carregando chunks novos via COPY na coleção '{colecao}'...")
+            cursor.copy_expert(
+                f"COPY {table_name} (id, collection_id, embedding, document, cmetadata) "
+                f"FROM STDIN WITH (FORMAT binary)",
+                LeitorFluxo(gerar_copy(itens, collection_id))
+            )
+
+            # Chunks que deixaram de existir no PDF
+            removidos = [chunk_id for chunk_id in existentes if chunk_id not in vistos]
+            if removidos:
+                cursor.execute(f"DELETE FROM {table_name} WHERE collection_id = %s AND id = ANY(%s)",
+                               (collection_id, removidos))
+            metricas.removidos = len(removidos)
+
+            # Chunks inalterados que só mudaram de posição
+            if atualizacoes:
+                execute_values(cursor, f"""
+                    UPDATE {table_name} AS e SET cmetadata = v.cmetadata::jsonb
+                    FROM (VALUES %s) AS v (id, cmetadata, collection_id)
+                    WHERE e.collection_id = v.collection_id::uuid AND e.id = v.id
+                """, [(chunk_id, metadata, collection_id) for chunk_id, metadata in atualizacoes])
+            metricas.atualizados = len(atualizacoes)
+
+        # Fatos estruturados (empresa, faturamento, fundação) para o caminho rápido
+        metricas.fatos = gravar_fatos(conn, collection_id, source, fatos)
+
+        if metricas.embeddings or metricas.removidos or metricas.atualizados:
+            registrar_versao_corpus(conn, collection_id)
+
+        print("🔎 Atualizando índices...")
+        garantir_indice_vetorial(conn, table_name)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"❌ Erro na ingestão: {e}")
+        return None
+    finally:
+        conn.close()
+
+    print(f"🎉 SUCESSO! {metricas.resumo()}")
+    print(f"♻️ Incremental: {metricas.resumo_incremental()}")
+    print(f"📊 Fatos estruturados: {metricas.fatos} empresas")
+    return metricas
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingestão de PDFs no PostgreSQL + pgVector")
+    parser.add_argument("pdfs", nargs="*", default=[os.getenv("PDF_PATH", "./document.pdf")],
+                        help="Um ou mais PDFs, todos para a mesma coleção")
+    parser.add_argument("--colecao", default=PG_VECTOR_COLLECTION_NAME,
+                        help="Coleção (partição) que recebe os chunks")
+    parser.add_argument("--batch", type=int, default=EMBEDDING_BATCH_SIZE, help="Chunks por chamada de embed_documents")
+    parser.add_argument("--concorrencia", type=int, default=EMBEDDING_CONCURRENCY, help="Lotes de embeddings em voo")
+    parser.add_argument("--completo", action="store_true", help="Regrava todos os chunks em vez da ingestão incremental")
+    args = parser.parse_args()
+
+    for pdf in args.pdfs:
+        ingest_pdf(pdf, colecao=args.colecao, batch_size=args.batch,
+                   concorrencia=args.concorrencia, completo=args.completo)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
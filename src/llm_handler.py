@@ -1,205 +1,626 @@
-import os
-from typing import Optional, Dict, Any, List
-from dotenv import load_dotenv
-
-from langchain_openai import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
-
-load_dotenv()
-
-class LLMHandler:
-    """Orquestrador de múltiplos modelos LLM com fallback automático"""
-    
-    @property
-    def MODELS(self):
-        return {
-            'openai': {
-                'name': f'ChatGPT ({os.getenv("OPENAI_MODEL", "gpt-4o-mini")})',
-                'class': ChatOpenAI,
-                'config': {
-                    'model': os.getenv('OPENAI_MODEL', 'gpt-4o-mini'),
-                    'temperature': 0
-                },
-                'api_key_env': 'OPENAI_API_KEY'
-            },
-            'gemini': {
-                'name': f'Google Gemini ({os.getenv("GOOGLE_MODEL", "gemini-2.0-flash-lite").replace("gemini-", "")})',
-                'class': ChatGoogleGenerativeAI,
-                'config': {
-                    'model': os.getenv('GOOGLE_MODEL', 'gemini-2.0-flash-lite'),
-                    'temperature': 0
-                },
-                'api_key_env': 'GOOGLE_API_KEY'
-            }
-        }
-    
-    def __init__(self):
-        self.available_models = {}
-        self.current_model = None
-        self._initialize_models()
-        self._set_default_model()
-    
-    def _initialize_models(self):
-        """Inicializa os modelos disponíveis"""
-        for model_key, model_info in self.MODELS.items():
-            try:
-                api_key = os.getenv(model_info['api_key_env'])
-                
-                if api_key and api_key.strip("'") != "coloque aqui":
-                    config = model_info['config'].copy()
-                    
-                    if model_key == 'openai':
-                        config['api_key'] = api_key.strip("'")
-                        self.available_models[model_key] = model_info['class'](**config)
-                    elif model_key == 'gemini':
-                        config['google_api_key'] = api_key.strip("'")
-                        self.available_models[model_key] = model_info['class'](**config)
-                    
-                    print(f"✅ {model_info['name']} inicializado")
-                else:
-                    print(f"⚠️ API key não encontrada para {model_info['name']}")
-                    
-            except Exception as e:
-                print(f"❌ Erro ao inicializar {model_info['name']}: {e}")
-    
-    def _set_default_model(self):
-        """Define o modelo padrão respeitando o .env"""
-        env_model = os.getenv("DEFAULT_LLM_MODEL")
-        
-        if env_model and env_model in self.available_models:
-            self.current_model = env_model
-            print(f"🎯 Usando modelo padrão do .env: {self.get_model_display_name()}")
-            return
-        
-        if env_model and env_model not in self.available_models:
-            print(f"⚠️ Modelo '{env_model}' definido no .env não está disponível!")
-        
-        # Fallback com prioridade: gemini > openai
-        priority_order = ['gemini', 'openai']
-        
-        for model in priority_order:
-            if model in self.available_models:
-                self.current_model = model
-                print(f"🎯 Usando modelo padrão: {self.get_model_display_name()}")
-                return
-        
-        if self.available_models:
-            self.current_model = list(self.available_models.keys())[0]
-            print(f"🔄 Usando primeiro modelo disponível: {self.get_model_display_name()}")
-        else:
-            print("❌ Nenhum modelo LLM disponível!")
-    
-    def get_available_models(self) -> List[str]:
-        """Retorna lista de modelos disponíveis"""
-        return list(self.available_models.keys())
-    
-    def list_models(self) -> None:
-        """Lista todos os modelos com status"""
-        print("\n📋 MODELOS DISPONÍVEIS:")
-        print("=" * 50)
-        
-        for i, (key, info) in enumerate(self.MODELS.items(), 1):
-            status = "✅ ATIVO" if key == self.current_model else "⚪ Disponível" if key in self.available_models else "❌ Indisponível"
-            print(f"{i}. {info['name']} ({key}) - {status}")
-        
-        print("=" * 50)
-    
-    def set_model(self, model_name: str) -> bool:
-        """Altera o modelo ativo"""
-        if model_name in self.available_models:
-            old_model = self.current_model
-            self.current_model = model_name
-            old_name = self.MODELS[old_model]['name'] if old_model in self.MODELS else old_model
-            new_name = self.MODELS[model_name]['name']
-            print(f"✅ Modelo alterado de {old_name} para {new_name}")
-            return True
-        else:
-            available = ", ".join([f"{k} ({self.MODELS[k]['name']})" for k in self.available_models.keys()])
-            print(f"❌ Modelo '{model_name}' não disponível.")
-            if available:
-                print(f"   Disponíveis: {available}")
-            return False
-    
-    def select_model_interactive(self) -> bool:
-        """Permite seleção interativa do modelo"""
-        if not self.available_models:
-            print("❌ Nenhum modelo disponível para seleção!")
-            return False
-        
-        self.list_models()
-        
-        try:
-            available_keys = list(self.available_models.keys())
-            print(f"\n📢 Digite o número (1-{len(available_keys)}) ou nome do modelo:")
-            
-            choice = input("Escolha: ").strip().lower()
-            
-            # Tentar por número
-            if choice.isdigit():
-                idx = int(choice) - 1
-                if 0 <= idx < len(available_keys):
-                    return self.set_model(available_keys[idx])
-            
-            # Tentar por nome
-            if choice in available_keys:
-                return self.set_model(choice)
-            
-            print("❌ Opção inválida!")
-            return False
-            
-        except Exception as e:
-            print(f"❌ Erro na seleção: {e}")
-            return False
-    
-    def get_current_model(self) -> str:
-        """Retorna o modelo atual"""
-        return self.current_model
-    
-    def get_model_display_name(self) -> str:
-        """Retorna nome amigável do modelo atual"""
-        if self.current_model in self.MODELS:
-            return self.MODELS[self.current_model]['name']
-        return self.current_model.upper() if self.current_model else "NENHUM"
-    
-    def invoke(self, prompt: str) -> Optional[str]:
-        """Executa prompt no modelo atual com fallback"""
-        if not self.available_models:
-            print("❌ Nenhum modelo LLM disponível")
-            return None
-            
-        try:
-            if self.current_model in self.available_models:
-                response = self.available_models[self.current_model].invoke(prompt)
-                return response.content
-        except Exception as e:
-            print(f"❌ Erro no modelo {self.get_model_display_name()}: {e}")
-            
-            # Fallback para outro modelo
-            for model_name, model in self.available_models.items():
-                if model_name != self.current_model:
-                    try:
-                        print(f"🔄 Tentando fallback para {self.MODELS[model_name]['name']}...")
-                        response = model.invoke(prompt)
-                        print(f"✅ Fallback bem-sucedido com {self.MODELS[model_name]['name']}")
-                        return response.content
-                    except Exception as fallback_error:
-                        print(f"❌ Fallback {self.MODELS[model_name]['name']} falhou: {fallback_error}")
-        
-        print("❌ Todos os modelos falharam")
-        return None
-    
-    def get_model_info(self) -> Dict[str, Any]:
-        """Retorna informações sobre os modelos"""
-        info = {
-            "current": self.current_model,
-            "current_display": self.get_model_display_name(),
-            "available": self.get_available_models(),
-            "available_display": [self.MODELS[k]['name'] for k in self.available_models.keys()],
-            "total": len(self.available_models),
-            "all_models": {key: info['name'] for key, info in self.MODELS.items()}
-        }
-        return info
-    
-    def is_available(self) -> bool:
-        """Verifica se há pelo menos um modelo disponível"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from collections import deque
+from typing import Optional, Dict, Any, List, Iterator, AsyncIterator
+from dotenv import load_dotenv
+
+from langchain_openai import ChatOpenAI
+from langchain_google_genai import ChatGoogleGenerativeAI
+
+from cache import criar_cache_respostas
+from telemetria import span
+from provedores_locais import (
+    ChatLocal, LOCAL_LLM_MODELS, LOCAL_LLM_LATENCY_MS, LOCAL_LLM_JITTER_MS, LOCAL_LLM_FAILURE_RATE,
+    ECHO_LLM_LATENCY_MS, ECHO_LLM_FAILURE_RATE
+)
+
+load_dotenv()
+
+# Tempo máximo por chamada (segundos); OPENAI_TIMEOUT / GEMINI_TIMEOUT sobrescrevem por provedor
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "1"))
+# Circuit breaker: falhas consecutivas até abrir e janela de resfriamento (segundos)
+LLM_CIRCUIT_FAILURES = int(os.getenv("LLM_CIRCUIT_FAILURES", "3"))
+LLM_CIRCUIT_COOLDOWN = float(os.getenv("LLM_CIRCUIT_COOLDOWN", "30"))
+# Hedging: dispara o secundário se o primário passar do p95 de latência observado
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", "0"))
+LLM_HEDGE_DEFAULT = float(os.getenv("LLM_HEDGE_DEFAULT", "5"))
+LLM_HEDGE_MIN_SAMPLES = 20
+LLM_LATENCY_WINDOW = 200
+
+
+class CircuitBreaker:
+    """Circuit breaker por provedor: após N falhas seguidas, o provedor é
+    ignorado durante o resfriamento; depois uma única chamada de teste decide
+    se o circuito fecha (sucesso) ou reabre (falha)"""
+    
+    def __init__(self, falhas_max=LLM_CIRCUIT_FAILURES, resfriamento=LLM_CIRCUIT_COOLDOWN):
+        self.falhas_max = falhas_max
+        self.resfriamento = resfriamento
+        self.falhas = 0
+        self.aberto_em = None
+        self._testando = False
+        self._lock = threading.Lock()
+    
+    @property
+    def estado(self) -> str:
+        if self.aberto_em is None:
+            return "fechado"
+        if time.monotonic() - self.aberto_em < self.resfriamento:
+            return "aberto"
+        return "meio-aberto"
+    
+    def permitir(self) -> bool:
+        """Indica se uma chamada pode ser feita agora"""
+        with self._lock:
+            estado = self.estado
+            if estado == "fechado":
+                return True
+            if estado == "meio-aberto" and not self._testando:
+                self._testando = True
+                return True
+            return False
+    
+    def liberar(self) -> None:
+        """Chamada abandonada sem resultado: libera a vaga de teste"""
+        with self._lock:
+            self._testando = False
+    
+    def registrar_sucesso(self) -> None:
+        with self._lock:
+            self.falhas = 0
+            self.aberto_em = None
+            self._testando = False
+    
+    def registrar_falha(self) -> None:
+        with self._lock:
+            self.falhas += 1
+            self._testando = False
+            if self.aberto_em is not None or self.falhas >= self.falhas_max:
+                self.aberto_em = time.monotonic()
+
+
+class LLMHandler:
+    """Orquestrador de múltiplos modelos LLM com fallback automático"""
+    
+    @property
+    def MODELS(self):
+        return {
+            'openai': {
+                'name': f'ChatGPT ({os.getenv("OPENAI_MODEL", "gpt-4o-mini")})',
+                'class': ChatOpenAI,
+                'config': {
+                    'model': os.getenv('OPENAI_MODEL', 'gpt-4o-mini'),
+                    'temperature': 0
+                },
+                'api_key_env': 'OPENAI_API_KEY',
+                'timeout': float(os.getenv('OPENAI_TIMEOUT', LLM_TIMEOUT))
+            },
+            'gemini': {
+                'name': f'Google Gemini ({os.getenv("GOOGLE_MODEL", "gemini-2.0-flash-lite").replace("gemini-", "")})',
+                'class': ChatGoogleGenerativeAI,
+                'config': {
+                    'model': os.getenv('GOOGLE_MODEL', 'gemini-2.0-flash-lite'),
+                    'temperature': 0
+                },
+                'api_key_env': 'GOOGLE_API_KEY',
+                'timeout': float(os.getenv('GEMINI_TIMEOUT', LLM_TIMEOUT))
+            },
+            # Provedores offline (sem API key), habilitados via DEFAULT_LLM_MODEL
+            'local': {
+                'name': 'Local (extrativo)',
+                'class': ChatLocal,
+                'config': {
+                    'modo': 'extrativo',
+                    'latencia_ms': LOCAL_LLM_LATENCY_MS,
+                    'variacao_ms': LOCAL_LLM_JITTER_MS,
+                    'taxa_falha': LOCAL_LLM_FAILURE_RATE
+                },
+                'api_key_env': None,
+                'timeout': float(os.getenv('LOCAL_TIMEOUT', LLM_TIMEOUT))
+            },
+            'echo': {
+                'name': 'Local (eco)',
+                'class': ChatLocal,
+                'config': {
+                    'modo': 'eco',
+                    'latencia_ms': ECHO_LLM_LATENCY_MS,
+                    'taxa_falha': ECHO_LLM_FAILURE_RATE
+                },
+                'api_key_env': None,
+                'timeout': float(os.getenv('LOCAL_TIMEOUT', LLM_TIMEOUT))
+            }
+        }
+    
+    def __init__(self, response_cache=None):
+        self.available_models = {}
+        self.current_model = None
+        self.corpus_version = None
+        self.response_cache = response_cache if response_cache is not None else criar_cache_respostas()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.circuit_breakers = {}
+        self.latencias = {}
+        self.hedges = 0
+        self._initialize_models()
+        self._set_default_model()
+    
+    def _initialize_models(self):
+        """Inicializa os modelos disponíveis"""
+        # Provedores locais só entram quando escolhidos explicitamente
+        locais_habilitados = os.getenv("DEFAULT_LLM_MODEL") in LOCAL_LLM_MODELS \
+            or os.getenv("LOCAL_LLM_ENABLED", "false").lower() == "true"
+        
+        for model_key, model_info in self.MODELS.items():
+            try:
+                if model_info['api_key_env'] is None:
+                    if locais_habilitados:
+                        config = model_info['config'].copy()
+                        config['timeout'] = model_info['timeout']
+                        self.available_models[model_key] = model_info['class'](**config)
+                        self.circuit_breakers[model_key] = CircuitBreaker()
+                        self.latencias[model_key] = deque(maxlen=LLM_LATENCY_WINDOW)
+                        print(f"✅ {model_info['name']} inicializado")
+                    continue
+                
+                api_key = os.getenv(model_info['api_key_env'])
+                
+                if api_key and api_key.strip("'") != "coloque aqui":
+                    config = model_info['config'].copy()
+                    config['timeout'] = model_info['timeout']
+                    config['max_retries'] = LLM_MAX_RETRIES
+                    
+                    if model_key == 'openai':
+                        config['api_key'] = api_key.strip("'")
+                        self.available_models[model_key] = model_info['class'](**config)
+                    elif model_key == 'gemini':
+                        config['google_api_key'] = api_key.strip("'")
+                        self.available_models[model_key] = model_info['class'](**config)
+                    
+                    self.circuit_breakers[model_key] = CircuitBreaker()
+                    self.latencias[model_key] = deque(maxlen=LLM_LATENCY_WINDOW)
+                    print(f"✅ {model_info['name']} inicializado")
+                else:
+                    print(f"⚠️ API key não encontrada para {model_info['name']}")
+                    
+            except Exception as e:
+                print(f"❌ Erro ao inicializar {model_info['name']}: {e}")
+    
+    def _set_default_model(self):
+        """Define o modelo padrão respeitando o .env"""
+        env_model = os.getenv("DEFAULT_LLM_MODEL")
+        
+        if env_model and env_model in self.available_models:
+            self.current_model = env_model
+            print(f"🎯 Usando modelo padrão do .env: {self.get_model_display_name()}")
+            return
+        
+        if env_model and env_model not in self.available_models:
+            print(f"⚠️ Modelo '{env_model}' definido no .env não está disponível!")
+        
+        # Fallback com prioridade: gemini > openai
+        priority_order = ['gemini', 'openai']
+        
+        for model in priority_order:
+            if model in self.available_models:
+                self.current_model = model
+                print(f"🎯 Usando modelo padrão: {self.get_model_display_name()}")
+                return
+        
+        if self.available_models:
+            self.current_model = list(self.available_models.keys())[0]
+            print(f"🔄 Usando primeiro modelo disponível: {self.get_model_display_name()}")
+        else:
+            print("❌ Nenhum modelo LLM disponível!")
+    
+    def get_available_models(self) -> List[str]:
+        """Retorna lista de modelos disponíveis"""
+        return list(self.available_models.keys())
+    
+    def list_models(self) -> None:
+        """Lista todos os modelos com status"""
+        print("\n📋 MODELOS DISPONÍVEIS:")
+        print("=" * 50)
+        
+        for i, (key, info) in enumerate(self.MODELS.items(), 1):
+            status = "✅ ATIVO" if key == self.current_model else "⚪ Disponível" if key in self.available_models else "❌ Indisponível"
+            print(f"{i}. {info['name']} ({key}) - {status}")
+        
+        print("=" * 50)
+    
+    def set_model(self, model_name: str) -> bool:
+        """Altera o modelo ativo"""
+        if model_name in self.available_models:
+            old_model = self.current_model
+            self.current_model = model_name
+            old_name = self.MODELS[old_model]['name'] if old_model in self.MODELS else old_model
+            new_name = self.MODELS[model_name]['name']
+            print(f"✅ Modelo alterado de {old_name} para {new_name}")
+            return True
+        else:
+            available = ", ".join([f"{k} ({self.MODELS[k]['name']})" for k in self.available_models.keys()])
+            print(f"❌ Modelo '{model_name}' não disponível.")
+            if available:
+                print(f"   Disponíveis: {available}")
+            return False
+    
+    def select_model_interactive(self) -> bool:
+        """Permite seleção interativa do modelo"""
+        if not self.available_models:
+            print("❌ Nenhum modelo disponível para seleção!")
+            return False
+        
+        self.list_models()
+        
+        try:
+            available_keys = list(self.available_models.keys())
+            print(f"\n📢 Digite o número (1-{len(available_keys)}) ou nome do modelo:")
+            
+            choice = input("Escolha: ").strip().lower()
+            
+            # Tentar por número
+            if choice.isdigit():
+                idx = int(choice) - 1
+                if 0 <= idx < len(available_keys):
+                    return self.set_model(available_keys[idx])
+            
+            # Tentar por nome
+            if choice in available_keys:
+                return self.set_model(choice)
+            
+            print("❌ Opção inválida!")
+            return False
+            
+        except Exception as e:
+            print(f"❌ Erro na seleção: {e}")
+            return False
+    
+    def get_current_model(self) -> str:
+        """Retorna o modelo atual"""
+        return self.current_model
+    
+    def get_model_display_name(self) -> str:
+        """Retorna nome amigável do modelo atual"""
+        if self.current_model in self.MODELS:
+            return self.MODELS[self.current_model]['name']
+        return self.current_model.upper() if self.current_model else "NENHUM"
+    
+    def set_corpus_version(self, version: Optional[str]) -> None:
+        """Registra a versão do corpus ingerido; uma versão nova invalida o cache de respostas"""
+        if version == self.corpus_version:
+            return
+        if self.corpus_version is not None and self.response_cache is not None:
+            self.response_cache.clear()
+            print("♻️ Corpus atualizado: cache de respostas invalidado")
+        self.corpus_version = version
+    
+    def _cache_key(self, model_name: str, prompt: str) -> str:
+        """Chave do cache: modelo, configuração do modelo, versão do corpus e hash do prompt"""
+        config = self.MODELS[model_name]['config'] if model_name in self.MODELS else {}
+        prompt_hash = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        material = json.dumps([model_name, config, self.corpus_version, prompt_hash], sort_keys=True)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+    
+    def _cache_get(self, model_name: str, prompt: str) -> Optional[str]:
+        if self.response_cache is None:
+            return None
+        cached = self.response_cache.get(self._cache_key(model_name, prompt))
+        if cached is not None:
+            self.cache_hits += 1
+        else:
+            self.cache_misses += 1
+        return cached
+    
+    def _cache_put(self, model_name: str, prompt: str, content: Optional[str]) -> None:
+        if self.response_cache is not None and content:
+            self.response_cache.put(self._cache_key(model_name, prompt), content)
+    
+    def modelo_primario(self, model: Optional[str] = None) -> Optional[str]:
+        """Modelo pedido para esta chamada ou, sem pedido válido, o modelo atual
+        
+        Permite escolher o modelo por requisição sem alterar o estado global
+        de set_model (compartilhado entre usuários no serviço HTTP).
+        """
+        if model and model in self.available_models:
+            return model
+        return self.current_model
+    
+    def _ordem_provedores(self, primario: Optional[str] = None) -> List[str]:
+        """Modelo primário primeiro, depois os demais, pulando circuitos abertos"""
+        primario = primario or self.current_model
+        ordem = [primario] + [m for m in self.available_models if m != primario]
+        return [m for m in ordem if m in self.available_models and self.circuit_breakers[m].estado != "aberto"]
+    
+    def _registrar_resultado(self, model_name: str, inicio: float, sucesso: bool) -> None:
+        if sucesso:
+            self.latencias[model_name].append(time.perf_counter() - inicio)
+            self.circuit_breakers[model_name].registrar_sucesso()
+        else:
+            self.circuit_breakers[model_name].registrar_falha()
+    
+    def _chamar(self, model_name: str, prompt: str) -> str:
+        """Chamada síncrona a um provedor (o timeout é aplicado pelo cliente)"""
+        if not self.circuit_breakers[model_name].permitir():
+            raise RuntimeError("circuito aberto")
+        inicio = time.perf_counter()
+        with span("llm_chamada", modelo=model_name):
+            try:
+                response = self.available_models[model_name].invoke(prompt)
+            except Exception:
+                self._registrar_resultado(model_name, inicio, False)
+                raise
+        self._registrar_resultado(model_name, inicio, True)
+        return response.content
+    
+    async def _achamar(self, model_name: str, prompt: str) -> str:
+        """Chamada assíncrona a um provedor com timeout rígido"""
+        if not self.circuit_breakers[model_name].permitir():
+            raise RuntimeError("circuito aberto")
+        inicio = time.perf_counter()
+        with span("llm_chamada", modelo=model_name):
+            try:
+                response = await asyncio.wait_for(
+                    self.available_models[model_name].ainvoke(prompt),
+                    timeout=self.MODELS[model_name]['timeout']
+                )
+            except asyncio.CancelledError:
+                # Cancelada pelo hedging: não conta como falha do provedor
+                self.circuit_breakers[model_name].liberar()
+                raise
+            except Exception:
+                self._registrar_resultado(model_name, inicio, False)
+                raise
+        self._registrar_resultado(model_name, inicio, True)
+        return response.content
+    
+    def orcamento_hedge(self, model_name: str) -> float:
+        """Espera antes de disparar o secundário: LLM_HEDGE_DELAY ou o p95 observado"""
+        if LLM_HEDGE_DELAY > 0:
+            return LLM_HEDGE_DELAY
+        amostras = sorted(self.latencias.get(model_name, ()))
+        if len(amostras) < LLM_HEDGE_MIN_SAMPLES:
+            return LLM_HEDGE_DEFAULT
+        return amostras[min(len(amostras) - 1, int(len(amostras) * 0.95))]
+    
+    def invoke(self, prompt: str, model: Optional[str] = None) -> Optional[str]:
+        """Executa prompt no modelo atual com fallback (consultando o cache de respostas)"""
+        if not self.available_models:
+            print("❌ Nenhum modelo LLM disponível")
+            return None
+        
+        primario = self.modelo_primario(model)
+        with span("llm_invoke", modelo=primario, prompt_chars=len(prompt)) as atual:
+            cached = self._cache_get(primario, prompt)
+            atual.definir(cache_hit=cached is not None)
+            if cached is not None:
+                return cached
+            
+            for tentativa, model_name in enumerate(self._ordem_provedores(primario), 1):
+                try:
+                    if model_name != primario:
+                        print(f"🔄 Tentando fallback para {self.MODELS[model_name]['name']}...")
+                    content = self._chamar(model_name, prompt)
+                    if model_name != primario:
+                        print(f"✅ Fallback bem-sucedido com {self.MODELS[model_name]['name']}")
+                    atual.definir(modelo_usado=model_name, fallback=model_name != primario,
+                                  tentativas=tentativa)
+                    self._cache_put(model_name, prompt, content)
+                    return content
+                except Exception as e:
+                    print(f"❌ Erro no modelo {self.MODELS[model_name]['name']}: {e}")
+            
+            atual.definir(falhou=True)
+        print("❌ Todos os modelos falharam")
+        return None
+    
+    @staticmethod
+    def _texto_trecho(chunk) -> str:
+        """Texto de um AIMessageChunk (o Gemini pode devolver lista de partes)"""
+        content = chunk.content
+        if isinstance(content, str):
+            return content
+        return "".join(
+            parte if isinstance(parte, str) else parte.get("text", "")
+            for parte in content
+        )
+    
+    def stream(self, prompt: str, model: Optional[str] = None) -> Iterator[str]:
+        """Executa o prompt produzindo a resposta em trechos à medida que são gerados
+        
+        O fallback só é possível antes do primeiro trecho; uma falha depois
+        disso é propagada, pois parte da resposta já foi entregue.
+        """
+        if not self.available_models:
+            print("❌ Nenhum modelo LLM disponível")
+            return
+        
+        primario = self.modelo_primario(model)
+        with span("llm_stream", modelo=primario, prompt_chars=len(prompt)) as atual:
+            cached = self._cache_get(primario, prompt)
+            atual.definir(cache_hit=cached is not None)
+            if cached is not None:
+                yield cached
+                return
+            
+            for model_name in self._ordem_provedores(primario):
+                if not self.circuit_breakers[model_name].permitir():
+                    continue
+                if model_name != primario:
+                    print(f"🔄 Tentando fallback para {self.MODELS[model_name]['name']}...")
+                inicio = time.perf_counter()
+                partes = []
+                try:
+                    for chunk in self.available_models[model_name].stream(prompt):
+                        texto = self._texto_trecho(chunk)
+                        if texto:
+                            if not partes:
+                                atual.definir(primeiro_trecho_ms=round((time.perf_counter() - inicio) * 1000, 1))
+                            partes.append(texto)
+                            yield texto
+                except GeneratorExit:
+                    self.circuit_breakers[model_name].liberar()
+                    raise
+                except Exception as e:
+                    self._registrar_resultado(model_name, inicio, False)
+                    print(f"❌ Erro no modelo {self.MODELS[model_name]['name']}: {e}")
+                    if partes:
+                        raise RuntimeError("resposta interrompida durante o streaming") from e
+                    continue
+                
+                self._registrar_resultado(model_name, inicio, True)
+                atual.definir(modelo_usado=model_name, fallback=model_name != primario, trechos=len(partes))
+                self._cache_put(model_name, prompt, "".join(partes))
+                return
+            
+            atual.definir(falhou=True)
+        print("❌ Todos os modelos falharam")
+    
+    async def astream(self, prompt: str, model: Optional[str] = None) -> AsyncIterator[str]:
+        """Versão assíncrona de stream; o timeout do provedor vale para cada trecho"""
+        if not self.available_models:
+            print("❌ Nenhum modelo LLM disponível")
+            return
+        
+        primario = self.modelo_primario(model)
+        with span("llm_astream", modelo=primario, prompt_chars=len(prompt)) as atual:
+            cached = self._cache_get(primario, prompt)
+            atual.definir(cache_hit=cached is not None)
+            if cached is not None:
+                yield cached
+                return
+            
+            for model_name in self._ordem_provedores(primario):
+                if not self.circuit_breakers[model_name].permitir():
+                    continue
+                if model_name != primario:
+                    print(f"🔄 Tentando fallback para {self.MODELS[model_name]['name']}...")
+                inicio = time.perf_counter()
+                partes = []
+                trechos = self.available_models[model_name].astream(prompt).__aiter__()
+                try:
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(
+                                trechos.__anext__(), timeout=self.MODELS[model_name]['timeout']
+                            )
+                        except StopAsyncIteration:
+                            break
+                        texto = self._texto_trecho(chunk)
+                        if texto:
+                            if not partes:
+                                atual.definir(primeiro_trecho_ms=round((time.perf_counter() - inicio) * 1000, 1))
+                            partes.append(texto)
+                            yield texto
+                except (GeneratorExit, asyncio.CancelledError):
+                    self.circuit_breakers[model_name].liberar()
+                    raise
+                except Exception as e:
+                    self._registrar_resultado(model_name, inicio, False)
+                    erro = "timeout" if isinstance(e, asyncio.TimeoutError) else e
+                    print(f"❌ Erro no modelo {self.MODELS[model_name]['name']}: {erro}")
+                    if partes:
+                        raise RuntimeError("resposta interrompida durante o streaming") from e
+                    continue
+                finally:
+                    await trechos.aclose()
+                
+                self._registrar_resultado(model_name, inicio, True)
+                atual.definir(modelo_usado=model_name, fallback=model_name != primario, trechos=len(partes))
+                self._cache_put(model_name, prompt, "".join(partes))
+                return
+            
+            atual.definir(falhou=True)
+        print("❌ Todos os modelos falharam")
+    
+    async def ainvoke(self, prompt: str, model: Optional[str] = None,
+                      hedge: Optional[bool] = None) -> Optional[str]:
+        """Versão assíncrona de invoke com timeout por provedor, circuit breaker
+        e hedging opcional (dispara o secundário se o primário passar do p95)"""
+        if not self.available_models:
+            print("❌ Nenhum modelo LLM disponível")
+            return None
+        
+        primario = self.modelo_primario(model)
+        with span("llm_ainvoke", modelo=primario, prompt_chars=len(prompt)) as atual:
+            cached = self._cache_get(primario, prompt)
+            atual.definir(cache_hit=cached is not None)
+            if cached is not None:
+                return cached
+            
+            hedge = LLM_HEDGE_ENABLED if hedge is None else hedge
+            pendentes = deque(self._ordem_provedores(primario))
+            tarefas = {}
+            
+            def disparar():
+                model_name = pendentes.popleft()
+                tarefa = asyncio.ensure_future(self._achamar(model_name, prompt))
+                tarefas[tarefa] = model_name
+            
+            try:
+                while pendentes or tarefas:
+                    if not tarefas:
+                        disparar()
+                    espera = None
+                    if hedge and pendentes and len(tarefas) == 1:
+                        espera = self.orcamento_hedge(next(iter(tarefas.values())))
+                
+                    concluidas, _ = await asyncio.wait(
+                        tarefas, timeout=espera, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    if not concluidas:
+                        # Primário acima do orçamento: corrida com o próximo provedor
+                        self.hedges += 1
+                        atual.definir(hedge=True)
+                        print(f"⏱️ Hedging: disparando {self.MODELS[pendentes[0]]['name']}")
+                        disparar()
+                        continue
+                
+                    for tarefa in concluidas:
+                        model_name = tarefas.pop(tarefa)
+                        try:
+                            content = tarefa.result()
+                        except Exception as e:
+                            erro = "timeout" if isinstance(e, asyncio.TimeoutError) else e
+                            print(f"❌ Erro no modelo {self.MODELS[model_name]['name']}: {erro}")
+                            continue
+                        if model_name != primario:
+                            print(f"✅ Resposta obtida com {self.MODELS[model_name]['name']}")
+                        atual.definir(modelo_usado=model_name, fallback=model_name != primario)
+                        self._cache_put(model_name, prompt, content)
+                        return content
+            finally:
+                for tarefa in tarefas:
+                    tarefa.cancel()
+            
+            atual.definir(falhou=True)
+        print("❌ Todos os modelos falharam")
+        return None
+    
+    def get_model_info(self) -> Dict[str, Any]:
+        """Retorna informações sobre os modelos"""
+        info = {
+            "current": self.current_model,
+            "current_display": self.get_model_display_name(),
+            "available": self.get_available_models(),
+            "available_display": [self.MODELS[k]['name'] for k in self.available_models.keys()],
+            "total": len(self.available_models),
+            "all_models": {key: info['name'] for key, info in self.MODELS.items()},
+            "cache": {
+                "enabled": self.response_cache is not None,
+                "hits": self.cache_hits,
+                "misses": self.cache_misses,
+                **(self.response_cache.stats() if self.response_cache is not None else {})
+            },
+            "circuitos": {key: cb.estado for key, cb in self.circuit_breakers.items()},
+            "hedges": self.hedges
+        }
+        return info
+    
+    def is_available(self) -> bool:
+        """Verifica se há pelo menos um modelo disponível"""
         return len(self.available_models) > 0
\ No newline at end of file
@@ -0,0 +1,243 @@
+import os
+import re
+import sys
+import json
+import time
+import pstats
+import inspect
+import unicodedata
+import cProfile
+import threading
+import functools
+import tracemalloc
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Diretório padrão dos perfis (--profile sem argumento)
+PROFILE_DIR = os.getenv("PROFILE_DIR", "perfis")
+# Linhas do diff de alocações gravado por pergunta
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", "25"))
+# Quadros guardados por alocação: mais quadros atribuem melhor, mas custam mais
+PROFILE_TRACEMALLOC_FRAMES = int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", "30"))
+# Antes do 3.12 o cProfile só observa a thread em que foi ligado
+PERFIL_POR_THREAD = sys.version_info < (3, 12)
+
+"""
+MODO DE PERFILAMENTO (--profile):
+
+Envolve cada pergunta em cProfile e tracemalloc e grava, no diretório
+escolhido, por pergunta:
+
+  - NNN-<pergunta>.prof: estatísticas do cProfile (snakeviz, gprof2dot,
+    python -m pstats), já somando o trabalho feito nas threads de recuperação
+  - NNN-<pergunta>.alloc.txt: as PROFILE_TOP_N linhas que mais alocaram memória
+    ainda viva ao fim da pergunta
+
+Ao final, resumo.json e um quadro atribuindo CPU e memória a limpar_texto,
+montagem do contexto, extração de termos por regex, sobrecarga dos clientes
+LangChain, banco e espera.
+
+Os rastros do tracemalloc são zerados no início de cada pergunta: o snapshot
+final já é a diferença, sem comparar com um snapshot do heap inteiro.
+
+Até o Python 3.11 o cProfile só observa a thread em que foi ligado: o
+trabalho submetido a outras threads passa por envolver(), que liga um perfil
+próprio na thread e o soma ao da pergunta. A partir do 3.12 o cProfile usa
+sys.monitoring, que já cobre todas as threads e não admite um segundo perfil
+ativo; envolver() então devolve a função sem alteração.
+"""
+
+_ativo = None
+
+
+def envolver(funcao):
+    """Com uma pergunta sendo perfilada, faz `funcao` ser perfilada também na thread onde rodar"""
+    perfilador = _ativo
+    if perfilador is None or perfilador._perfil is None or not PERFIL_POR_THREAD:
+        return funcao
+    return functools.partial(perfilador._executar_em_thread, funcao)
+
+def _nome_arquivo(texto, limite=40):
+    texto = unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode()
+    slug = re.sub(r'[^a-z0-9]+', '-', texto.lower()).strip('-')
+    return slug[:limite] or "pergunta"
+
+def _intervalo(funcao):
+    """(arquivo, primeira linha, última linha) do código da função"""
+    linhas, inicio = inspect.getsourcelines(funcao)
+    return funcao.__code__.co_filename, inicio, inicio + len(linhas) - 1
+
+def _eh_langchain(arquivo):
+    return f"{os.sep}langchain" in arquivo
+
+def _categorias():
+    """Funções de cada categoria do resumo (importadas só quando o perfil é usado)"""
+    import search
+    import contexto
+    import fatos
+    return {
+        "limpar_texto": [search.limpar_texto],
+        "montagem_contexto": [
+            contexto.comprimir_documentos, contexto.montar_contexto,
+            search.preprocessar_contexto_para_comparacao, search.formatar_prompt,
+        ],
+        "extracao_termos": [
+            search.extrair_termos_busca, search.montar_consulta_textual, fatos.classificar_pergunta,
+        ],
+    }
+
+
+class Perfilador:
+    """cProfile + tracemalloc por pergunta, com resumo por categoria"""
+
+    def __init__(self, diretorio=PROFILE_DIR, top_n=PROFILE_TOP_N):
+        self.diretorio = diretorio
+        self.top_n = top_n
+        self.perguntas = []
+        self._perfil = None
+        self._perfis_threads = []
+        self._lock = threading.Lock()
+        os.makedirs(diretorio, exist_ok=True)
+        categorias = _categorias()
+        self._funcoes = {
+            nome: [(f.__code__.co_filename, f.__code__.co_firstlineno, f.__name__) for f in funcoes]
+            for nome, funcoes in categorias.items()
+        }
+        self._intervalos = {
+            nome: [_intervalo(funcao) for funcao in funcoes] for nome, funcoes in categorias.items()
+        }
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+        self._filtros = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ]
+
+    def _executar_em_thread(self, funcao, *args, **kwargs):
+        perfil = cProfile.Profile()
+        try:
+            perfil.enable()
+        except ValueError:
+            # Outro perfil já ativo (sys.monitoring): ele já observa esta thread
+            return funcao(*args, **kwargs)
+        try:
+            return funcao(*args, **kwargs)
+        finally:
+            perfil.disable()
+            with self._lock:
+                self._perfis_threads.append(perfil)
+
+    @contextmanager
+    def pergunta(self, rotulo):
+        """Perfila o bloco como uma pergunta e grava .prof e .alloc.txt"""
+        global _ativo
+        numero = len(self.perguntas) + 1
+        base = os.path.join(self.diretorio, f"{numero:03d}-{_nome_arquivo(rotulo)}")
+        self._perfis_threads = []
+        tracemalloc.clear_traces()
+        tracemalloc.reset_peak()
+
+        self._perfil = cProfile.Profile()
+        _ativo = self
+        inicio = time.perf_counter()
+        self._perfil.enable()
+        try:
+            yield
+        finally:
+            self._perfil.disable()
+            decorrido = time.perf_counter() - inicio
+            _ativo = None
+            pico = tracemalloc.get_traced_memory()[1]
+            alocacoes = tracemalloc.take_snapshot().filter_traces(self._filtros)
+            with self._lock:
+                perfis = [self._perfil] + self._perfis_threads
+                self._perfis_threads = []
+            self._perfil = None
+            self._registrar(numero, rotulo, base, decorrido, pico, perfis, alocacoes)
+
+    def _registrar(self, numero, rotulo, base, decorrido, pico, perfis, alocacoes):
+        estatisticas = pstats.Stats(perfis[0])
+        for perfil in perfis[1:]:
+            estatisticas.add(perfil)
+        estatisticas.dump_stats(f"{base}.prof")
+
+        with open(f"{base}.alloc.txt", "w", encoding="utf-8") as arquivo:
+            arquivo.write(f"# {rotulo}\n# Memória alocada durante a pergunta e ainda viva ao final\n")
+            for estatistica in alocacoes.statistics("lineno")[:self.top_n]:
+                arquivo.write(f"{estatistica}\n")
+
+        self.perguntas.append({
+            "numero": numero,
+            "pergunta": rotulo,
+            "arquivo": f"{base}.prof",
+            "tempo_s": round(decorrido, 6),
+            "threads_perfiladas": len(perfis) - 1,
+            "pico_memoria_bytes": pico,
+            "cpu_s": self._atribuir_cpu(estatisticas),
+            "memoria_bytes": self._atribuir_memoria(alocacoes.statistics("traceback")),
+        })
+
+    def _atribuir_cpu(self, estatisticas):
+        """Tempo por categoria: acumulado das funções do projeto, próprio das demais"""
+        dados = estatisticas.stats
+        cpu = {nome: 0.0 for nome in self._funcoes}
+        for nome, chaves in self._funcoes.items():
+            cpu[nome] = sum(dados[chave][3] for chave in chaves if chave in dados)
+
+        cpu.update({"langchain": 0.0, "banco": 0.0, "espera": 0.0})
+        for (arquivo, _linha, funcao), (_cc, _nc, proprio, _acumulado, _chamadores) in dados.items():
+            if _eh_langchain(arquivo):
+                cpu["langchain"] += proprio
+            elif "psycopg2" in funcao:
+                cpu["banco"] += proprio
+            elif any(termo in funcao for termo in ("_thread.lock", "_socket", "_ssl", "select", "sleep")):
+                cpu["espera"] += proprio
+        cpu["total"] = estatisticas.total_tt
+        return {nome: round(valor, 6) for nome, valor in cpu.items()}
+
+    def _categoria_alocacao(self, traceback):
+        # Do quadro mais interno para o mais externo: a primeira categoria encontrada vence
+        for quadro in traceback:
+            for nome, intervalos in self._intervalos.items():
+                for arquivo, inicio, fim in intervalos:
+                    if quadro.filename == arquivo and inicio <= quadro.lineno <= fim:
+                        return nome
+            if _eh_langchain(quadro.filename):
+                return "langchain"
+        return "outros"
+
+    def _atribuir_memoria(self, estatisticas):
+        memoria = {nome: 0 for nome in list(self._intervalos) + ["langchain", "outros"]}
+        for estatistica in estatisticas:
+            memoria[self._categoria_alocacao(estatistica.traceback)] += estatistica.size
+        return memoria
+
+    def resumo(self):
+        """Grava resumo.json e retorna as linhas do quadro por categoria"""
+        with open(os.path.join(self.diretorio, "resumo.json"), "w", encoding="utf-8") as arquivo:
+            json.dump(self.perguntas, arquivo, ensure_ascii=False, indent=2)
+        if not self.perguntas:
+            return ["🔬 Nenhuma pergunta perfilada"]
+
+        tempo_total = sum(pergunta["tempo_s"] for pergunta in self.perguntas)
+        categorias = [nome for nome in self.perguntas[0]["cpu_s"] if nome != "total"]
+        linhas = [
+            f"🔬 Perfil de {len(self.perguntas)} perguntas ({tempo_total:.2f}s) em {self.diretorio}/",
+            f"   {'categoria':<20}{'CPU (s)':>10}{'% tempo':>9}{'alocado (KiB)':>15}",
+        ]
+        for nome in categorias:
+            cpu = sum(pergunta["cpu_s"][nome] for pergunta in self.perguntas)
+            memoria = sum(pergunta["memoria_bytes"].get(nome, 0) for pergunta in self.perguntas)
+            percentual = cpu / tempo_total * 100 if tempo_total else 0
+            alocado = f"{memoria / 1024:>15.1f}" if nome in self.perguntas[0]["memoria_bytes"] else f"{'-':>15}"
+            linhas.append(f"   {nome:<20}{cpu:>10.4f}{percentual:>8.1f}%{alocado}")
+        outros = sum(pergunta["memoria_bytes"]["outros"] for pergunta in self.perguntas)
+        pico = max(pergunta["pico_memoria_bytes"] for pergunta in self.perguntas)
+        linhas.append(f"   {'outros':<20}{'':>19}{outros / 1024:>15.1f}")
+        linhas.append(f"   Pico de memória por pergunta: {pico / 1024 / 1024:.2f} MiB")
+        linhas.append("   CPU de limpar_texto/contexto/termos é acumulada; langchain/banco/espera é tempo próprio")
+        return linhas
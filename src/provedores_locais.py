@@ -0,0 +1,192 @@
+import os
+import re
+import time
+import random
+import hashlib
+from typing import Any, Iterator, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from pydantic import PrivateAttr
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from fatos import remover_acentos
+
+load_dotenv()
+
+"""
+PROVEDORES LOCAIS (OFFLINE E DETERMINÍSTICOS):
+
+Substitutos dos clientes OpenAI/Google para rodar sem rede nem API keys
+(CI, benchmarks, testes de carga, máquinas isoladas):
+
+  - HashingEmbeddings: embeddings por feature hashing de palavras e trigramas,
+    com dimensão configurável; textos com palavras em comum ficam próximos
+  - ChatLocal: LLM falso em dois modos, 'extrativo' (devolve as linhas do
+    contexto com mais termos da pergunta) e 'eco' (repete a pergunta)
+
+Ambos aceitam latência e taxa de falha injetadas para exercitar timeouts,
+circuit breakers, hedging e fallback.
+
+Seleção: DEFAULT_EMBEDDING_MODEL=local e DEFAULT_LLM_MODEL=local (ou echo)
+"""
+
+# Embeddings locais
+LOCAL_EMBEDDING_MODELS = ("local", "hashing")
+LOCAL_EMBEDDING_DIM = int(os.getenv("LOCAL_EMBEDDING_DIM", "384"))
+LOCAL_EMBEDDING_LATENCY_MS = float(os.getenv("LOCAL_EMBEDDING_LATENCY_MS", "0"))
+LOCAL_EMBEDDING_FAILURE_RATE = float(os.getenv("LOCAL_EMBEDDING_FAILURE_RATE", "0"))
+
+# LLMs locais
+LOCAL_LLM_MODELS = ("local", "echo")
+LOCAL_LLM_LATENCY_MS = float(os.getenv("LOCAL_LLM_LATENCY_MS", "0"))
+LOCAL_LLM_JITTER_MS = float(os.getenv("LOCAL_LLM_JITTER_MS", "0"))
+LOCAL_LLM_FAILURE_RATE = float(os.getenv("LOCAL_LLM_FAILURE_RATE", "0"))
+ECHO_LLM_LATENCY_MS = float(os.getenv("ECHO_LLM_LATENCY_MS", "0"))
+ECHO_LLM_FAILURE_RATE = float(os.getenv("ECHO_LLM_FAILURE_RATE", "0"))
+LOCAL_SEED = os.getenv("LOCAL_SEED")
+
+RESPOSTA_SEM_INFORMACAO = "Não tenho informações necessárias para responder sua pergunta."
+REGEX_PALAVRA = re.compile(r'\w+')
+REGEX_PERGUNTA = re.compile(r'PERGUNTA:\s*(.+)')
+REGEX_CONTEXTO = re.compile(
+    r'(?:CONTEXTO|DADOS PARA ANÁLISE):\s*\n(.*?)\n\s*(?:REGRAS IMPORTANTES|PERGUNTA):', re.DOTALL
+)
+PALAVRAS_IGNORADAS = {
+    'qual', 'quais', 'quantas', 'quantos', 'empresa', 'empresas', 'nome', 'nomes',
+    'liste', 'mostre', 'sobre', 'com', 'tem', 'para', 'como', 'onde', 'quando',
+}
+
+
+class ErroProvedorLocal(RuntimeError):
+    """Falha injetada por um provedor local"""
+
+
+def _gerador(semente):
+    return random.Random(int(semente)) if semente not in (None, "") else random.Random()
+
+def simular_chamada(latencia_ms, variacao_ms, taxa_falha, aleatorio):
+    """Aplica a latência (com variação) e, conforme a taxa, uma falha injetada"""
+    atraso = latencia_ms + (aleatorio.uniform(0, variacao_ms) if variacao_ms else 0)
+    if atraso > 0:
+        time.sleep(atraso / 1000)
+    if taxa_falha and aleatorio.random() < taxa_falha:
+        raise ErroProvedorLocal("falha injetada pelo provedor local")
+
+
+class HashingEmbeddings(Embeddings):
+    """Embeddings determinísticos por feature hashing (palavras + trigramas)
+
+    Sem rede nem modelo: cada palavra normalizada e cada trigrama de
+    caracteres incrementa (com sinal) uma posição do vetor, que é
+    normalizado. Consultas e documentos usam o mesmo espaço (simétrico),
+    então embed_documents pode ser usado para lotes de perguntas.
+    """
+
+    simetrico = True
+
+    def __init__(self, dim=LOCAL_EMBEDDING_DIM, latencia_ms=LOCAL_EMBEDDING_LATENCY_MS,
+                 taxa_falha=LOCAL_EMBEDDING_FAILURE_RATE, semente=LOCAL_SEED):
+        self.dim = dim
+        self.latencia_ms = latencia_ms
+        self.taxa_falha = taxa_falha
+        self._aleatorio = _gerador(semente)
+
+    def _caracteristicas(self, texto):
+        palavras = REGEX_PALAVRA.findall(remover_acentos(texto))
+        for palavra in palavras:
+            yield palavra, 1.0
+            marcada = f"#{palavra}#"
+            for inicio in range(len(marcada) - 2):
+                yield marcada[inicio:inicio + 3], 0.5
+
+    def _vetor(self, texto):
+        vetor = np.zeros(self.dim, dtype=np.float32)
+        for caracteristica, peso in self._caracteristicas(texto):
+            digest = hashlib.blake2b(caracteristica.encode("utf-8"), digest_size=8).digest()
+            valor = int.from_bytes(digest, "little")
+            vetor[valor % self.dim] += peso if (valor >> 63) & 1 else -peso
+        norma = np.linalg.norm(vetor)
+        if norma > 0:
+            vetor /= norma
+        return vetor.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # Uma "chamada" por lote, como um provedor real
+        simular_chamada(self.latencia_ms, 0, self.taxa_falha, self._aleatorio)
+        return [self._vetor(texto) for texto in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        simular_chamada(self.latencia_ms, 0, self.taxa_falha, self._aleatorio)
+        return self._vetor(text)
+
+
+def _termos(texto):
+    return {
+        palavra for palavra in REGEX_PALAVRA.findall(remover_acentos(texto))
+        if len(palavra) > 2 and palavra not in PALAVRAS_IGNORADAS
+    }
+
+def responder_extrativo(prompt, linhas_resposta=3):
+    """Linhas do contexto com mais termos em comum com a pergunta"""
+    pergunta = REGEX_PERGUNTA.search(prompt)
+    contexto = REGEX_CONTEXTO.search(prompt)
+    if not pergunta or not contexto:
+        return RESPOSTA_SEM_INFORMACAO
+    termos = _termos(pergunta.group(1))
+    pontuadas = []
+    for posicao, linha in enumerate(contexto.group(1).split("\n")):
+        comuns = len(termos & _termos(linha))
+        if comuns:
+            pontuadas.append((-comuns, posicao, linha.strip()))
+    if not pontuadas:
+        return RESPOSTA_SEM_INFORMACAO
+    pontuadas.sort()
+    return "\n".join(linha for _, _, linha in pontuadas[:linhas_resposta])
+
+def responder_eco(prompt):
+    """Repete a pergunta do prompt"""
+    pergunta = REGEX_PERGUNTA.search(prompt)
+    return f"ECO: {pergunta.group(1).strip() if pergunta else prompt.strip()[:200]}"
+
+
+class ChatLocal(BaseChatModel):
+    """LLM falso e determinístico com a mesma interface dos clientes LangChain"""
+
+    modo: str = "extrativo"
+    latencia_ms: float = 0
+    variacao_ms: float = 0
+    taxa_falha: float = 0
+    linhas_resposta: int = 3
+    semente: Optional[str] = LOCAL_SEED
+    timeout: Optional[float] = None
+    max_retries: int = 0
+
+    _aleatorio: Any = PrivateAttr(default=None)
+
+    def model_post_init(self, __context: Any) -> None:
+        self._aleatorio = _gerador(self.semente)
+
+    @property
+    def _llm_type(self) -> str:
+        return f"local-{self.modo}"
+
+    def _responder(self, messages) -> str:
+        prompt = "\n".join(str(mensagem.content) for mensagem in messages)
+        if self.modo == "eco":
+            return responder_eco(prompt)
+        return responder_extrativo(prompt, self.linhas_resposta)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        simular_chamada(self.latencia_ms, self.variacao_ms, self.taxa_falha, self._aleatorio)
+        resposta = self._responder(messages)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=resposta))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        # A latência injetada antecede o primeiro trecho (tempo até o primeiro token)
+        simular_chamada(self.latencia_ms, self.variacao_ms, self.taxa_falha, self._aleatorio)
+        for trecho in re.findall(r'\S+\s*', self._responder(messages)):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=trecho))
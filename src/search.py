@@ -1,19 +1,59 @@
 import os
 import re
 import psycopg2
+import time
+import threading
 import unicodedata
+import contextvars
+import numpy as np
+from concurrent.futures import Future, ThreadPoolExecutor
 from dotenv import load_dotenv
 
 from langchain_openai import OpenAIEmbeddings
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_core.documents import Document
 from llm_handler import LLMHandler
-
-# Configuração de busca vetorial
-KEY_VALUE = 30
+from provedores_locais import HashingEmbeddings, LOCAL_EMBEDDING_MODELS, LOCAL_EMBEDDING_DIM
+from cache import envolver_com_cache, criar_cache_semantico, assinatura_pergunta
+from contexto import (
+    CONTEXT_MMR_ENABLED, CONTEXT_COMPRESSION_ENABLED, montar_contexto,
+    comprimir_documentos, contar_tokens
+)
+from telemetria import span, definir_atributos, exportando
+from perfilamento import envolver
+from indice_local import IndiceMemmap, VECTOR_BACKEND, VECTOR_LOCAL_PATH
+from fatos import (
+    FACTS_FAST_PATH, classificar_pergunta, consultar_fatos,
+    formatar_contexto_fatos, formatar_resposta_fatos
+)
+from db import (
+    ConnectionPool, POOL_MAX_CONN, detectar_dimensao, expressao_vetor,
+    expressao_parametro, operador_distancia, resolver_armazenamento, VECTOR_STORAGE,
+    VECTOR_BIT_RERANK, parametros_busca, sql_parametros_busca,
+    coluna_existe, obter_versao_corpus, LEXICAL_TS_CONFIG, LEXICAL_TRIGRAM,
+    PG_VECTOR_COLLECTION_NAME, TODAS_COLECOES, normalizar_colecoes, ids_colecoes
+)
 
 load_dotenv()
 
+# Configuração de busca vetorial (chunks recuperados por pergunta)
+KEY_VALUE = int(os.getenv("KEY_VALUE", "30"))
+
+# Configuração de busca lexical
+LEXICAL_TOP_K = int(os.getenv("LEXICAL_TOP_K", "20"))
+
+# Intervalo (s) entre verificações da versão do corpus (invalidação do cache de respostas)
+CORPUS_VERSION_TTL = float(os.getenv("CORPUS_VERSION_TTL", "10"))
+
+# Constante da Reciprocal Rank Fusion: score = Σ 1 / (RRF_K + posição)
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+# Threads para sobrepor a chamada de embedding à busca lexical no banco
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", "4"))
+
+# Dimensão reduzida (Matryoshka) dos embeddings OpenAI v3; 0 = dimensão completa do modelo
+EMBEDDING_TRUNCATE_DIM = int(os.getenv("EMBEDDING_TRUNCATE_DIM", "0"))
+
 # Templates de prompt melhorados
 PROMPT_TEMPLATE = """
 CONTEXTO:
@@ -73,8 +113,26 @@ IMPORTANTE:
 RESPOSTA:
 """
 
+class _TabelaLimpeza(dict):
+    """Tabela de str.translate que remove surrogates e caracteres de controle
+    (exceto \\n, \\r, \\t), classificando cada code point uma única vez"""
+    
+    def __missing__(self, codigo):
+        caractere = chr(codigo)
+        valor = None if unicodedata.category(caractere)[0] == 'C' and caractere not in '\n\r\t ' else codigo
+        self[codigo] = valor
+        return valor
+
+_TABELA_LIMPEZA = _TabelaLimpeza()
+_CONTROLE_ASCII = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]')
+
 def limpar_texto(texto):
-    """Remove caracteres inválidos do texto preservando acentos"""
+    """Remove caracteres inválidos do texto preservando acentos
+    
+    Texto ASCII sem caracteres de controle volta sem cópia; os demais passam
+    por uma única tradução e só são normalizados (NFC) quando necessário.
+    Os chunks já são gravados limpos na ingestão: aqui só entram perguntas.
+    """
     if not texto:
         return ""
     
@@ -82,15 +140,15 @@ def limpar_texto(texto):
         if isinstance(texto, bytes):
             texto = texto.decode('utf-8', errors='replace')
         
-        # Remover surrogates problemáticos
-        texto_limpo = ''.join(c for c in texto if unicodedata.category(c) != 'Cs')
+        if texto.isascii():
+            return _CONTROLE_ASCII.sub('', texto) if _CONTROLE_ASCII.search(texto) else texto
         
-        # Normalizar unicode (mantém acentos)
-        texto_limpo = unicodedata.normalize('NFC', texto_limpo)
+        # Remover surrogates e caracteres de controle perigosos
+        texto_limpo = texto.translate(_TABELA_LIMPEZA)
         
-        # Remover apenas caracteres de controle perigosos
-        texto_limpo = ''.join(c for c in texto_limpo 
-                             if unicodedata.category(c)[0] != 'C' or c in '\n\r\t ')
+        # Normalizar unicode (mantém acentos)
+        if not unicodedata.is_normalized('NFC', texto_limpo):
+            texto_limpo = unicodedata.normalize('NFC', texto_limpo)
         
         return texto_limpo
         
@@ -102,39 +160,43 @@ def limpar_texto(texto):
             return str(texto)
 
 def get_embeddings():
-    """Retorna embeddings baseado no DEFAULT_EMBEDDING_MODEL"""
+    """Retorna embeddings baseado no DEFAULT_EMBEDDING_MODEL (com cache, se habilitado)"""
+    with span("get_embeddings", modelo=os.getenv("DEFAULT_EMBEDDING_MODEL") or "text-embedding-3-small"):
+        return _criar_embeddings()
+
+def _criar_embeddings():
     try:
         embedding_model = os.getenv("DEFAULT_EMBEDDING_MODEL")
         
         if not embedding_model:
             embedding_model = "text-embedding-3-small"
         
+        # Embeddings locais determinísticos (sem rede nem API key)
+        if embedding_model in LOCAL_EMBEDDING_MODELS:
+            return envolver_com_cache(HashingEmbeddings(), f"local-hash-{LOCAL_EMBEDDING_DIM}")
+        
         # Detectar se é modelo OpenAI ou Google
         if embedding_model.startswith("text-embedding") or embedding_model.startswith("ada"):
             # Modelo OpenAI
             openai_key = os.getenv("OPENAI_API_KEY")
             if openai_key and openai_key.strip("'") != "coloque aqui":
-                return OpenAIEmbeddings(
-                    model=embedding_model,
-                    api_key=openai_key.strip("'")
-                )
+                return _embeddings_openai(embedding_model, openai_key.strip("'"))
         
         elif embedding_model.startswith("models/embedding"):
             # Modelo Google
             google_key = os.getenv("GOOGLE_API_KEY")
             if google_key and google_key.strip("'") != "coloque aqui":
-                return GoogleGenerativeAIEmbeddings(
+                if EMBEDDING_TRUNCATE_DIM:
+                    print(f"⚠️ EMBEDDING_TRUNCATE_DIM ignorado: {embedding_model} não tem dimensão reduzida")
+                return envolver_com_cache(GoogleGenerativeAIEmbeddings(
                     model=embedding_model,
                     google_api_key=google_key.strip("'")
-                )
+                ), embedding_model)
         
         # Fallback para OpenAI
         openai_key = os.getenv("OPENAI_API_KEY")
         if openai_key and openai_key.strip("'") != "coloque aqui":
-            return OpenAIEmbeddings(
-                model="text-embedding-3-small",
-                api_key=openai_key.strip("'")
-            )
+            return _embeddings_openai("text-embedding-3-small", openai_key.strip("'"))
         
         raise Exception("Nenhuma chave de embedding válida encontrada")
         
@@ -142,56 +204,772 @@ def get_embeddings():
         print(f"⚠️ Erro nos embeddings: {e}")
         return None
 
+def _embeddings_openai(modelo, api_key):
+    """OpenAIEmbeddings com cache; modelos v3 aceitam dimensão reduzida (Matryoshka)
+    
+    A API devolve o vetor já truncado e renormalizado. A dimensão entra na
+    chave do cache para não misturar vetores de tamanhos diferentes.
+    """
+    if EMBEDDING_TRUNCATE_DIM and modelo.startswith("text-embedding-3"):
+        return envolver_com_cache(OpenAIEmbeddings(
+            model=modelo, api_key=api_key, dimensions=EMBEDDING_TRUNCATE_DIM
+        ), f"{modelo}-{EMBEDDING_TRUNCATE_DIM}")
+    if EMBEDDING_TRUNCATE_DIM:
+        print(f"⚠️ EMBEDDING_TRUNCATE_DIM ignorado: {modelo} não tem dimensão reduzida")
+    return envolver_com_cache(OpenAIEmbeddings(model=modelo, api_key=api_key), modelo)
+
+def embed_pergunta(embeddings, texto):
+    """embed_query com span; cache_hit indica que o vetor veio do cache de embeddings"""
+    with span("embed_query") as atual:
+        misses = getattr(embeddings, 'misses', None)
+        vetor = embeddings.embed_query(texto)
+        if misses is not None:
+            # Aproximado sob concorrência: outra thread pode errar o cache no meio
+            atual.definir(cache_hit=embeddings.misses == misses)
+        return vetor
+
+def embed_perguntas(embeddings, perguntas):
+    """Embeddings de várias perguntas em uma única chamada ao provedor
+    
+    Equivalente a chamar embed_query para cada pergunta: o Google recebe a
+    tarefa RETRIEVAL_QUERY (embed_documents usaria RETRIEVAL_DOCUMENT) e os
+    vetores ficam no cache de embeddings sob a chave de consulta.
+    """
+    base = getattr(embeddings, 'embeddings', embeddings)
+    if isinstance(base, GoogleGenerativeAIEmbeddings):
+        calcular = lambda textos: base.embed_documents(textos, task_type="RETRIEVAL_QUERY")
+    elif isinstance(base, OpenAIEmbeddings) or getattr(base, 'simetrico', False):
+        calcular = base.embed_documents
+    else:
+        calcular = lambda textos: [base.embed_query(texto) for texto in textos]
+    
+    if hasattr(embeddings, 'embed_queries'):
+        return embeddings.embed_queries(perguntas, calcular)
+    return calcular(perguntas)
+
+def vetor_para_literal(embedding):
+    """Converte um embedding para o formato textual do pgvector ('[x,y,...]')"""
+    return "[" + ",".join(repr(float(x)) for x in embedding) + "]"
+
+def vetor_de_literal(texto):
+    """Converte o formato textual do pgvector ('[x,y,...]') em np.ndarray float32"""
+    return np.fromstring(texto.strip('[]'), sep=',', dtype=np.float32)
+
+def fundir_rrf(vetoriais, lexicais, k=RRF_K):
+    """Reciprocal Rank Fusion em Python, com a mesma fórmula do SQL híbrido
+    
+    Recebe os ids de cada fase em ordem de relevância e retorna
+    [(id, score, rank_vetorial, rank_lexical)] ordenado pelo score.
+    """
+    posicoes = {}
+    for fase, ids in ((0, vetoriais), (1, lexicais)):
+        for posicao, chunk_id in enumerate(ids, 1):
+            posicoes.setdefault(chunk_id, [None, None])
+            if posicoes[chunk_id][fase] is None:
+                posicoes[chunk_id][fase] = posicao
+    
+    fundidos = []
+    for chunk_id, (rank_vetorial, rank_lexical) in posicoes.items():
+        score = sum(1.0 / (k + posicao) for posicao in (rank_vetorial, rank_lexical) if posicao)
+        fundidos.append((chunk_id, score, rank_vetorial, rank_lexical))
+    fundidos.sort(key=lambda item: item[1], reverse=True)
+    return fundidos
+
 class SimpleVectorStore:
     """Vector store simples usando psycopg2"""
     
-    def __init__(self, connection_string, embeddings, table_name="langchain_pg_embedding"):
+    def __init__(self, connection_string, embeddings, table_name="langchain_pg_embedding", pool=None,
+                 perfil_busca=None, armazenamento=None):
         self.connection_string = connection_string
         self.embeddings = embeddings
         self.table_name = table_name
+        self.pool = pool
+        self.perfil_busca = perfil_busca
+        self.armazenamento = armazenamento or VECTOR_STORAGE
+        self._dim = None
+        self._armazenamento = None
+        self._ids_colecoes = {}
+    
+    def dimensao(self, conn):
+        """Dimensão dos embeddings; define a expressão usada pelo índice ANN (vector(dim))"""
+        if not self._dim:
+            self._dim = detectar_dimensao(conn, self.table_name)
+        return self._dim or 0
+    
+    def ids_colecoes(self, conn, colecoes):
+        """uuids das coleções (tupla normalizada de nomes), guardados até esquecer_colecoes()"""
+        ids = self._ids_colecoes.get(colecoes)
+        if ids is None:
+            ids = ids_colecoes(conn, colecoes)
+            if len(ids) < len(colecoes) and TODAS_COLECOES not in colecoes:
+                print(f"⚠️ Nem todas as coleções existem ({', '.join(colecoes)}): as ausentes são ignoradas")
+            self._ids_colecoes[colecoes] = ids
+        return ids
+    
+    def esquecer_colecoes(self):
+        """Descarta os uuids guardados (coleções criadas ou removidas desde então)"""
+        self._ids_colecoes = {}
+    
+    def tipo_armazenamento(self, conn):
+        """Tipo indexado (vector/halfvec/bit) suportado pelo banco, verificado uma única vez"""
+        if self._armazenamento is None:
+            self._armazenamento = resolver_armazenamento(conn, self.armazenamento)
+        return self._armazenamento
+    
+    def _sql_vizinhos(self, dim, placeholder_vetor="$1", placeholder_k="$2", colunas="id, document",
+                      armazenamento='vector', placeholder_colecoes="$3"):
+        """Os k vizinhos mais próximos com a distância cosseno exata
+        
+        O filtro por collection_id deixa o planejador descartar as partições
+        das outras coleções e usar o índice ANN de cada partição restante.
+        Com halfvec/bit o índice ordena pelos vetores reduzidos; no bit, o
+        pré-filtro de Hamming traz k * VECTOR_BIT_RERANK candidatos, reordenados
+        pela distância sobre o vetor completo.
+        """
+        exata = f"{expressao_vetor(dim)} <=> {expressao_parametro(placeholder_vetor, dim)}"
+        filtro = f"collection_id = ANY({placeholder_colecoes}::uuid[])"
+        if armazenamento == 'vector':
+            return f"""
+                SELECT {colunas}, {exata} AS distance
+                FROM {self.table_name}
+                WHERE {filtro}
+                ORDER BY {exata}
+                LIMIT {placeholder_k}
+            """
+        aproximada = (f"{expressao_vetor(dim, armazenamento=armazenamento)} "
+                      f"{operador_distancia(armazenamento)} "
+                      f"{expressao_parametro(placeholder_vetor, dim, armazenamento)}")
+        candidatos = f"{placeholder_k} * {VECTOR_BIT_RERANK}" if armazenamento == 'bit' else placeholder_k
+        return f"""
+            SELECT * FROM (
+                SELECT {colunas}, {exata} AS distance
+                FROM {self.table_name}
+                WHERE {filtro}
+                ORDER BY {aproximada}
+                LIMIT {candidatos}
+            ) candidatos_ann
+            ORDER BY distance
+            LIMIT {placeholder_k}
+        """
+    
+    def _sql_busca(self, dim, placeholder_vetor="$1", placeholder_k="$2", armazenamento='vector',
+                   placeholder_colecoes="$3", vetores=False):
+        colunas = "id, document, embedding::text AS vetor" if vetores else "id, document"
+        return self._sql_vizinhos(dim, placeholder_vetor, placeholder_k, colunas=colunas,
+                                  armazenamento=armazenamento, placeholder_colecoes=placeholder_colecoes)
+    
+    def parametros_ann(self, parametros, k, armazenamento):
+        """O HNSW devolve no máximo ef_search linhas: no bit, cobre todos os candidatos do re-rank"""
+        if armazenamento == 'bit':
+            return dict(parametros, ef_search=max(parametros['ef_search'], k * VECTOR_BIT_RERANK))
+        return parametros
+    
+    def _buscar(self, conn, query_embedding, k, parametros, colecoes, vetores=False):
+        dim = self.dimensao(conn)
+        armazenamento = self.tipo_armazenamento(conn)
+        ids = self.ids_colecoes(conn, colecoes)
+        parametros = self.parametros_ann(parametros, k, armazenamento)
+        ajustes_ann = sql_parametros_busca(parametros)
+        vetor = vetor_para_literal(query_embedding)
+        
+        with span("sql_vetorial", k=k, dim=dim, ef_search=parametros['ef_search'],
+                  armazenamento=armazenamento, colecoes=len(ids)) as atual:
+            if self.pool is not None:
+                # SET LOCAL + EXECUTE no mesmo envio: um único round trip
+                nome = f"busca_vetorial_{armazenamento}_{dim}" + ("_vetores" if vetores else "")
+                self.pool.preparar(conn, nome, self._sql_busca(dim, armazenamento=armazenamento, vetores=vetores),
+                                   tipos=('vector', 'int', 'text[]'))
+                cursor = conn.cursor()
+                cursor.execute(ajustes_ann + f"EXECUTE {nome} (%s, %s, %s)", (vetor, k, ids))
+            else:
+                cursor = conn.cursor()
+                cursor.execute(ajustes_ann + self._sql_busca(dim, "%(vetor)s", "%(k)s", armazenamento,
+                                                             "%(colecoes)s", vetores),
+                               {'vetor': vetor, 'k': k, 'colecoes': ids})
+            
+            results = cursor.fetchall()
+            cursor.close()
+            atual.definir(linhas=len(results))
+        if vetores:
+            return [(chunk_id, documento, distance, vetor_de_literal(vetor))
+                    for chunk_id, documento, vetor, distance in results]
+        return results
+    
+    def _com_conexao(self, funcao, *args):
+        if self.pool is not None:
+            with self.pool.connection() as conn:
+                return funcao(conn, *args)
+        conn = psycopg2.connect(self.connection_string)
+        try:
+            return funcao(conn, *args)
+        finally:
+            conn.close()
+    
+    def buscar(self, query_embedding, k, parametros, colecoes=(TODAS_COLECOES,), vetores=False):
+        """Linhas (id, document, distance) dos k chunks mais próximos nas coleções pedidas
+        
+        Com `vetores`, cada linha traz também o embedding armazenado (np.ndarray).
+        """
+        return self._com_conexao(self._buscar, query_embedding, k, parametros, colecoes, vetores)
+    
+    def _busca_exata(self, conn, query_embedding, k, colecoes):
+        dim = self.dimensao(conn)
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SET LOCAL enable_indexscan = off; SET LOCAL enable_bitmapscan = off; "
+                + self._sql_busca(dim, "%(vetor)s", "%(k)s", placeholder_colecoes="%(colecoes)s"),
+                {'vetor': vetor_para_literal(query_embedding), 'k': k,
+                 'colecoes': self.ids_colecoes(conn, colecoes)}
+            )
+            return cursor.fetchall()
     
-    def similarity_search(self, query, k=5):
-        """Busca por similaridade usando cosine distance"""
+    def busca_exata(self, query_embedding, k, colecoes=(TODAS_COLECOES,)):
+        """Os k vizinhos exatos (índices desligados: varredura sequencial sobre vector)
+        
+        Referência para medir o recall dos índices ANN.
+        """
+        return self._com_conexao(self._busca_exata, query_embedding, k, colecoes)
+    
+    def _plano_busca(self, conn, query_embedding, k, parametros, colecoes):
+        dim = self.dimensao(conn)
+        armazenamento = self.tipo_armazenamento(conn)
+        parametros = self.parametros_ann(parametros, k, armazenamento)
+        with conn.cursor() as cursor:
+            cursor.execute(
+                sql_parametros_busca(parametros) + "EXPLAIN "
+                + self._sql_busca(dim, "%(vetor)s", "%(k)s", armazenamento, "%(colecoes)s"),
+                {'vetor': vetor_para_literal(query_embedding), 'k': k,
+                 'colecoes': self.ids_colecoes(conn, colecoes)}
+            )
+            return "\n".join(linha[0] for linha in cursor.fetchall())
+    
+    def plano_busca(self, query_embedding, k, parametros, colecoes=(TODAS_COLECOES,)):
+        """Plano (EXPLAIN) da busca vetorial, para conferir se o índice ANN é usado"""
+        return self._com_conexao(self._plano_busca, query_embedding, k, parametros, colecoes)
+    
+    def similarity_search(self, query, k=5, perfil=None, ef_search=None, probes=None,
+                          colecoes=TODAS_COLECOES):
+        """Busca por similaridade usando cosine distance
+        
+        perfil/ef_search/probes ajustam o índice ANN apenas nesta consulta;
+        colecoes restringe a busca (nome, lista ou '*').
+        """
         try:
             query_limpa = limpar_texto(query)
-            query_embedding = self.embeddings.embed_query(query_limpa)
-            
-            conn = psycopg2.connect(self.connection_string)
-            cursor = conn.cursor()
+            query_embedding = embed_pergunta(self.embeddings, query_limpa)
+            parametros = parametros_busca(perfil or self.perfil_busca, k=k,
+                                          ef_search=ef_search, probes=probes)
+            return documentos_vetoriais(self.buscar(query_embedding, k, parametros,
+                                                    normalizar_colecoes(colecoes)))
             
-            cursor.execute(f"""
-                SELECT document, embedding <=> %s::vector as distance
+        except Exception as e:
+            print(f"❌ Erro na busca vetorial: {e}")
+            return []
+
+class MemmapVectorStore:
+    """Vector store no próprio processo, sobre o índice local exportado do banco
+
+    Mesma interface de busca do SimpleVectorStore (buscar/similarity_search);
+    a busca é exata, então perfil, ef_search e probes não se aplicam.
+    """
+    
+    def __init__(self, caminho, embeddings, perfil_busca=None):
+        self.caminho = caminho
+        self.embeddings = embeddings
+        self.perfil_busca = perfil_busca
+        self.indice = IndiceMemmap(caminho)
+    
+    def dimensao(self, conn=None):
+        return self.indice.dim
+    
+    def esquecer_colecoes(self):
+        pass
+    
+    def buscar(self, query_embedding, k, parametros=None, colecoes=(TODAS_COLECOES,), vetores=False):
+        """Linhas (id, document, distance) dos k chunks mais próximos nas coleções pedidas
+        
+        Com `vetores`, cada linha traz também o embedding armazenado (np.ndarray).
+        """
+        with span("busca_vetorial_local", k=k, dim=self.indice.dim) as atual:
+            linhas = self.indice.buscar(query_embedding, k, colecoes, vetores)
+            atual.definir(linhas=len(linhas))
+        return linhas
+    
+    def similarity_search(self, query, k=5, perfil=None, ef_search=None, probes=None,
+                          colecoes=TODAS_COLECOES):
+        try:
+            query_embedding = embed_pergunta(self.embeddings, limpar_texto(query))
+            return documentos_vetoriais(self.buscar(query_embedding, k,
+                                                    colecoes=normalizar_colecoes(colecoes)))
+        except Exception as e:
+            print(f"❌ Erro na busca vetorial: {e}")
+            return []
+
+def documentos_vetoriais(linhas):
+    """Documents das linhas (id, document, distance) da busca vetorial"""
+    return [
+        Document(page_content=documento,
+                 metadata={"id": chunk_id, "distance": distance, "score": 1 - distance})
+        for chunk_id, documento, distance in linhas
+    ]
+
+class RetrievalEngine:
+    """Motor de recuperação de longa duração reutilizado entre perguntas
+
+    Mantém o cliente de embeddings, um pool limitado de conexões e os
+    statements preparados, evitando reconstruí-los a cada pergunta.
+    
+    Com backend='memmap' (VECTOR_BACKEND) as buscas vetorial e lexical rodam
+    sobre o índice local; o pool só existe com DATABASE_URL e serve aos fatos.
+    
+    Toda busca é restrita a coleções: `colecoes` (padrão PG_VECTOR_COLLECTION_NAME)
+    vale quando a pergunta não escolhe as suas; '*' consulta todas.
+    
+    Com fatos=False o caminho rápido de fatos estruturados fica desligado.
+    """
+    
+    def __init__(self, database_url=None, embeddings=None, table_name="langchain_pg_embedding",
+                 max_conn=POOL_MAX_CONN, perfil_busca=None, backend=None, caminho_indice=None,
+                 colecoes=None, fatos=True):
+        self.database_url = database_url or os.getenv("DATABASE_URL")
+        self.embeddings = embeddings or get_embeddings()
+        self.table_name = table_name
+        self.colecoes = normalizar_colecoes(colecoes or PG_VECTOR_COLLECTION_NAME)
+        self.backend = (backend or VECTOR_BACKEND).lower()
+        if self.backend == "memmap":
+            self.pool = ConnectionPool(self.database_url, max_conn=max_conn) if self.database_url else None
+            self.vectorstore = MemmapVectorStore(
+                caminho_indice or VECTOR_LOCAL_PATH, self.embeddings, perfil_busca=perfil_busca
+            )
+        else:
+            self.pool = ConnectionPool(self.database_url, max_conn=max_conn)
+            self.vectorstore = SimpleVectorStore(
+                self.database_url, self.embeddings, table_name=table_name, pool=self.pool,
+                perfil_busca=perfil_busca
+            )
+        self.trigram = LEXICAL_TRIGRAM
+        self._lexical = None
+        self._llm_handler = None
+        self._versao_corpus = None
+        self._versao_verificada_em = 0.0
+        self.cache_semantico = criar_cache_semantico()
+        self._fatos_disponiveis = None if self.pool is not None and fatos else False
+        self._executor = ThreadPoolExecutor(RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+    
+    def is_available(self):
+        """Verifica se o cliente de embeddings foi configurado"""
+        return self.embeddings is not None
+    
+    def escopo_colecoes(self, colecoes=None):
+        """Coleções de uma consulta como tupla normalizada (None = padrão do motor)"""
+        return self.colecoes if colecoes is None else normalizar_colecoes(colecoes)
+    
+    def get_llm_handler(self):
+        """LLMHandler padrão do motor, criado uma única vez"""
+        if self._llm_handler is None:
+            self._llm_handler = LLMHandler()
+        return self._llm_handler
+    
+    def versao_corpus(self):
+        """Versão do corpus ingerido, consultada no banco no máximo a cada CORPUS_VERSION_TTL"""
+        if self.backend == "memmap":
+            return self.vectorstore.indice.versao
+        agora = time.monotonic()
+        if self._versao_corpus is None or agora - self._versao_verificada_em > CORPUS_VERSION_TTL:
+            try:
+                with self.pool.connection() as conn:
+                    versao = obter_versao_corpus(conn)
+                if versao != self._versao_corpus and self._versao_corpus is not None:
+                    # Ingestões podem criar coleções: os uuids são resolvidos de novo
+                    self.vectorstore.esquecer_colecoes()
+                    if self.cache_semantico is not None:
+                        self.cache_semantico.clear()
+                self._versao_corpus = versao
+            except Exception as e:
+                print(f"⚠️ Não foi possível verificar a versão do corpus: {e}")
+            self._versao_verificada_em = agora
+        return self._versao_corpus
+    
+    def _em_segundo_plano(self, funcao, *args):
+        """Submete ao executor levando o contexto atual (o span corrente vira pai)
+        e, no modo --profile, o perfil da pergunta"""
+        return self._executor.submit(contextvars.copy_context().run, envolver(funcao), *args)
+    
+    def embedding_futuro(self, question):
+        """Embedding da pergunta: imediato quando já está em cache, senão
+        calculado em segundo plano enquanto o banco trabalha"""
+        em_cache = getattr(self.embeddings, 'em_cache', None)
+        if em_cache is not None and em_cache(question) is not None:
+            futuro = Future()
+            futuro.set_result(embed_pergunta(self.embeddings, question))
+            return futuro
+        return self._em_segundo_plano(embed_pergunta, self.embeddings, question)
+    
+    def consultar_cache_semantico(self, question, escopo, embedding=None):
+        """Resposta de uma pergunta equivalente já respondida, com o embedding da pergunta
+        
+        Retorna (resposta ou None, embedding); o embedding é reaproveitado na busca.
+        """
+        if embedding is None:
+            embedding = embed_pergunta(self.embeddings, question)
+        if self.cache_semantico is None:
+            return None, embedding
+        achado = self.cache_semantico.buscar(
+            embedding, escopo, assinatura_pergunta(question, termos_entidades(question))
+        )
+        definir_atributos(cache_semantico=bool(achado))
+        if achado:
+            resposta, similaridade = achado
+            print(f"⚡ Resposta do cache semântico (similaridade {similaridade:.3f})")
+            return resposta, embedding
+        return None, embedding
+    
+    def registrar_cache_semantico(self, question, embedding, resposta, escopo):
+        if self.cache_semantico is not None and resposta:
+            self.cache_semantico.adicionar(
+                embedding, question, resposta, escopo,
+                assinatura_pergunta(question, termos_entidades(question))
+            )
+    
+    def _ids_colecoes(self, conn, colecoes):
+        if self.backend == "memmap":
+            return ids_colecoes(conn, colecoes)
+        return self.vectorstore.ids_colecoes(conn, colecoes)
+    
+    def consultar_fatos(self, consulta, colecoes=None):
+        """Consulta a tabela de fatos estruturados nas coleções
+        
+        None se a tabela não existir ou as coleções não tiverem fatos; uma
+        lista vazia é uma contagem que deu zero.
+        """
+        if self._fatos_disponiveis is False:
+            return None
+        colecoes = self.escopo_colecoes(colecoes)
+        try:
+            with self.pool.connection() as conn:
+                linhas = consultar_fatos(conn, consulta, self._ids_colecoes(conn, colecoes))
+            self._fatos_disponiveis = True
+            return linhas
+        except psycopg2.errors.UndefinedTable:
+            print("⚠️ Tabela de fatos ausente: execute a ingestão para habilitar o caminho rápido")
+            self._fatos_disponiveis = False
+        except Exception as e:
+            print(f"❌ Erro na consulta de fatos: {e}")
+        return None
+    
+    def vetores_chunks(self, ids, colecoes=None):
+        """Embeddings armazenados dos chunks (id -> np.ndarray), para a diversificação MMR"""
+        if not ids:
+            return {}
+        if self.backend == "memmap":
+            return self.vectorstore.indice.vetores_por_id(ids)
+        colecoes = self.escopo_colecoes(colecoes)
+        try:
+            with self.pool.connection() as conn:
+                # collection_id primeiro: só as partições da consulta, pela chave primária
+                cursor = self.pool.executar_preparado(
+                    conn, "vetores_chunks",
+                    f"""SELECT id, embedding::text FROM {self.table_name}
+                        WHERE collection_id = ANY($2::uuid[]) AND id = ANY($1)""",
+                    (list(ids), self._ids_colecoes(conn, colecoes)), tipos=('varchar[]', 'text[]')
+                )
+                linhas = cursor.fetchall()
+                cursor.close()
+        except Exception as e:
+            print(f"⚠️ Não foi possível carregar os vetores dos chunks: {e}")
+            return {}
+        return {chunk_id: vetor_de_literal(texto) for chunk_id, texto in linhas}
+    
+    def similarity_search(self, query, k=KEY_VALUE, perfil=None, colecoes=None):
+        """Busca vetorial reutilizando o pool de conexões"""
+        return self.vectorstore.similarity_search(query, k=k, perfil=perfil,
+                                                  colecoes=self.escopo_colecoes(colecoes))
+    
+    def _modo_lexical(self, conn):
+        # Verificado uma única vez: full-text indexado ou fallback LIKE
+        if self._lexical is None:
+            if coluna_existe(conn, self.table_name, 'document_tsv'):
+                self._lexical = 'fts'
+            else:
+                print("⚠️ Coluna document_tsv ausente: execute 'python src/db.py' para indexar a busca lexical")
+                self._lexical = 'like'
+        return self._lexical
+    
+    def _sql_lexical(self, modo):
+        if modo == 'like':
+            return f"""
+                SELECT id, document, 0.0 AS rank
                 FROM {self.table_name}
-                ORDER BY embedding <=> %s::vector
-                LIMIT %s
-            """, (query_embedding, query_embedding, k))
-            
-            results = cursor.fetchall()
+                WHERE collection_id = ANY($4::uuid[]) AND LOWER(document) LIKE ANY($1)
+                LIMIT $3
+            """
+        filtro_trigrama = "OR document ILIKE ANY($1)" if self.trigram else ""
+        return f"""
+            SELECT id, document, ts_rank(document_tsv, consulta) AS rank
+            FROM {self.table_name}, websearch_to_tsquery('{LEXICAL_TS_CONFIG}', $2) consulta
+            WHERE collection_id = ANY($4::uuid[]) AND (document_tsv @@ consulta {filtro_trigrama})
+            ORDER BY rank DESC
+            LIMIT $3
+        """
+    
+    def candidatos_lexicais(self, termos, k=LEXICAL_TOP_K, colecoes=None, modo=None):
+        """Linhas (id, document, rank) da busca lexical, em ordem de relevância
+        
+        `modo` ('fts' ou 'like') força a variante da consulta; por padrão vale
+        a detectada no banco. Ignorado no backend memmap.
+        """
+        if not termos:
+            return []
+        colecoes = self.escopo_colecoes(colecoes)
+        if self.backend == "memmap":
+            with span("lexical_local", termos=len(termos), k=k) as atual:
+                linhas = self.vectorstore.indice.candidatos_lexicais(termos, k, colecoes)
+                atual.definir(linhas=len(linhas))
+            return linhas
+        padroes = [f'%{termo.lower()}%' for termo in termos]
+        consulta = montar_consulta_textual(termos)
+        with self.pool.connection() as conn:
+            modo = modo or self._modo_lexical(conn)
+            ids = self._ids_colecoes(conn, colecoes)
+            with span("sql_lexical", modo=modo, termos=len(termos), k=k) as atual:
+                cursor = self.pool.executar_preparado(
+                    conn, f"busca_lexical_{modo}", self._sql_lexical(modo), (padroes, consulta, k, ids),
+                    tipos=('text[]', 'text', 'int', 'text[]')
+                )
+                linhas = cursor.fetchall()
+                cursor.close()
+                atual.definir(linhas=len(linhas))
+        return linhas
+    
+    def busca_lexical(self, termos, k=LEXICAL_TOP_K, colecoes=None):
+        """Busca lexical ranqueada (ts_rank) com todos os termos em uma única consulta"""
+        try:
+            return [doc for _id, doc, _rank in self.candidatos_lexicais(termos, k, colecoes)]
+        except Exception as e:
+            print(f"❌ Erro na busca lexical: {e}")
+            return []
+    
+    def iniciar_busca_lexical(self, question, k=LEXICAL_TOP_K, colecoes=None):
+        """Dispara a fase lexical em segundo plano (não depende do embedding)"""
+        termos = extrair_termos_busca(limpar_texto(question))
+        return self._em_segundo_plano(self.candidatos_lexicais, termos, k, colecoes)
+    
+    def _sql_hibrido(self, dim, modo, armazenamento='vector'):
+        if modo == 'like':
+            lexical = f"""
+                SELECT id, collection_id, 0.0 AS rank_ts
+                FROM {self.table_name}
+                WHERE collection_id = ANY($8::uuid[]) AND LOWER(document) LIKE ANY($4)
+                LIMIT $5
+            """
+        else:
+            filtro_trigrama = "OR document ILIKE ANY($4)" if self.trigram else ""
+            lexical = f"""
+                SELECT id, collection_id, ts_rank(document_tsv, consulta) AS rank_ts
+                FROM {self.table_name}, websearch_to_tsquery('{LEXICAL_TS_CONFIG}', $3) consulta
+                WHERE collection_id = ANY($8::uuid[]) AND (document_tsv @@ consulta {filtro_trigrama})
+                ORDER BY rank_ts DESC
+                LIMIT $5
+            """
+        vizinhos = self.vectorstore._sql_vizinhos(dim, colunas="id, collection_id", armazenamento=armazenamento,
+                                                  placeholder_colecoes="$8")
+        # Documento e embedding (para o MMR) são lidos no fim, pela chave primária
+        # (collection_id, id) de cada partição
+        return f"""
+            WITH vetorial AS (
+                SELECT id, collection_id, distance, row_number() OVER (ORDER BY distance) AS posicao
+                FROM ({vizinhos}) candidatos
+            ),
+            lexical AS (
+                SELECT id, collection_id, row_number() OVER (ORDER BY rank_ts DESC) AS posicao
+                FROM ({lexical}) candidatos
+            ),
+            fundido AS (
+                SELECT COALESCE(v.id, l.id) AS id,
+                       COALESCE(v.collection_id, l.collection_id) AS collection_id,
+                       COALESCE(1.0 / ($6 + v.posicao), 0) + COALESCE(1.0 / ($6 + l.posicao), 0) AS score,
+                       v.posicao AS rank_vetorial,
+                       l.posicao AS rank_lexical,
+                       v.distance
+                FROM vetorial v
+                FULL OUTER JOIN lexical l ON v.collection_id = l.collection_id AND v.id = l.id
+            )
+            SELECT f.id, e.document, f.score, f.rank_vetorial, f.rank_lexical, f.distance,
+                   e.embedding::text
+            FROM fundido f
+            JOIN {self.table_name} e ON e.collection_id = f.collection_id AND e.id = f.id
+            ORDER BY f.score DESC
+            LIMIT $7
+        """
+    
+    def _busca_hibrida_paralela(self, query_embedding, lexical, k_vetorial, k_final, parametros, colecoes):
+        """Fase vetorial enquanto a lexical (já disparada) termina; fusão RRF em Python"""
+        vetoriais = self.vectorstore.buscar(query_embedding, k_vetorial, parametros, colecoes, vetores=True)
+        try:
+            lexicais = lexical.result()
+        except Exception as e:
+            print(f"❌ Erro na busca lexical: {e}")
+            lexicais = []
+        
+        documentos = {chunk_id: documento for chunk_id, documento, _ in lexicais}
+        distancias, vetores = {}, {}
+        for chunk_id, documento, distance, vetor in vetoriais:
+            documentos[chunk_id] = documento
+            distancias[chunk_id] = distance
+            vetores[chunk_id] = vetor
+        
+        fundidos = fundir_rrf(
+            [linha[0] for linha in vetoriais], [linha[0] for linha in lexicais], k=RRF_K
+        )
+        return [
+            (chunk_id, documentos[chunk_id], score, rank_vetorial, rank_lexical,
+             distancias.get(chunk_id), vetores.get(chunk_id))
+            for chunk_id, score, rank_vetorial, rank_lexical in fundidos[:k_final]
+        ]
+    
+    def busca_hibrida(self, question, k_vetorial=KEY_VALUE, k_lexical=LEXICAL_TOP_K,
+                      k_final=None, perfil=None, query_embedding=None, lexical=None, colecoes=None):
+        """Busca híbrida com Reciprocal Rank Fusion
+        
+        Com o embedding em mãos, vetorial e lexical rodam em um único statement
+        SQL. Quando o embedding ainda precisa ir ao provedor, a fase lexical
+        roda em paralelo com essa chamada (ou já vem disparada em `lexical`,
+        via iniciar_busca_lexical) e a fusão é feita em Python. No backend
+        memmap a fusão é sempre em Python, com a lexical em paralelo à vetorial.
+        `colecoes` restringe as duas fases (padrão: coleções do motor); uma
+        fase lexical já disparada precisa ter sido disparada com as mesmas.
+        
+        Retorna os chunks deduplicados por id e ordenados pelo score fundido;
+        cada Document traz score, rank_vetorial, rank_lexical e distance em metadata,
+        e o embedding armazenado em metadata['embedding'] (usado pelo MMR) quando
+        a busca já o leu: sempre no statement único; no caminho paralelo, só os
+        chunks vindos da fase vetorial.
+        """
+        try:
+            question_limpa = limpar_texto(question)
+            termos = extrair_termos_busca(question_limpa)
+            padroes = [f'%{termo.lower()}%' for termo in termos]
+            consulta = montar_consulta_textual(termos)
+            k_final = k_final or (k_vetorial + k_lexical)
+            parametros = parametros_busca(perfil or self.vectorstore.perfil_busca, k=k_vetorial)
+            colecoes = self.escopo_colecoes(colecoes)
             
-            docs = []
-            for doc_content, distance in results:
-                doc_content_limpo = limpar_texto(doc_content)
-                docs.append(Document(
-                    page_content=doc_content_limpo,
-                    metadata={"distance": distance}
-                ))
+            if query_embedding is None and lexical is None:
+                futuro = self.embedding_futuro(question_limpa)
+                if not futuro.done():
+                    lexical = self._em_segundo_plano(self.candidatos_lexicais, termos, k_lexical, colecoes)
+                query_embedding = futuro.result()
+            if lexical is None and self.backend == "memmap":
+                lexical = self._em_segundo_plano(self.candidatos_lexicais, termos, k_lexical, colecoes)
             
-            cursor.close()
-            conn.close()
+            with span("busca_hibrida", caminho="paralela" if lexical is not None else "sql",
+                      colecoes=len(colecoes)) as atual:
+                if lexical is not None:
+                    rows = self._busca_hibrida_paralela(query_embedding, lexical, k_vetorial,
+                                                        k_final, parametros, colecoes)
+                else:
+                    rows = self._busca_hibrida_sql(query_embedding, consulta, padroes, k_vetorial,
+                                                   k_lexical, k_final, parametros, colecoes)
+                atual.definir(linhas=len(rows))
             
+            docs = []
+            for chunk_id, documento, score, rank_vetorial, rank_lexical, distance, vetor in rows:
+                metadata = {
+                    "id": chunk_id,
+                    "score": float(score),
+                    "rank_vetorial": rank_vetorial,
+                    "rank_lexical": rank_lexical,
+                    "distance": distance,
+                }
+                if vetor is not None:
+                    metadata["embedding"] = vetor
+                docs.append(Document(page_content=documento, metadata=metadata))
             return docs
             
         except Exception as e:
-            print(f"❌ Erro na busca vetorial: {e}")
+            print(f"❌ Erro na busca híbrida: {e}")
             return []
+    
+    def _busca_hibrida_sql(self, query_embedding, consulta, padroes, k_vetorial, k_lexical,
+                           k_final, parametros, colecoes):
+        """Vetorial + lexical fundidas por RRF em um único round trip"""
+        with self.pool.connection() as conn:
+            dim = self.vectorstore.dimensao(conn)
+            armazenamento = self.vectorstore.tipo_armazenamento(conn)
+            ids = self.vectorstore.ids_colecoes(conn, colecoes)
+            parametros = self.vectorstore.parametros_ann(parametros, k_vetorial, armazenamento)
+            modo = self._modo_lexical(conn)
+            nome = f"busca_hibrida_{modo}_{armazenamento}_{dim}"
+            self.pool.preparar(conn, nome, self._sql_hibrido(dim, modo, armazenamento),
+                               tipos=('vector', 'int', 'text', 'text[]', 'int', 'int', 'int', 'text[]'))
+            # SET LOCAL + EXECUTE no mesmo envio: um único round trip
+            with span("sql_hibrida", modo=modo, k=k_final) as atual:
+                cursor = conn.cursor()
+                cursor.execute(
+                    sql_parametros_busca(parametros) + f"EXECUTE {nome} (%s, %s, %s, %s, %s, %s, %s, %s)",
+                    (vetor_para_literal(query_embedding), k_vetorial, consulta, padroes,
+                     k_lexical, RRF_K, k_final, ids)
+                )
+                rows = cursor.fetchall()
+                cursor.close()
+                atual.definir(linhas=len(rows))
+        return [linha[:-1] + (vetor_de_literal(linha[-1]),) for linha in rows]
+    
+    def close(self):
+        """Libera as threads de recuperação e as conexões do pool"""
+        self._executor.shutdown(wait=False)
+        if self.pool is not None:
+            self.pool.close()
+
+_default_engine = None
+_default_engine_lock = threading.Lock()
+
+def get_engine():
+    """Retorna o RetrievalEngine compartilhado do processo (criado sob demanda)"""
+    global _default_engine
+    with _default_engine_lock:
+        if _default_engine is None:
+            engine = RetrievalEngine()
+            if not engine.is_available():
+                return None
+            _default_engine = engine
+        return _default_engine
+
+# Palavras capitalizadas só por abrirem a frase (não são nomes próprios)
+PALAVRAS_INICIO_PERGUNTA = {
+    'qual', 'quais', 'que', 'quem', 'quanto', 'quanta', 'quantos', 'quantas', 'como',
+    'onde', 'quando', 'liste', 'mostre', 'diga', 'existe', 'existem', 'há',
+    'o', 'a', 'os', 'as', 'e', 'em', 'de', 'para', 'me'
+}
+
+def termos_entre_aspas(pergunta):
+    termos = re.findall(r"'([^']*)'|\"([^\"]*)\"", pergunta)
+    return [t[0] or t[1] for t in termos if (t[0] or t[1]).strip()]
+
+def termos_entidades(pergunta):
+    """Termos entre aspas e nomes próprios (palavras capitalizadas) da pergunta
+
+    "Qual o faturamento da Alfa Ltda?" e "...da Beta S.A.?" têm embeddings
+    quase idênticos: esses termos entram na assinatura do cache semântico.
+    """
+    pergunta = limpar_texto(pergunta)
+    termos = [termo.lower() for termo in termos_entre_aspas(pergunta)]
+    inicio_frase = True
+    for palavra in re.findall(r"\w+|[.!?]", pergunta):
+        if palavra in ".!?":
+            inicio_frase = True
+            continue
+        if palavra[0].isupper() and not (inicio_frase and palavra.lower() in PALAVRAS_INICIO_PERGUNTA):
+            termos.append(palavra.lower())
+        inicio_frase = False
+    return termos
 
 def extrair_termos_busca(pergunta):
     """Extrai termos-chave da pergunta para busca lexical"""
     pergunta = limpar_texto(pergunta)
     
     # Extrair palavras entre aspas
-    termos_aspas = re.findall(r"'([^']*)'|\"([^\"]*)\"", pergunta)
-    termos_aspas = [t[0] or t[1] for t in termos_aspas if (t[0] or t[1]).strip()]
+    termos_aspas = termos_entre_aspas(pergunta)
     
     # Extrair substantivos importantes (palavras > 3 chars)
     stop_words = {
@@ -209,6 +987,19 @@ def extrair_termos_busca(pergunta):
     todos_termos = termos_aspas + termos_relevantes
     return list(dict.fromkeys(todos_termos))[:5]
 
+def montar_consulta_textual(termos):
+    """Monta a consulta websearch_to_tsquery unindo os termos com OR
+
+    Termos com mais de uma palavra (ex.: extraídos entre aspas) viram frases.
+    """
+    partes = []
+    for termo in termos:
+        termo = termo.replace('"', ' ').strip()
+        if not termo:
+            continue
+        partes.append(f'"{termo}"' if ' ' in termo else termo)
+    return " or ".join(partes)
+
 def preprocessar_contexto_para_comparacao(contexto, pergunta):
     """Pré-processa o contexto para perguntas comparativas com ordenação correta"""
     
@@ -256,30 +1047,143 @@ def preprocessar_contexto_para_comparacao(contexto, pergunta):
             empresas_valores.sort(key=lambda x: x[1], reverse=True)
             contexto_ordenado = "=== EMPRESAS ORDENADAS POR MAIOR FATURAMENTO ===\n\n"
         
-        # Destacar os top 10 no início
+        # Destacar os top 10 no início, sem repeti-los no restante do contexto
+        destacadas = set()
         for i, (nome, valor, linha_original) in enumerate(empresas_valores[:10]):
             contexto_ordenado += f"#{i+1} - {linha_original}\n"
+            destacadas.add(linha_original)
         
-        contexto_ordenado += "\n=== CONTEXTO COMPLETO ===\n\n" + contexto
+        restante = "\n".join(linha for linha in linhas if linha not in destacadas)
+        contexto_ordenado += "\n=== DEMAIS TRECHOS ===\n\n" + restante
         
         return contexto_ordenado
     
     return contexto
 
-def search_prompt_hibrido(question=None, llm_handler=None):
-    """Busca híbrida: vetorial + lexical com otimizações para ambos os modelos"""
+def eh_comparacao(pergunta):
+    """Perguntas de ranking/comparação dependem da lista completa de valores"""
+    termos_comparacao = ['maior', 'menor', 'máximo', 'mínimo', 'top', 'ranking', 'lista']
+    return any(termo in pergunta.lower() for termo in termos_comparacao)
+
+def construir_contexto(question, docs, engine, modelo, colecoes=None):
+    """Contexto do prompt a partir dos chunks recuperados
+
+    Compressão às linhas relevantes (exceto em comparações), diversificação
+    MMR no orçamento de tokens do modelo e destaque dos valores extremos.
+    Retorna (contexto, relatorio do empacotamento).
+    """
+    comparacao = eh_comparacao(question)
+    with span("contexto", chunks_recuperados=len(docs), comparacao=comparacao) as atual:
+        # Só as linhas relevantes de cada chunk; rankings precisam da lista inteira
+        if CONTEXT_COMPRESSION_ENABLED and not comparacao:
+            docs = comprimir_documentos(docs, extrair_termos_busca(question))
+        
+        # Sem redundância (MMR) e dentro do orçamento de tokens do modelo; os embeddings
+        # vêm da própria busca, e só os que faltarem são lidos do banco
+        vetores = None
+        if CONTEXT_MMR_ENABLED:
+            vetores = {doc.metadata["id"]: doc.metadata["embedding"]
+                       for doc in docs if "embedding" in doc.metadata}
+            faltantes = [doc.metadata["id"] for doc in docs if doc.metadata["id"] not in vetores]
+            vetores.update(engine.vetores_chunks(faltantes, colecoes))
+        contexto, relatorio = montar_contexto(docs, modelo, vetores)
+        
+        # Pré-processamento para AMBOS os modelos em perguntas comparativas
+        if comparacao:
+            with span("preprocessar_comparacao", chars_entrada=len(contexto)) as etapa:
+                contexto = preprocessar_contexto_para_comparacao(contexto, question)
+                etapa.definir(chars_saida=len(contexto))
+        atual.definir(chunks=relatorio["chunks_mantidos"], tokens=relatorio["tokens_mantidos"],
+                      orcamento=relatorio["orcamento"], chunks_descartados=relatorio["chunks_descartados"],
+                      tokens_descartados=relatorio["tokens_descartados"],
+                      chunks_redundantes=relatorio["chunks_redundantes"], contexto_chars=len(contexto))
+    return contexto, relatorio
+
+def formatar_prompt(question, contexto, modelo):
+    """Prompt apropriado ao modelo (o Gemini tem template próprio para comparações)"""
+    with span("formatar_prompt", modelo=modelo) as atual:
+        if modelo == "gemini" and eh_comparacao(question):
+            template = PROMPT_TEMPLATE_GEMINI
+        else:
+            template = PROMPT_TEMPLATE
+        prompt = template.format(contexto=contexto, pergunta=question)
+        atual.definir(prompt_chars=len(prompt))
+        # Contar tokens custa uma tokenização do prompt inteiro: só com exportador ativo
+        if exportando():
+            atual.definir(prompt_tokens=contar_tokens(prompt))
+    return prompt
+
+def preparar_prompt_hibrido(question, llm_handler, engine, model=None, query_embedding=None,
+                            colecoes=None):
+    """Cache semântico, fatos estruturados e busca híbrida que antecedem o LLM
+
+    Retorna (resposta, prompt, registro): resposta preenchida quando a pergunta
+    já foi respondida sem LLM; caso contrário o prompt a enviar e o registro
+    (embedding, escopo) para gravar a resposta no cache semântico.
+    `model` escolhe o modelo só para esta pergunta (padrão: modelo atual),
+    `query_embedding` dispensa o cálculo do embedding (ex.: lote já calculado)
+    e `colecoes` escolhe as coleções consultadas (padrão: as do motor).
+    """
+    modelo = llm_handler.modelo_primario(model)
+    colecoes = engine.escopo_colecoes(colecoes)
+    llm_handler.set_corpus_version(engine.versao_corpus())
+    # Respostas em cache nunca atravessam coleções
+    escopo = (modelo, llm_handler.corpus_version, colecoes)
+    definir_atributos(colecoes=",".join(colecoes))
+    
+    # Perguntas de ranking/contagem podem ser respondidas pela tabela de fatos
+    consulta_fatos = classificar_pergunta(question) if FACTS_FAST_PATH != 'off' else None
+    
+    # A chamada de embedding (quando não está em cache) corre em paralelo com
+    # o trabalho de banco que não depende dela: fatos ou fase lexical
+    if query_embedding is not None:
+        futuro_embedding = Future()
+        futuro_embedding.set_result(query_embedding)
+    else:
+        futuro_embedding = engine.embedding_futuro(question)
+    lexical = None
+    if consulta_fatos is None and not futuro_embedding.done():
+        lexical = engine.iniciar_busca_lexical(question, colecoes=colecoes)
+    linhas_fatos = engine.consultar_fatos(consulta_fatos, colecoes) if consulta_fatos else None
+    query_embedding = futuro_embedding.result()
+    
+    # Cache semântico: perguntas equivalentes dispensam busca e LLM
+    cached, _ = engine.consultar_cache_semantico(question, escopo, query_embedding)
+    if cached:
+        return cached, None, None
+    
+    definir_atributos(fatos=linhas_fatos is not None)
+    if linhas_fatos is not None and FACTS_FAST_PATH == 'direto':
+        response = formatar_resposta_fatos(consulta_fatos, linhas_fatos)
+        engine.registrar_cache_semantico(question, query_embedding, response, escopo)
+        return response, None, None
+    
+    if linhas_fatos is not None:
+        # Resultado compacto e pré-calculado no lugar dos chunks recuperados
+        contexto_final = formatar_contexto_fatos(consulta_fatos, linhas_fatos)
+    else:
+        # Fases 1-3: vetorial + lexical fundidas por RRF, já deduplicadas por chunk
+        docs = engine.busca_hibrida(question, query_embedding=query_embedding, lexical=lexical,
+                                    colecoes=colecoes)
+        contexto_final, _ = construir_contexto(question, docs, engine, modelo, colecoes)
+    
+    return None, formatar_prompt(question, contexto_final, modelo), (query_embedding, escopo)
+
+def search_prompt_hibrido(question=None, llm_handler=None, engine=None, model=None, colecoes=None):
+    """Busca híbrida: vetorial + lexical com otimizações para ambos os modelos
+
+    `colecoes` (nome, lista ou '*') restringe a busca a essas coleções.
+    """
     try:
-        # Configurar embeddings
-        embeddings = get_embeddings()
-        if not embeddings:
+        # Reutilizar o motor de recuperação (embeddings + pool de conexões)
+        if engine is None:
+            engine = get_engine()
+        if not engine or not engine.is_available():
             return "❌ Erro: Embeddings não configurados"
-    
-        database_url = os.getenv("DATABASE_URL")
-        vectorstore = SimpleVectorStore(database_url, embeddings)
         
         # Configurar LLM Handler
         if llm_handler is None:
-            llm_handler = LLMHandler()
+            llm_handler = engine.get_llm_handler()
         
         if not llm_handler.is_available():
             return "❌ Erro: Nenhum modelo LLM disponível"
@@ -287,124 +1191,111 @@ def search_prompt_hibrido(question=None, llm_handler=None):
         if question:
             question = limpar_texto(question)
             
-            # Fase 1: Busca vetorial
-            docs_vetorial = vectorstore.similarity_search(question, k=KEY_VALUE)
-            contexto_vetorial = "\n\n".join([doc.page_content for doc in docs_vetorial])
-            
-            # Fase 2: Busca lexical
-            termos = extrair_termos_busca(question)
-            contextos_lexicais = []
-            
-            if termos:
-                conn = psycopg2.connect(database_url)
-                cursor = conn.cursor()
-                
-                for termo in termos:
-                    cursor.execute("""
-                        SELECT DISTINCT document 
-                        FROM langchain_pg_embedding 
-                        WHERE LOWER(document) LIKE %s
-                    """, (f'%{termo.lower()}%',))
-                    
-                    docs_termo = cursor.fetchall()
-                    for doc in docs_termo:
-                        doc_limpo = limpar_texto(doc[0])
-                        contextos_lexicais.append(doc_limpo)
+            with span("pergunta", modo="hibrido") as atual:
+                resposta, prompt, registro = preparar_prompt_hibrido(question, llm_handler, engine, model,
+                                                                     colecoes=colecoes)
+                if resposta:
+                    return resposta
                 
-                cursor.close()
-                conn.close()
-            
-            # Fase 3: Combinar contextos
-            todos_contextos = [contexto_vetorial]
-            todos_contextos.extend(contextos_lexicais)
-            
-            contexto_final = "\n\n".join(dict.fromkeys(todos_contextos))
-            contexto_final = limpar_texto(contexto_final)
-
-            # Pré-processamento para AMBOS os modelos em perguntas comparativas
-            termos_comparacao = ['maior', 'menor', 'máximo', 'mínimo', 'top', 'ranking', 'lista']
-            eh_pergunta_comparacao = any(termo in question.lower() for termo in termos_comparacao)
-            
-            if eh_pergunta_comparacao:
-                contexto_final = preprocessar_contexto_para_comparacao(contexto_final, question)
-            
-            # Gerar resposta com prompt apropriado
-            if llm_handler and llm_handler.get_current_model() == "gemini" and eh_pergunta_comparacao:
-                prompt = PROMPT_TEMPLATE_GEMINI.format(
-                    contexto=contexto_final,
-                    pergunta=question
-                )
-            else:
-                prompt = PROMPT_TEMPLATE.format(
-                    contexto=contexto_final,
-                    pergunta=question
-                )
-            
-            response = llm_handler.invoke(prompt)
-            return response if response else "❌ Erro: Falha na geração de resposta"
+                response = llm_handler.invoke(prompt, model=model)
+                atual.definir(sucesso=bool(response))
+                if response:
+                    query_embedding, escopo = registro
+                    engine.registrar_cache_semantico(question, query_embedding, response, escopo)
+                return response if response else "❌ Erro: Falha na geração de resposta"
         
         return {
-            'vectorstore': vectorstore,
+            'vectorstore': engine.vectorstore,
             'llm_handler': llm_handler,
-            'embeddings': embeddings
+            'embeddings': engine.embeddings,
+            'engine': engine
         }
         
     except Exception as e:
         print(f"❌ Erro na busca híbrida: {e}")
         return None
 
-def search_prompt(question=None, llm_handler=None):
+def search_prompt_hibrido_stream(question, llm_handler=None, engine=None, model=None, colecoes=None):
+    """Variante geradora da busca híbrida: produz a resposta em trechos à
+    medida que o LLM os gera (respostas de cache saem em um único trecho)"""
+    try:
+        if engine is None:
+            engine = get_engine()
+        if not engine or not engine.is_available():
+            yield "❌ Erro: Embeddings não configurados"
+            return
+        
+        if llm_handler is None:
+            llm_handler = engine.get_llm_handler()
+        
+        if not llm_handler.is_available():
+            yield "❌ Erro: Nenhum modelo LLM disponível"
+            return
+        
+        question = limpar_texto(question)
+        with span("pergunta", modo="hibrido_stream") as atual:
+            resposta, prompt, registro = preparar_prompt_hibrido(question, llm_handler, engine, model,
+                                                                 colecoes=colecoes)
+            if resposta:
+                yield resposta
+                return
+            
+            partes = []
+            for trecho in llm_handler.stream(prompt, model=model):
+                partes.append(trecho)
+                yield trecho
+            atual.definir(sucesso=bool(partes))
+            
+            if partes:
+                query_embedding, escopo = registro
+                engine.registrar_cache_semantico(question, query_embedding, "".join(partes), escopo)
+            else:
+                yield "❌ Erro: Falha na geração de resposta"
+    
+    except Exception as e:
+        print(f"❌ Erro na busca híbrida: {e}")
+        yield "❌ Erro ao processar sua pergunta."
+
+def preparar_prompt(question, llm_handler, engine, model=None, colecoes=None):
+    """Busca vetorial simples e montagem do prompt para o modelo escolhido"""
+    modelo = llm_handler.modelo_primario(model)
+    colecoes = engine.escopo_colecoes(colecoes)
+    docs = engine.similarity_search(question, k=KEY_VALUE, colecoes=colecoes)
+    contexto, _ = construir_contexto(question, docs, engine, modelo, colecoes)
+    prompt = formatar_prompt(question, contexto, modelo)
+    
+    llm_handler.set_corpus_version(engine.versao_corpus())
+    return prompt
+
+def search_prompt(question=None, llm_handler=None, engine=None, model=None, colecoes=None):
     """Busca vetorial simples com otimizações para ambos os modelos"""
     try:
-        embeddings = get_embeddings()
-        if not embeddings:
+        if engine is None:
+            engine = get_engine()
+        if not engine or not engine.is_available():
             return "❌ Erro: Embeddings não configurados"
         
-        database_url = os.getenv("DATABASE_URL")
-        vectorstore = SimpleVectorStore(database_url, embeddings)
-        
         if llm_handler is None:
-            llm_handler = LLMHandler()
+            llm_handler = engine.get_llm_handler()
         
         if not llm_handler.is_available():
             return "❌ Erro: Nenhum modelo LLM disponível"
         
         if question:
             question = limpar_texto(question)
-            
-            docs = vectorstore.similarity_search(question, k=KEY_VALUE)
-            contexto = "\n\n".join([doc.page_content for doc in docs])
-            contexto = limpar_texto(contexto)
-            
-            # Verificar se é pergunta comparativa
-            termos_comparacao = ['maior', 'menor', 'máximo', 'mínimo', 'top', 'ranking', 'lista']
-            eh_pergunta_comparacao = any(termo in question.lower() for termo in termos_comparacao)
-            
-            # Pré-processamento para AMBOS os modelos
-            if eh_pergunta_comparacao:
-                contexto = preprocessar_contexto_para_comparacao(contexto, question)
-
-            # Usar prompt específico para Gemini em perguntas comparativas
-            if llm_handler and llm_handler.get_current_model() == "gemini" and eh_pergunta_comparacao:
-                prompt = PROMPT_TEMPLATE_GEMINI.format(
-                    contexto=contexto,
-                    pergunta=question
-                )
-            else:
-                prompt = PROMPT_TEMPLATE.format(
-                    contexto=contexto,
-                    pergunta=question
-                )
-            
-            response = llm_handler.invoke(prompt)
+            with span("pergunta", modo="simples") as atual:
+                prompt = preparar_prompt(question, llm_handler, engine, model, colecoes)
+                response = llm_handler.invoke(prompt, model=model)
+                atual.definir(sucesso=bool(response))
             return response if response else "❌ Erro: Falha na geração de resposta"
         
         return {
-            'vectorstore': vectorstore,
+            'vectorstore': engine.vectorstore,
             'llm_handler': llm_handler,
-            'embeddings': embeddings
+            'embeddings': engine.embeddings,
+            'engine': engine
         }
         
     except Exception as e:
         print(f"❌ Erro na busca: {e}")
-        return None
\ No newline at end of file
+        return None
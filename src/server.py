@@ -0,0 +1,303 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+
+from dotenv import load_dotenv
+
+from search import RetrievalEngine, limpar_texto, preparar_prompt_hibrido, preparar_prompt
+from db import normalizar_colecoes
+from telemetria import registro as telemetria, span
+
+load_dotenv()
+
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+# Chamadas simultâneas ao LLM; as demais requisições aguardam a vez
+SERVER_MAX_LLM_CONCURRENCY = int(os.getenv("SERVER_MAX_LLM_CONCURRENCY", "16"))
+SERVER_MAX_BODY = 64 * 1024
+
+"""
+SERVIÇO HTTP DE CONSULTA (ASGI):
+
+Alternativa ao chat.py para atender vários usuários no mesmo processo.
+Um único LLMHandler, cliente de embeddings e pool de conexões são
+compartilhados entre as requisições; a recuperação (bloqueante) roda em
+threads e a geração usa LLMHandler.ainvoke/astream, limitada por um semáforo.
+
+  POST /perguntar  {"pergunta": "...", "modelo": "gemini", "modo": "hibrido", "stream": true,
+                    "colecoes": ["relatorios"]}
+  GET  /modelos
+  GET  /saude
+  GET  /metricas   (latência por fase no formato texto do Prometheus)
+
+Execução: python src/server.py --port 8000  (requer uvicorn)
+"""
+
+
+class ErroRequisicao(Exception):
+    def __init__(self, status, mensagem):
+        super().__init__(mensagem)
+        self.status = status
+        self.mensagem = mensagem
+
+
+async def ler_corpo(receive):
+    """Lê o corpo da requisição, limitado a SERVER_MAX_BODY bytes"""
+    corpo = b""
+    while True:
+        mensagem = await receive()
+        corpo += mensagem.get("body", b"")
+        if len(corpo) > SERVER_MAX_BODY:
+            raise ErroRequisicao(413, "Corpo da requisição muito grande")
+        if not mensagem.get("more_body"):
+            return corpo
+
+async def responder_json(send, status, dados):
+    corpo = json.dumps(dados, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json; charset=utf-8"),
+            (b"content-length", str(len(corpo)).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": corpo})
+
+
+class ServicoConsulta:
+    """Aplicação ASGI que expõe a busca híbrida e a simples"""
+
+    def __init__(self, engine=None, llm_handler=None, max_llm=SERVER_MAX_LLM_CONCURRENCY):
+        self.engine = engine
+        self.llm_handler = llm_handler
+        self.max_llm = max_llm
+        self.semaforo = None
+        self.em_andamento = 0
+
+    def iniciar(self):
+        """Cria os recursos compartilhados (uma vez por processo)"""
+        if self.engine is None:
+            self.engine = RetrievalEngine()
+            if not self.engine.is_available():
+                print("⚠️ Embeddings não configurados: /perguntar responderá 503")
+        if self.llm_handler is None:
+            self.llm_handler = self.engine.get_llm_handler()
+        if self.semaforo is None:
+            self.semaforo = asyncio.Semaphore(self.max_llm)
+
+    def encerrar(self):
+        if self.engine is not None:
+            self.engine.close()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._ciclo_de_vida(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        self.iniciar()
+        rotas = {
+            ("GET", "/saude"): self.saude,
+            ("GET", "/modelos"): self.modelos,
+            ("GET", "/metricas"): self.metricas,
+            ("POST", "/perguntar"): self.perguntar,
+        }
+        rota = rotas.get((scope["method"], scope["path"].rstrip("/") or "/"))
+        try:
+            if rota is None:
+                caminhos = {caminho for _, caminho in rotas}
+                if scope["path"] in caminhos:
+                    raise ErroRequisicao(405, "Método não permitido")
+                raise ErroRequisicao(404, "Rota não encontrada")
+            await rota(receive, send)
+        except ErroRequisicao as e:
+            await responder_json(send, e.status, {"erro": e.mensagem})
+
+    async def _ciclo_de_vida(self, receive, send):
+        while True:
+            mensagem = await receive()
+            if mensagem["type"] == "lifespan.startup":
+                try:
+                    self.iniciar()
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif mensagem["type"] == "lifespan.shutdown":
+                self.encerrar()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def saude(self, receive, send):
+        info = self.llm_handler.get_model_info()
+        if not self.engine.is_available():
+            status = "sem_embeddings"
+        elif not self.llm_handler.is_available():
+            status = "sem_llm"
+        else:
+            status = "ok"
+        await responder_json(send, 200, {
+            "status": status,
+            "embeddings": self.engine.is_available(),
+            "modelo_padrao": info["current"],
+            "circuitos": info["circuitos"],
+            "llm_em_andamento": self.em_andamento,
+            "llm_limite": self.max_llm,
+            "cache_respostas": info["cache"],
+        })
+
+    async def modelos(self, receive, send):
+        await responder_json(send, 200, {
+            "padrao": self.llm_handler.get_current_model(),
+            "disponiveis": self.llm_handler.get_available_models(),
+        })
+
+    async def metricas(self, receive, send):
+        corpo = telemetria.texto_prometheus().encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/plain; version=0.0.4; charset=utf-8"),
+                (b"content-length", str(len(corpo)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": corpo})
+    
+    async def perguntar(self, receive, send):
+        with span("requisicao", rota="/perguntar"):
+            await self._perguntar(receive, send)
+    
+    async def _perguntar(self, receive, send):
+        try:
+            dados = json.loads(await ler_corpo(receive) or b"{}")
+        except ValueError:
+            raise ErroRequisicao(400, "JSON inválido")
+
+        pergunta = limpar_texto(str(dados.get("pergunta") or "")).strip()
+        modelo = dados.get("modelo")
+        modo = dados.get("modo", "hibrido")
+        stream = bool(dados.get("stream", False))
+        if not pergunta:
+            raise ErroRequisicao(400, "Campo 'pergunta' é obrigatório")
+        if modo not in ("hibrido", "simples"):
+            raise ErroRequisicao(400, "Campo 'modo' deve ser 'hibrido' ou 'simples'")
+        if modelo and modelo not in self.llm_handler.get_available_models():
+            raise ErroRequisicao(400, f"Modelo '{modelo}' não disponível")
+        modelo = self.llm_handler.modelo_primario(modelo)
+        # Sem coleção na requisição vale a padrão do serviço (PG_VECTOR_COLLECTION_NAME)
+        colecoes = dados.get("colecoes", dados.get("colecao"))
+        if colecoes is not None:
+            try:
+                colecoes = normalizar_colecoes(colecoes)
+            except (ValueError, TypeError) as e:
+                raise ErroRequisicao(400, f"Campo 'colecoes' inválido: {e}")
+
+        if not self.engine.is_available():
+            raise ErroRequisicao(503, "Embeddings não configurados")
+
+        # Recuperação bloqueante (embeddings + banco) em thread, com o pool compartilhado
+        inicio = time.perf_counter()
+        registro = None
+        try:
+            if modo == "hibrido":
+                resposta, prompt, registro = await asyncio.to_thread(
+                    preparar_prompt_hibrido, pergunta, self.llm_handler, self.engine, modelo, None, colecoes
+                )
+            else:
+                resposta = None
+                prompt = await asyncio.to_thread(
+                    preparar_prompt, pergunta, self.llm_handler, self.engine, modelo, colecoes
+                )
+        except Exception as e:
+            # Banco fora do ar, pool esgotado, falha de embeddings...
+            print(f"❌ Erro na recuperação: {e}")
+            raise ErroRequisicao(503, f"Falha na recuperação: {e}")
+        recuperacao = time.perf_counter() - inicio
+
+        if stream:
+            await self._responder_stream(send, pergunta, resposta, prompt, registro, modelo)
+            return
+
+        if resposta is None:
+            async with self.semaforo:
+                self.em_andamento += 1
+                try:
+                    resposta = await self.llm_handler.ainvoke(prompt, model=modelo)
+                finally:
+                    self.em_andamento -= 1
+            if not resposta:
+                raise ErroRequisicao(503, "Falha na geração de resposta")
+            if registro:
+                query_embedding, escopo = registro
+                self.engine.registrar_cache_semantico(pergunta, query_embedding, resposta, escopo)
+
+        total = time.perf_counter() - inicio
+        await responder_json(send, 200, {
+            "resposta": resposta,
+            "modelo": modelo,
+            "modo": modo,
+            "tempos": {"recuperacao": round(recuperacao, 4), "total": round(total, 4)},
+        })
+
+    async def _responder_stream(self, send, pergunta, resposta, prompt, registro, modelo):
+        """Resposta em trechos (text/plain, chunked) à medida que o LLM gera"""
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/plain; charset=utf-8"),
+                (b"x-modelo", modelo.encode() if modelo else b""),
+            ],
+        })
+        if resposta is not None:
+            await send({"type": "http.response.body", "body": resposta.encode("utf-8")})
+            return
+
+        partes = []
+        async with self.semaforo:
+            self.em_andamento += 1
+            try:
+                async for trecho in self.llm_handler.astream(prompt, model=modelo):
+                    partes.append(trecho)
+                    await send({
+                        "type": "http.response.body",
+                        "body": trecho.encode("utf-8"),
+                        "more_body": True,
+                    })
+            except Exception as e:
+                print(f"❌ Erro no streaming: {e}")
+                partes = []
+            finally:
+                self.em_andamento -= 1
+
+        if partes and registro:
+            query_embedding, escopo = registro
+            self.engine.registrar_cache_semantico(pergunta, query_embedding, "".join(partes), escopo)
+        fim = b"" if partes else "❌ Erro: Falha na geração de resposta".encode("utf-8")
+        await send({"type": "http.response.body", "body": fim})
+
+
+app = ServicoConsulta()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serviço HTTP de consulta ao RAG")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    args = parser.parse_args()
+
+    try:
+        import uvicorn
+    except ImportError:
+        print("❌ uvicorn não instalado: pip install uvicorn")
+        return
+
+    print(f"🌐 Serviço de consulta em http://{args.host}:{args.port}")
+    uvicorn.run(app, host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+import os
+import sys
+import json
+import time
+import uuid
+import atexit
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Exportadores ativos, separados por vírgula: json, prometheus, otel (vazio = só em memória)
+TELEMETRY_EXPORTERS = os.getenv("TELEMETRY_EXPORTERS", "")
+# JSON: um span por linha; vazio = stderr
+TELEMETRY_JSON_PATH = os.getenv("TELEMETRY_JSON_PATH", "")
+# Prometheus: arquivo no formato texto (textfile collector), regravado periodicamente
+TELEMETRY_PROMETHEUS_PATH = os.getenv("TELEMETRY_PROMETHEUS_PATH", "telemetria.prom")
+TELEMETRY_FLUSH_INTERVAL = float(os.getenv("TELEMETRY_FLUSH_INTERVAL", "10"))
+# Amostras por fase mantidas para os percentis do comando 'status'
+TELEMETRY_WINDOW = int(os.getenv("TELEMETRY_WINDOW", "500"))
+TELEMETRY_SERVICE_NAME = os.getenv("TELEMETRY_SERVICE_NAME", "rag-pdf")
+
+# Limites (s) dos buckets dos histogramas Prometheus
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+"""
+TELEMETRIA POR FASE:
+
+Spans leves em volta de cada fase da pergunta (embedding, SQL vetorial e
+lexical, montagem do contexto, formatação do prompt, chamada ao LLM), com
+atributos como linhas retornadas, tokens do prompt, modelo usado, fallback e
+acerto de cache:
+
+    with span("sql_vetorial", k=k) as s:
+        linhas = ...
+        s.definir(linhas=len(linhas))
+
+Todo span alimenta o registro em memória (percentis móveis do comando
+'status' e métricas Prometheus do serviço HTTP) e os exportadores de
+TELEMETRY_EXPORTERS:
+
+  - json: um objeto por span (trace_id, span_id, pai, duração, atributos)
+  - prometheus: histogramas e contadores regravados em TELEMETRY_PROMETHEUS_PATH
+  - otel: spans reais do OpenTelemetry (requer opentelemetry-api/sdk configurados)
+"""
+
+_span_atual = contextvars.ContextVar("span_atual", default=None)
+
+
+class Span:
+    """Uma fase cronometrada, com atributos e vínculo ao span pai"""
+
+    __slots__ = ("nome", "atributos", "trace_id", "span_id", "pai_id", "inicio", "duracao", "erro")
+
+    def __init__(self, nome, atributos, pai=None):
+        self.nome = nome
+        self.atributos = atributos
+        self.trace_id = pai.trace_id if pai else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.pai_id = pai.span_id if pai else None
+        self.inicio = time.time()
+        self.duracao = 0.0
+        self.erro = None
+
+    def definir(self, **atributos):
+        self.atributos.update(atributos)
+
+    def para_dict(self):
+        return {
+            "ts": round(self.inicio, 6),
+            "nome": self.nome,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "pai_id": self.pai_id,
+            "duracao_ms": round(self.duracao * 1000, 3),
+            "erro": self.erro,
+            "atributos": self.atributos,
+        }
+
+
+class ExportadorJSON:
+    """Log estruturado: um span por linha"""
+
+    def __init__(self, caminho=TELEMETRY_JSON_PATH):
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self._arquivo = open(caminho, "a", encoding="utf-8") if caminho else None
+
+    def exportar(self, span):
+        linha = json.dumps(span.para_dict(), ensure_ascii=False, default=str) + "\n"
+        with self._lock:
+            destino = self._arquivo or sys.stderr
+            destino.write(linha)
+            destino.flush()
+
+    def encerrar(self):
+        if self._arquivo:
+            self._arquivo.close()
+
+
+class ExportadorPrometheus:
+    """Regrava o texto Prometheus do registro no máximo a cada TELEMETRY_FLUSH_INTERVAL"""
+
+    def __init__(self, registro, caminho=TELEMETRY_PROMETHEUS_PATH, intervalo=TELEMETRY_FLUSH_INTERVAL):
+        self.registro = registro
+        self.caminho = caminho
+        self.intervalo = intervalo
+        self._ultima_gravacao = 0.0
+
+    def exportar(self, span):
+        agora = time.monotonic()
+        if span.pai_id is None and agora - self._ultima_gravacao >= self.intervalo:
+            self._ultima_gravacao = agora
+            self.gravar()
+
+    def gravar(self):
+        temporario = f"{self.caminho}.tmp"
+        with open(temporario, "w", encoding="utf-8") as arquivo:
+            arquivo.write(self.registro.texto_prometheus())
+        os.replace(temporario, self.caminho)
+
+    def encerrar(self):
+        self.gravar()
+
+
+class ExportadorOTel:
+    """Reemite cada span pelo tracer do OpenTelemetry, preservando a hierarquia
+
+    Só a API é usada: provider, processador e destino (OTLP, console...)
+    ficam a cargo da configuração do OpenTelemetry do ambiente.
+    """
+
+    def __init__(self, nome_servico=TELEMETRY_SERVICE_NAME):
+        from opentelemetry import trace
+        self.trace = trace
+        self.tracer = trace.get_tracer(nome_servico)
+        self._abertos = {}
+        self._lock = threading.Lock()
+
+    def iniciar(self, span):
+        with self._lock:
+            pai = self._abertos.get(span.pai_id)
+        contexto = self.trace.set_span_in_context(pai) if pai is not None else None
+        otel = self.tracer.start_span(span.nome, context=contexto,
+                                      start_time=int(span.inicio * 1e9))
+        with self._lock:
+            self._abertos[span.span_id] = otel
+
+    def exportar(self, span):
+        with self._lock:
+            otel = self._abertos.pop(span.span_id, None)
+        if otel is None:
+            return
+        for chave, valor in span.atributos.items():
+            if valor is not None:
+                otel.set_attribute(chave, valor if isinstance(valor, (bool, int, float, str)) else str(valor))
+        if span.erro:
+            otel.set_status(self.trace.Status(self.trace.StatusCode.ERROR, span.erro))
+        otel.end(end_time=int((span.inicio + span.duracao) * 1e9))
+
+    def encerrar(self):
+        pass
+
+
+class RegistroTelemetria:
+    """Agrega os spans: janela móvel por fase, histogramas e contadores"""
+
+    def __init__(self, janela=TELEMETRY_WINDOW):
+        self.janela = janela
+        self.exportadores = []
+        self._duracoes = {}
+        self._histogramas = {}
+        self._erros = {}
+        self._eventos = {}
+        self._lock = threading.Lock()
+
+    def adicionar_exportador(self, exportador):
+        self.exportadores.append(exportador)
+
+    def iniciar(self, span):
+        for exportador in self.exportadores:
+            iniciar = getattr(exportador, "iniciar", None)
+            if iniciar is not None:
+                iniciar(span)
+
+    def registrar(self, span):
+        with self._lock:
+            janela = self._duracoes.get(span.nome)
+            if janela is None:
+                janela = self._duracoes[span.nome] = deque(maxlen=self.janela)
+                self._histogramas[span.nome] = [[0] * (len(BUCKETS) + 1), 0.0]
+            janela.append(span.duracao)
+            contagens, _ = self._histogramas[span.nome]
+            for posicao, limite in enumerate(BUCKETS):
+                if span.duracao <= limite:
+                    contagens[posicao] += 1
+                    break
+            else:
+                contagens[-1] += 1
+            self._histogramas[span.nome][1] += span.duracao
+            if span.erro:
+                self._erros[span.nome] = self._erros.get(span.nome, 0) + 1
+            # Atributos booleanos verdadeiros viram contadores (cache_hit, fallback...)
+            for chave, valor in span.atributos.items():
+                if valor is True:
+                    self._eventos[(span.nome, chave)] = self._eventos.get((span.nome, chave), 0) + 1
+
+        for exportador in self.exportadores:
+            try:
+                exportador.exportar(span)
+            except Exception as e:
+                print(f"⚠️ Falha no exportador de telemetria {type(exportador).__name__}: {e}")
+
+    def percentis(self):
+        """Percentis (ms) da janela móvel de cada fase"""
+        with self._lock:
+            janelas = {nome: sorted(valores) for nome, valores in self._duracoes.items()}
+        resultado = {}
+        for nome, valores in janelas.items():
+            if not valores:
+                continue
+            posicao = lambda p: valores[min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))]
+            resultado[nome] = {
+                "n": len(valores),
+                "p50": posicao(50) * 1000,
+                "p95": posicao(95) * 1000,
+                "p99": posicao(99) * 1000,
+            }
+        return resultado
+
+    def eventos(self):
+        with self._lock:
+            return dict(self._eventos)
+
+    def texto_prometheus(self):
+        """Métricas no formato de exposição texto do Prometheus"""
+        with self._lock:
+            histogramas = {nome: (list(contagens), soma) for nome, (contagens, soma) in self._histogramas.items()}
+            erros = dict(self._erros)
+            eventos = dict(self._eventos)
+
+        linhas = [
+            "# HELP rag_fase_duracao_segundos Duração de cada fase da pergunta",
+            "# TYPE rag_fase_duracao_segundos histogram",
+        ]
+        for nome, (contagens, soma) in sorted(histogramas.items()):
+            acumulado = 0
+            for limite, contagem in zip(BUCKETS, contagens):
+                acumulado += contagem
+                linhas.append(f'rag_fase_duracao_segundos_bucket{{fase="{nome}",le="{limite}"}} {acumulado}')
+            acumulado += contagens[-1]
+            linhas.append(f'rag_fase_duracao_segundos_bucket{{fase="{nome}",le="+Inf"}} {acumulado}')
+            linhas.append(f'rag_fase_duracao_segundos_sum{{fase="{nome}"}} {soma:.6f}')
+            linhas.append(f'rag_fase_duracao_segundos_count{{fase="{nome}"}} {acumulado}')
+
+        linhas += ["# HELP rag_fase_erros_total Fases encerradas com exceção",
+                   "# TYPE rag_fase_erros_total counter"]
+        for nome, total in sorted(erros.items()):
+            linhas.append(f'rag_fase_erros_total{{fase="{nome}"}} {total}')
+
+        linhas += ["# HELP rag_eventos_total Atributos verdadeiros por fase (cache_hit, fallback...)",
+                   "# TYPE rag_eventos_total counter"]
+        for (nome, evento), total in sorted(eventos.items()):
+            linhas.append(f'rag_eventos_total{{fase="{nome}",evento="{evento}"}} {total}')
+        return "\n".join(linhas) + "\n"
+
+    def encerrar(self):
+        for exportador in self.exportadores:
+            try:
+                exportador.encerrar()
+            except Exception as e:
+                print(f"⚠️ Falha ao encerrar o exportador {type(exportador).__name__}: {e}")
+
+
+def criar_registro(exportadores=TELEMETRY_EXPORTERS):
+    """Registro com os exportadores pedidos (os indisponíveis são ignorados com aviso)"""
+    registro = RegistroTelemetria()
+    for nome in [nome.strip().lower() for nome in exportadores.split(",") if nome.strip()]:
+        try:
+            if nome == "json":
+                registro.adicionar_exportador(ExportadorJSON())
+            elif nome == "prometheus":
+                registro.adicionar_exportador(ExportadorPrometheus(registro))
+            elif nome == "otel":
+                registro.adicionar_exportador(ExportadorOTel())
+            else:
+                print(f"⚠️ Exportador de telemetria desconhecido: {nome}")
+        except ImportError:
+            print("⚠️ opentelemetry não instalado: exportador otel desativado")
+        except Exception as e:
+            print(f"⚠️ Exportador de telemetria '{nome}' indisponível: {e}")
+    if registro.exportadores:
+        atexit.register(registro.encerrar)
+    return registro
+
+registro = criar_registro()
+
+def exportando():
+    """Há exportadores configurados (atributos caros só são calculados nesse caso)"""
+    return bool(registro.exportadores)
+
+
+@contextmanager
+def span(nome, **atributos):
+    """Cronometra o bloco como uma fase, filha do span corrente (se houver)"""
+    atual = Span(nome, atributos, _span_atual.get())
+    token = _span_atual.set(atual)
+    registro.iniciar(atual)
+    inicio = time.perf_counter()
+    try:
+        yield atual
+    except BaseException as e:
+        # GeneratorExit: o consumidor parou de ler (não é falha da fase)
+        if not isinstance(e, GeneratorExit):
+            atual.erro = type(e).__name__
+        raise
+    finally:
+        atual.duracao = time.perf_counter() - inicio
+        try:
+            _span_atual.reset(token)
+        except ValueError:
+            # Gerador retomado em outro contexto: só desfaz o vínculo
+            _span_atual.set(None)
+        registro.registrar(atual)
+
+def definir_atributos(**atributos):
+    """Acrescenta atributos ao span corrente (sem span aberto, não faz nada)"""
+    atual = _span_atual.get()
+    if atual is not None:
+        atual.definir(**atributos)
+
+def resumo_percentis():
+    """Linhas do comando 'status': percentis móveis por fase"""
+    percentis = registro.percentis()
+    if not percentis:
+        return ["⏱️ Telemetria: nenhuma fase registrada ainda"]
+    linhas = [f"⏱️ Latência por fase (últimas {registro.janela} amostras, ms):",
+              f"   {'fase':<34}{'n':>6}{'p50':>10}{'p95':>10}{'p99':>10}"]
+    for nome, valores in sorted(percentis.items()):
+        linhas.append(f"   {nome:<34}{valores['n']:>6}{valores['p50']:>10.1f}"
+                      f"{valores['p95']:>10.1f}{valores['p99']:>10.1f}")
+    eventos = registro.eventos()
+    if eventos:
+        linhas.append("   eventos: " + ", ".join(
+            f"{nome}.{evento}={total}" for (nome, evento), total in sorted(eventos.items())
+        ))
+    return linhas
@@ -0,0 +1,7 @@
+import os
+
+# Os testes rodam offline: provedores locais e nenhum cache em disco compartilhado
+os.environ.setdefault("DEFAULT_EMBEDDING_MODEL", "local")
+os.environ.setdefault("DEFAULT_LLM_MODEL", "local")
+os.environ.setdefault("EMBEDDING_CACHE_ENABLED", "false")
+os.environ.setdefault("SEMANTIC_CACHE_ENABLED", "false")
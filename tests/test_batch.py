@@ -0,0 +1,30 @@
+import io
+import json
+
+from batch import EscritorOrdenado
+
+
+def linhas(saida):
+    return [json.loads(linha)["id"] for linha in saida.getvalue().splitlines()]
+
+
+def test_grava_na_ordem_de_entrada():
+    saida = io.StringIO()
+    escritor = EscritorOrdenado(saida)
+
+    escritor.adicionar(2, {"id": "q3"})
+    assert linhas(saida) == []
+
+    escritor.adicionar(0, {"id": "q1"})
+    assert linhas(saida) == ["q1"]
+
+    escritor.adicionar(1, {"id": "q2"})
+    assert linhas(saida) == ["q1", "q2", "q3"]
+    assert escritor.pendentes == {}
+
+def test_acentos_gravados_sem_escape():
+    saida = io.StringIO()
+
+    EscritorOrdenado(saida).adicionar(0, {"id": "q1", "resposta": "Fundação"})
+
+    assert "Fundação" in saida.getvalue()
@@ -0,0 +1,51 @@
+import random
+
+import pytest
+
+from search import fundir_rrf, limpar_texto
+from bench_limpeza import limpar_texto_legado, gerar_chunk, verificar_equivalencia
+
+
+def test_fundir_rrf_soma_as_duas_fases():
+    fundidos = fundir_rrf(["a", "b", "c"], ["c", "d"], k=60)
+    scores = {chunk_id: score for chunk_id, score, _, _ in fundidos}
+
+    assert scores["c"] == pytest.approx(1 / 63 + 1 / 61)
+    assert scores["a"] == pytest.approx(1 / 61)
+    assert scores["d"] == pytest.approx(1 / 62)
+    assert [chunk_id for chunk_id, _, _, _ in fundidos] == ["c", "a", "b", "d"]
+
+def test_fundir_rrf_guarda_os_ranks_de_cada_fase():
+    fundidos = {linha[0]: linha[2:] for linha in fundir_rrf(["a", "b"], ["b"], k=60)}
+
+    assert fundidos["a"] == (1, None)
+    assert fundidos["b"] == (2, 1)
+
+def test_fundir_rrf_id_repetido_vale_a_primeira_posicao():
+    fundidos = fundir_rrf(["a", "b", "a"], [], k=60)
+
+    assert len(fundidos) == 2
+    assert fundidos[0][:3] == ("a", pytest.approx(1 / 61), 1)
+
+def test_fundir_rrf_sem_candidatos():
+    assert fundir_rrf([], []) == []
+
+
+@pytest.mark.parametrize("texto", [
+    "",
+    "Qual a empresa com maior faturamento?",
+    "texto\x00com\x07controle\ttab\r\nlinha",
+    "acentos decompostos: Sau\u0301de Educac\u0327a\u0303o",
+    "surrogate \ud800, zero-width\u200b e soft\u00adhyphen",
+    "bytes: Fundação Saúde".encode("utf-8"),
+    b"bytes inv\xe1lidos",
+])
+def test_limpar_texto_igual_a_implementacao_anterior(texto):
+    assert limpar_texto(texto) == limpar_texto_legado(texto)
+
+def test_limpar_texto_igual_em_chunks_sinteticos():
+    aleatorio = random.Random(0)
+    verificar_equivalencia(aleatorio)
+    for _ in range(20):
+        chunk = gerar_chunk(aleatorio)
+        assert limpar_texto(chunk) == limpar_texto_legado(chunk)
@@ -0,0 +1,63 @@
+import itertools
+
+import pytest
+
+import cache
+from cache import SQLiteEmbeddingStore, ResponseCacheBackend
+
+BYTES_POR_VETOR = 16 * 4
+
+
+def vetor(valor):
+    return [float(valor)] * 16
+
+def bytes_gravados(store):
+    return store._conn.execute("SELECT COALESCE(SUM(LENGTH(vetor)), 0) FROM embeddings").fetchone()[0]
+
+@pytest.fixture
+def relogio(monkeypatch):
+    # Cada gravação/leitura em um instante distinto: a ordem de acesso fica determinística
+    instantes = itertools.count(1000.0)
+    monkeypatch.setattr(cache.time, "time", lambda: next(instantes))
+
+@pytest.fixture
+def store(tmp_path, relogio):
+    store = SQLiteEmbeddingStore(str(tmp_path / "embeddings.sqlite"), max_mb=1)
+    yield store
+    store.close()
+
+
+def test_total_acompanha_sobrescritas(store):
+    store.put_many([("a", vetor(1)), ("b", vetor(2))])
+    store.put_many([("a", vetor(3)), ("c", vetor(4))])
+    store.put_many([("c", vetor(5)), ("c", vetor(6))])
+
+    assert store.tamanho_bytes() == bytes_gravados(store) == 3 * BYTES_POR_VETOR
+    assert store.get_many(["a", "c"]) == {"a": vetor(3), "c": vetor(6)}
+
+def test_total_sobrevive_a_reabertura(tmp_path, relogio):
+    caminho = str(tmp_path / "embeddings.sqlite")
+    store = SQLiteEmbeddingStore(caminho)
+    store.put_many([("a", vetor(1)), ("a", vetor(2))])
+    store.close()
+
+    reaberto = SQLiteEmbeddingStore(caminho)
+    assert reaberto.tamanho_bytes() == BYTES_POR_VETOR
+    reaberto.close()
+
+def test_despejo_remove_os_acessados_ha_mais_tempo(store):
+    store.max_bytes = 600 * BYTES_POR_VETOR
+    for numero in range(600):
+        store.put_many([(f"k{numero}", vetor(numero))])
+    store.get_many(["k0"])
+
+    store.put_many([("k600", vetor(600))])
+
+    # Despejo em lotes de 256 até voltar a 90% do limite; k0 foi lido há pouco
+    restantes = {chave for (chave,) in store._conn.execute("SELECT chave FROM embeddings")}
+    assert restantes == {"k0"} | {f"k{numero}" for numero in range(257, 601)}
+    assert store.tamanho_bytes() == bytes_gravados(store) == 345 * BYTES_POR_VETOR
+
+def test_backend_de_respostas_e_abstrato():
+    with pytest.raises(TypeError):
+        ResponseCacheBackend()
@@ -0,0 +1,64 @@
+import numpy as np
+from langchain_core.documents import Document
+
+from contexto import montar_contexto, contar_tokens
+from provedores_locais import HashingEmbeddings
+
+
+def documentos(textos):
+    return [
+        Document(page_content=texto, metadata={"id": f"c{posicao}", "score": 1.0 / (posicao + 1)})
+        for posicao, texto in enumerate(textos)
+    ]
+
+def vetores_de(docs):
+    embeddings = HashingEmbeddings()
+    vetores = embeddings.embed_documents([doc.page_content for doc in docs])
+    return {doc.metadata["id"]: np.asarray(vetor, dtype=np.float32) for doc, vetor in zip(docs, vetores)}
+
+
+TEXTOS = [
+    "Alfa Energia S.A. R$ 1.500.000,00 1985",
+    "Beta Saúde LTDA R$ 820.000,00 1990",
+    "Lunar Logística Holding R$ 3.200.000,00 2001",
+    "Brava Varejo ME R$ 45.000,00 2015",
+]
+
+
+def test_contexto_respeita_o_orcamento():
+    docs = documentos(TEXTOS)
+    orcamento = sum(contar_tokens(texto) for texto in TEXTOS[:2]) + contar_tokens("\n\n")
+
+    contexto, relatorio = montar_contexto(docs, orcamento=orcamento)
+
+    assert contexto == "\n\n".join(TEXTOS[:2])
+    # Cada chunk é contado separadamente, mais o separador entre eles
+    assert relatorio["tokens_mantidos"] == relatorio["orcamento"] == orcamento
+    assert relatorio["chunks_mantidos"] == 2
+    assert relatorio["chunks_descartados"] == 2
+    assert relatorio["tokens_descartados"] == sum(contar_tokens(texto) for texto in TEXTOS[2:])
+
+def test_chunk_grande_nao_impede_os_menores():
+    textos = ["palavra " * 500] + TEXTOS
+    docs = documentos(textos)
+
+    contexto, relatorio = montar_contexto(docs, orcamento=100)
+
+    assert contexto == "\n\n".join(TEXTOS)
+    assert relatorio["chunks_descartados"] == 1
+
+def test_mmr_descarta_chunk_repetido():
+    docs = documentos([TEXTOS[0], TEXTOS[0], TEXTOS[1]])
+
+    contexto, relatorio = montar_contexto(docs, orcamento=1000, vetores=vetores_de(docs))
+
+    assert contexto == "\n\n".join([TEXTOS[0], TEXTOS[1]])
+    assert relatorio["chunks_redundantes"] == 1
+    assert relatorio["chunks_descartados"] == 1
+
+def test_sem_vetores_mantem_a_ordem_de_relevancia():
+    docs = documentos(TEXTOS)[::-1]
+
+    contexto, _ = montar_contexto(docs, orcamento=1000)
+
+    assert contexto == "\n\n".join(TEXTOS)
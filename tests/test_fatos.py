@@ -0,0 +1,53 @@
+import pytest
+
+from fatos import classificar_pergunta, padrao_like
+
+
+@pytest.mark.parametrize("pergunta, consulta", [
+    ("Qual a empresa com maior faturamento?",
+     {'tipo': 'ranking', 'campo': 'faturamento', 'ordem': 'desc', 'n': 1}),
+    ("Quais as 5 empresas com menor faturamento?",
+     {'tipo': 'ranking', 'campo': 'faturamento', 'ordem': 'asc', 'n': 5}),
+    ("Quais as top três empresas com maior faturamento?",
+     {'tipo': 'ranking', 'campo': 'faturamento', 'ordem': 'desc', 'n': 3}),
+    ("Quais as empresas mais recentes?",
+     {'tipo': 'ranking', 'campo': 'ano_fundacao', 'ordem': 'desc', 'n': 10}),
+    ("Qual a empresa mais antiga?",
+     {'tipo': 'ranking', 'campo': 'ano_fundacao', 'ordem': 'asc', 'n': 1}),
+])
+def test_ranking(pergunta, consulta):
+    assert classificar_pergunta(pergunta) == consulta
+
+@pytest.mark.parametrize("pergunta, posicao", [
+    ("Qual a segunda maior empresa em faturamento?", 2),
+    ("Qual é a 3a empresa com maior faturamento?", 3),
+    ("Qual a décima empresa com menor faturamento?", 10),
+])
+def test_ranking_ordinal_pede_ate_a_posicao(pergunta, posicao):
+    consulta = classificar_pergunta(pergunta)
+
+    assert consulta['n'] == posicao
+    assert consulta['posicao'] == posicao
+
+@pytest.mark.parametrize("pergunta, consulta", [
+    ("Quantas empresas foram fundadas em 1940?", {'tipo': 'contagem', 'ano': 1940, 'operador': '='}),
+    ("Quantas empresas foram fundadas antes de 1950?", {'tipo': 'contagem', 'ano': 1950, 'operador': '<'}),
+    ("Quantas empresas foram fundadas após 2000?", {'tipo': 'contagem', 'ano': 2000, 'operador': '>'}),
+    ("Quantas empresas têm 'Alfa' no nome?", {'tipo': 'contagem', 'termo': 'alfa'}),
+    ("Quantas empresas tem Holding no nome?", {'tipo': 'contagem', 'termo': 'holding'}),
+])
+def test_contagem(pergunta, consulta):
+    assert classificar_pergunta(pergunta) == consulta
+
+@pytest.mark.parametrize("pergunta", [
+    "Qual a empresa com maior faturamento acima de 1 milhão?",
+    "Qual a maior empresa em faturamento fundada em 1990?",
+    "Qual empresa tem maior faturamento entre as mais antigas?",
+    "Top três empresas por faturamento",
+    "Qual a capital da França?",
+])
+def test_perguntas_fora_do_caminho_rapido(pergunta):
+    assert classificar_pergunta(pergunta) is None
+
+def test_padrao_like_escapa_curingas():
+    assert padrao_like("100%_a\\b") == "%100\\%\\_a\\\\b%"
@@ -0,0 +1,32 @@
+import pstats
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from perfilamento import Perfilador, envolver
+
+
+def trabalho_na_thread():
+    return sum(range(1000))
+
+
+@pytest.fixture
+def perfilador(tmp_path):
+    ativo = tracemalloc.is_tracing()
+    yield Perfilador(str(tmp_path))
+    if not ativo:
+        tracemalloc.stop()
+
+
+def test_envolver_sem_pergunta_ativa_devolve_a_funcao():
+    assert envolver(trabalho_na_thread) is trabalho_na_thread
+
+def test_trabalho_em_outra_thread_entra_no_perfil(perfilador):
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        with perfilador.pergunta("Qual a empresa com maior faturamento?"):
+            assert executor.submit(envolver(trabalho_na_thread)).result() == 499500
+
+    pergunta, = perfilador.perguntas
+    funcoes = {funcao for _arquivo, _linha, funcao in pstats.Stats(pergunta["arquivo"]).stats}
+    assert "trabalho_na_thread" in funcoes